@@ -1,34 +1,9 @@
-import re
-from pathlib import Path
-from datetime import datetime
+from domain_emitter import emit_rules
 
 def generate_adclose_rules():
     """生成Adclose规则（基于根目录adblock.txt）"""
-    input_path = Path("./adblock.txt")
-    output_path = Path("./AdClose.rule")  # 更改输出文件名为AdClose.rule
-    
-    if not input_path.exists():
-        raise FileNotFoundError(f"源文件不存在: {input_path}")
-    
-    # 匹配Adblock中的域名规则（||domain.com^）
-    domain_pattern = re.compile(r'^\|\|([a-zA-Z0-9.-]+)\^.*$', re.MULTILINE)
-    
-    with input_path.open('r', encoding='utf-8', errors='ignore') as f:
-        content = f.read()
-    
-    # 提取并去重域名
-    domains = set(domain_pattern.findall(content))
-    total = len(domains)
-    
-    # 写入规则，采用domain, 前缀格式
-    with output_path.open('w', encoding='utf-8') as f:
-        f.write(f"# Adclose规则 - 自动生成\n")
-        f.write(f"# 更新时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"# 规则总数: {total}\n\n")
-        for domain in sorted(domains):
-            f.write(f"domain, {domain}\n")  # 改为指定的格式
-    
-    print(f"Adclose规则生成完成，输出到 {output_path}，共 {total} 条")
+    # 解析、排序与写入统一由domain_emitter完成，这里只输出单一格式
+    return emit_rules(formats=["adclose"])
 
 if __name__ == "__main__":
-    generate_adclose_rules()
\ No newline at end of file
+    generate_adclose_rules()
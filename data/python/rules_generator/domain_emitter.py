@@ -0,0 +1,187 @@
+import re
+import sys
+from pathlib import Path
+from datetime import datetime
+from contextlib import ExitStack
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "utils"))
+import rule_ir
+import srs
+import metrics
+from domain_trie import PRUNE_SUBDOMAINS
+from extsort import make_sorter
+from common import REVERSE_ORDER, from_order_key, open_output, order_key, stamp_line
+
+# 匹配Adblock中的域名规则（||domain.com^）
+DOMAIN_PATTERN = re.compile(r'^\|\|([a-zA-Z0-9.-]+)\^.*$')
+VALID_DOMAIN = re.compile(r'[a-zA-Z0-9.-]+')
+# merge.py生成的二进制中间格式
+IR_PATH = Path("./tmp/adblock.ir")
+SORT_DIR = Path("./tmp/sort")
+
+# 输出格式注册表（新增格式只需在此追加一项，无需再次解析和排序）
+# 键: 格式名, 值: 输出文件、标题、列表前缀、单条规则模板，以及是否按后缀匹配
+# 二进制/结构化格式用 writer 代替 line，收集完整域名列表后一次写出；optional 格式默认不输出
+FORMATS: Dict[str, Dict] = {
+    "adclose": {
+        "path": "AdClose.rule",
+        "title": "Adclose规则",
+        "line": "domain, {}\n",
+    },
+    "clash": {
+        "path": "Clash.yaml",
+        "title": "Clash规则",
+        "preamble": "payload:\n",
+        "line": "  - '{}'\n",
+    },
+    "hosts": {
+        "path": "hosts.txt",
+        "title": "Hosts规则",
+        "line": "0.0.0.0 {}\n",
+    },
+    "invizible": {
+        "path": "invizible.txt",
+        "title": "Invizible规则",
+        "line": "{} block\n",
+    },
+    "shadowrocket": {
+        "path": "Shadowrocket.conf",
+        "title": "Shadowrocket规则",
+        "line": "DOMAIN-SUFFIX,{},Reject\n",
+        "suffix": True,  # 后缀匹配格式：跳过已被上级域名覆盖的子域名
+    },
+    "singbox": {
+        "path": "Singbox.srs",
+        "title": "Singbox规则",
+        # sing-box二进制规则集：||domain^ 即 domain_suffix（域名本身及子域名）。
+        # .srs 中 domain 与 domain_suffix 同属一个域名规则项，domain_suffix 已包含域名本身的键，
+        # Adblock规则没有只匹配域名本身的写法，因此不再单独输出 domain
+        "writer": srs.write_srs,
+        "suffix": True,
+    },
+    "singbox_json": {
+        "path": "Singbox.json",
+        "title": "Singbox源规则集",
+        "writer": srs.write_source,
+        "suffix": True,
+        "optional": True,
+    },
+}
+
+def load_domains(input_path: Path, ir_path: Path = IR_PATH, exact: bool = True):
+    """
+    返回去重并排序后的域名排序键序列（common.from_order_key 还原为域名），
+    以及已被上级域名覆盖的子域名集合
+
+    优先读取IR（包含merge.py裁剪掉的子域名），否则解析adblock.txt一次。
+    adblock.txt 中的子域名已被裁剪，exact为True（需要输出精确匹配格式）时无法从文本还原完整集合，直接报错
+
+    :param exact: 是否需要完整的域名集合
+    """
+    if not input_path.exists():
+        raise FileNotFoundError(f"源文件不存在: {input_path}")
+
+    ruleset = rule_ir.load_fresh(ir_path, input_path)
+    if ruleset is not None:
+        domains, redundant = [], set()
+        with ruleset:
+            for domain, flags in ruleset.domain_flags():
+                if VALID_DOMAIN.fullmatch(domain):
+                    domains.append(domain)
+                    if flags & rule_ir.FLAG_REDUNDANT:
+                        redundant.add(domain)
+        if REVERSE_ORDER:
+            domains = sorted(map(order_key, domains))
+        return domains, redundant
+
+    if exact and PRUNE_SUBDOMAINS:
+        raise RuntimeError(f"{ir_path} 不存在或与 {input_path} 不一致，精确匹配格式需要完整的域名集合，请先运行 merge.py")
+    domains = make_sorter(SORT_DIR)
+    with input_path.open('r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            match = DOMAIN_PATTERN.match(line)
+            if match:
+                domains.add(order_key(match.group(1)))
+    return domains, set()
+
+def emit_rules(
+    input_path: Path = Path("./adblock.txt"),
+    root_dir: Path = Path("./"),
+    formats: Optional[List[str]] = None,
+    stats: Optional[metrics.StageMetrics] = None
+) -> int:
+    """
+    单次解析、单次排序，在同一轮遍历中输出所有格式
+
+    :param input_path: Adblock规则文件路径
+    :param root_dir: 输出目录（根目录）
+    :param formats: 需要输出的格式名，默认输出全部
+    :param stats: 构建指标记录（可选）
+    :return: 域名总数
+    """
+    selected = formats or [name for name, spec in FORMATS.items() if not spec.get("optional")]
+    unknown = [name for name in selected if name not in FORMATS]
+    if unknown:
+        raise ValueError(f"未知的输出格式: {', '.join(unknown)}")
+
+    domains, redundant = load_domains(input_path, exact=not all(FORMATS[name].get("suffix") for name in selected))
+    total = len(domains)
+    totals = {name: total - len(redundant) if FORMATS[name].get("suffix") else total
+              for name in selected}
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    outputs = []
+    writers = [FORMATS[name] for name in selected if "writer" in FORMATS[name]]
+    suffix_domains = [] if writers else None
+    try:
+        with ExitStack() as stack:
+            for name in selected:
+                spec = FORMATS[name]
+                if "writer" in spec:
+                    continue
+                f = stack.enter_context(open_output(root_dir / spec["path"]))
+                outputs.append((f, spec["line"].format, spec.get("suffix", False)))
+                f.write(f"# {spec['title']} - 自动生成\n")
+                f.write(stamp_line(f"# 更新时间: {timestamp}\n"))
+                f.write(f"# 规则总数: {totals[name]}\n\n")
+                f.write(spec.get("preamble", ""))
+
+            # 共享同一份排序结果，逐个域名写入所有格式
+            for key in domains:
+                domain = from_order_key(key)
+                covered = domain in redundant
+                for f, render, suffix in outputs:
+                    if not (suffix and covered):
+                        f.write(render(domain))
+                if suffix_domains is not None and not covered:
+                    suffix_domains.append(domain)
+    finally:
+        if hasattr(domains, "close"):
+            domains.close()  # 外部排序模式下清理临时分段
+
+    for spec in writers:
+        spec["writer"](root_dir / spec["path"], domain_suffix=suffix_domains)
+
+    if stats is not None:
+        # 后缀匹配格式跳过已被上级域名覆盖的子域名，精确匹配格式保留全部
+        stats.add_in(total)
+        stats.keep(total)
+        stats.set("redundant_skipped_by_suffix_formats", len(redundant))
+        stats.set("formats", {name: totals[name] for name in selected})
+
+    for name in selected:
+        spec = FORMATS[name]
+        print(f"{spec['title']}生成完成，输出到 {root_dir / spec['path']}，共 {totals[name]} 条")
+    return total
+
+def main(formats: Optional[List[str]] = None):
+    try:
+        with metrics.stage("domain_emitter") as stats:
+            emit_rules(formats=formats, stats=stats)
+    except Exception as e:
+        print(f"::error::规则生成失败: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or None)
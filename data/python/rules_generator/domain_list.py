@@ -1,50 +1,80 @@
 import re
+import time
 from pathlib import Path
 import sys
 
-def extract_domains(input_path: Path, output_path: Path) -> None:
-    """从dns.txt提取域名并生成纯域名列表"""
-    if not input_path.exists():
-        raise FileNotFoundError(f"输入文件不存在: {input_path}")
-    
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "utils"))
+import rule_ir
+from extsort import make_sorter
+from domain_trie import PRUNE_SUBDOMAINS
+from common import from_order_key, open_output, order_key, stamp_line
+
+def normalize_domain(domain: str):
+    """去除路径、端口并转为小写，无效域名返回None"""
+    domain = domain.lower()
+    # 移除可能的路径和参数
+    if '/' in domain:
+        domain = domain.split('/')[0]
+    # 移除端口号
+    if ':' in domain:
+        domain = domain.split(':')[0]
+    # 过滤无效域名
+    if '.' in domain and not domain.startswith(('.', '*')):
+        return domain
+    return None
+
+def iter_dns_domains(input_path: Path, ir_path: Path, adblock_path: Path):
+    """
+    纯域名列表通常按精确匹配使用，需要完整的域名集合：从IR读取（包含dns.txt中已裁剪的子域名）
+
+    IR不可用且未关闭子域名裁剪时报错（dns.txt中的子域名已被裁剪，无法还原）
+    """
+    ruleset = rule_ir.load_fresh(ir_path, adblock_path)
+    if ruleset is not None:
+        with ruleset:
+            yield from ruleset.domains(plain=True)
+        return
+    if PRUNE_SUBDOMAINS:
+        raise RuntimeError(f"{ir_path} 不存在或与 {adblock_path} 不一致，请先运行 merge.py")
+
     # 提取域名的正则模式（适配AdBlock规则）
     pattern = re.compile(r'^(\|\||\|http(s)?:\/\/)([^*^|~#]+)')
-    domains = set()
-    
     with open(input_path, 'r', encoding='utf-8') as f:
         for line in f:
             line = line.strip()
             # 跳过注释和空行
             if not line or line.startswith(('!', '#', '@@')):
                 continue
-                
             match = pattern.match(line.split('$')[0])
             if match:
-                domain = match.group(3).lower()
-                # 移除可能的路径和参数
-                if '/' in domain:
-                    domain = domain.split('/')[0]
-                # 移除端口号
-                if ':' in domain:
-                    domain = domain.split(':')[0]
-                # 过滤无效域名
-                if '.' in domain and not domain.startswith(('.', '*')):
-                    domains.add(domain)
+                yield match.group(3)
+
+def extract_domains(input_path: Path, output_path: Path, ir_path: Path = None, adblock_path: Path = None) -> None:
+    """从IR（或dns.txt）提取域名并生成纯域名列表（完整集合，含已被上级域名覆盖的子域名）"""
+    if not input_path.exists():
+        raise FileNotFoundError(f"输入文件不存在: {input_path}")
+    ir_path = ir_path or output_path.parent / "tmp" / "adblock.ir"
+    adblock_path = adblock_path or output_path.parent / "adblock.txt"
+
+    domains = make_sorter(output_path.parent / "tmp" / "sort")
+    for domain in iter_dns_domains(input_path, ir_path, adblock_path):
+        domain = normalize_domain(domain)
+        if domain:
+            domains.add(order_key(domain))
     
     # 排序并写入输出文件
-    with open(output_path, 'w', encoding='utf-8') as f:
+    with domains, open_output(output_path) as f:
+        total = len(domains)
         f.write("# EasyAds 纯域名列表\n")
-        f.write(f"# 生成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}（北京时间）\n")
-        f.write(f"# 共 {len(domains)} 个域名\n\n")
-        for domain in sorted(domains):
-            f.write(f"{domain}\n")
+        f.write(stamp_line(f"# 生成时间: {time.strftime('%Y-%m-%d %H:%M:%S')}（北京时间）\n"))
+        f.write(f"# 共 {total} 个域名\n\n")
+        for key in domains:
+            f.write(f"{from_order_key(key)}\n")
     
-    print(f"已提取 {len(domains)} 个域名到 {output_path}")
+    print(f"已提取 {total} 个域名到 {output_path}")
 
-if __name__ == "__main__":
+def main():
     try:
-        import time
-        
         # 修正路径计算：从rules_generator目录定位到项目根目录
         # 当前脚本路径: data/python/rules_generator/domain_list.py
         script_path = Path(__file__).resolve()  # 绝对路径
@@ -67,3 +97,6 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"::error::处理失败: {str(e)}")
         sys.exit(1)
+
+if __name__ == "__main__":
+    main()
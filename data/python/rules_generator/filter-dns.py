@@ -1,8 +1,17 @@
 import os
+import sys
 from pathlib import Path
 import datetime
 
-def filter_adblock_rules(input_path, output_path):
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "utils"))
+import rule_ir
+import metrics
+from common import REVERSE_ORDER, open_output, sort_domains, stamp_line
+
+# merge.py生成的二进制中间格式
+IR_PATH = Path("./tmp/adblock.ir")
+
+def filter_adblock_rules(input_path, output_path, stats=None):
     """Filter AdBlock rules and write DNS rules format"""
     input_path = Path(input_path)
     output_path = Path(output_path)
@@ -12,25 +21,45 @@ def filter_adblock_rules(input_path, output_path):
     
     try:
         with input_path.open('r', encoding='utf-8') as infile, \
-             output_path.open('w', encoding='utf-8') as outfile:
+             open_output(output_path) as outfile:
             
             # Write header
             outfile.write(f"# DNS rules extracted from {input_path.name}\n")
-            outfile.write(f"# Generated on {datetime.datetime.now()}\n\n")
+            outfile.write(stamp_line(f"# Generated on {datetime.datetime.now()}\n"))
+            outfile.write("\n")
             
             count = 0
-            for line in infile:
-                line = line.strip()
-                if line.startswith("||") and line.endswith("^"):
-                    outfile.write(line + '\n')
-                    count += 1
+            ruleset = rule_ir.load_fresh(IR_PATH, input_path)
+            if ruleset is not None:
+                # IR已按域名排序去重，直接取不带修饰符的拦截规则（跳过已被上级覆盖的子域名）
+                with ruleset:
+                    total = len(ruleset)
+                    domains = ruleset.domains(plain=True, redundant=False)
+                    if REVERSE_ORDER:
+                        domains = sort_domains(domains)
+                    for domain in domains:
+                        outfile.write(f"||{domain}^\n")
+                        count += 1
+            else:
+                total = 0
+                for line in infile:
+                    total += 1
+                    line = line.strip()
+                    if line.startswith("||") and line.endswith("^"):
+                        outfile.write(line + '\n')
+                        count += 1
+
+            if stats is not None:
+                stats.add_in(total)
+                stats.keep(count)
+                stats.drop("not_dns", total - count)
             
             print(f"Processed {count} DNS rules")
             
     except IOError as e:
         print(f"Error processing files: {e}")
 
-if __name__ == "__main__":
+def main():
     # 输入输出路径改为根目录
     input_file = Path("./adblock.txt")  # 根目录的adblock.txt
     output_file = Path("./dns.txt")     # 输出到根目录
@@ -38,4 +67,8 @@ if __name__ == "__main__":
     # 确保输出目录存在（根目录已存在）
     output_file.parent.mkdir(parents=True, exist_ok=True)
     
-    filter_adblock_rules(input_file, output_file)
\ No newline at end of file
+    with metrics.stage("filter-dns") as stats:
+        filter_adblock_rules(input_file, output_file, stats)
+
+if __name__ == "__main__":
+    main()
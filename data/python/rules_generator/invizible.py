@@ -1,32 +1,9 @@
-import re
-from pathlib import Path
-from datetime import datetime
+from domain_emitter import emit_rules
 
 def generate_invizible_rules():
     """生成Invizible规则（基于域名拦截）"""
-    input_path = Path("./adblock.txt")
-    output_path = Path("./invizible.txt")
-    
-    if not input_path.exists():
-        raise FileNotFoundError(f"源文件不存在: {input_path}")
-    
-    # Invizible支持的规则格式：域名 + 拦截类型
-    domain_pattern = re.compile(r'^\|\|([a-zA-Z0-9.-]+)\^.*$', re.MULTILINE)
-    
-    with input_path.open('r', encoding='utf-8', errors='ignore') as f:
-        content = f.read()
-    
-    domains = set(domain_pattern.findall(content))
-    total = len(domains)
-    
-    with output_path.open('w', encoding='utf-8') as f:
-        f.write(f"# Invizible规则 - 自动生成\n")
-        f.write(f"# 更新时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"# 规则总数: {total}\n\n")
-        for domain in sorted(domains):
-            f.write(f"{domain} block\n")  # Invizible的block指令
-    
-    print(f"Invizible规则生成完成，输出到 {output_path}，共 {total} 条")
+    # 解析、排序与写入统一由domain_emitter完成，这里只输出单一格式
+    return emit_rules(formats=["invizible"])
 
 if __name__ == "__main__":
-    generate_invizible_rules()
\ No newline at end of file
+    generate_invizible_rules()
@@ -1,14 +1,22 @@
 import os
 import re
+import sys
 from pathlib import Path
 from datetime import datetime
 import pytz
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "utils"))
+from common import open_output, sort_domains, stamp_line
+
 def get_beijing_time():
     """获取北京时间 (UTC+8)"""
     tz = pytz.timezone('Asia/Shanghai')
     return datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S")
 
+def rule_domain(rule: str) -> str:
+    """DOMAIN,example.com,REJECT -> example.com"""
+    return rule.split(',', 2)[1]
+
 def extract_to_loon_rules(input_file, output_file):
     """转换规则为Loon格式"""
     input_path = Path(input_file)
@@ -50,18 +58,18 @@ def extract_to_loon_rules(input_file, output_file):
         keyword_count = len(set(keyword_rules))
         total_count = ip_count + domain_count + suffix_count + keyword_count
 
-        with output_path.open('w', encoding='utf-8') as outfile:
+        with open_output(output_path) as outfile:
             outfile.write("# Loon规则由GOODBYEADS生成\n")
-            outfile.write(f"# 更新时间(北京时间): {beijing_time}\n")
+            outfile.write(stamp_line(f"# 更新时间(北京时间): {beijing_time}\n"))
             outfile.write(f"# 规则统计: 总计{total_count}条 (IP:{ip_count} DOMAIN:{domain_count} "
                          f"SUFFIX:{suffix_count} KEYWORD:{keyword_count})\n\n")
             
             if ip_rules:
                 outfile.write("# IP规则\n" + "\n".join(sorted(set(ip_rules))) + "\n\n")
             if domain_rules:
-                outfile.write("# 域名规则\n" + "\n".join(sorted(set(domain_rules))) + "\n\n")
+                outfile.write("# 域名规则\n" + "\n".join(sort_domains(set(domain_rules), rule_domain)) + "\n\n")
             if suffix_rules:
-                outfile.write("# 域名后缀\n" + "\n".join(sorted(set(suffix_rules))) + "\n\n")
+                outfile.write("# 域名后缀\n" + "\n".join(sort_domains(set(suffix_rules), rule_domain)) + "\n\n")
             if keyword_rules:
                 outfile.write("# 关键词规则\n" + "\n".join(sorted(set(keyword_rules))) + "\n")
 
@@ -71,8 +79,11 @@ def extract_to_loon_rules(input_file, output_file):
         print(f"处理失败: {e}")
         raise
 
-if __name__ == "__main__":
+def main():
     # 路径改为根目录，输出文件名为loon.list
     input_file = Path("./dns.txt")               # 根目录的dns.txt
     output_file = Path("./loon.list")            # 输出到根目录，文件名修改为loon.list
-    extract_to_loon_rules(input_file, output_file)
\ No newline at end of file
+    extract_to_loon_rules(input_file, output_file)
+
+if __name__ == "__main__":
+    main()
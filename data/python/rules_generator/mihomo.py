@@ -1,12 +1,21 @@
 import sys
-import shutil
+import struct
 import tempfile
-import subprocess
-import urllib.request
-import gzip
 from pathlib import Path
 from datetime import datetime
+from typing import Set, Tuple
 import pytz
+import zstandard
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "utils"))
+import succinct
+from common import open_output
+
+# MRS文件格式（与mihomo convert-ruleset输出一致）
+MRS_MAGIC = b"MRS\x01"
+BEHAVIOR_DOMAIN = 0
+DOMAIN_SET_VERSION = 1
+ZSTD_LEVEL = 19
 
 # 日志函数（带北京时间）
 def log(msg: str):
@@ -52,78 +61,59 @@ def process_adguard_rules(input_path: Path, temp_path: Path) -> bool:
         error(f"处理AdGuard规则失败: {str(e)}")
         return False
 
-def download_mihomo_tool(tool_dir: Path) -> Path:
-    """下载并解压最新版mihomo转换工具"""
+def load_domain_rules(temp_path: Path) -> Tuple[Set[bytes], int]:
+    """
+    按mihomo文本规则集的规则读取域名，返回逆序键集合与有效规则数
+
+    +.example.com 同时匹配域名本身及其子域名，对应 moc.elpmaxe 与 moc.elpmaxe.+ 两个键
+    """
+    keys, count = set(), 0
+    with open(temp_path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            rule = line.strip()
+            if not rule or rule.startswith('#'):
+                continue
+            domain = rule.lower()
+            labels = domain.split('.')
+            # 与mihomo一致：末尾带点或中间出现空标签的域名无效
+            if domain.endswith('.') or '' in labels[1:]:
+                continue
+            count += 1
+            if labels[0] == '+':
+                keys.add(domain[2:][::-1].encode('utf-8'))
+            elif not labels[0]:
+                domain = '+' + domain  # .example.com 在mihomo中同样记为 +.example.com
+            keys.add(domain[::-1].encode('utf-8'))
+    return keys, count
+
+def write_mrs(temp_path: Path, output_path: Path) -> bool:
+    """直接构建简洁域名集合并写出zstd压缩的MRS文件（无需下载mihomo工具）"""
     try:
-        tool_dir.mkdir(parents=True, exist_ok=True)
-        
-        # 获取最新版本号
-        version_url = "https://github.com/MetaCubeX/mihomo/releases/latest/download/version.txt"
-        version_file = tool_dir / "version.txt"
-        log(f"获取mihomo最新版本: {version_url}")
-        urllib.request.urlretrieve(version_url, version_file)
-        
-        with open(version_file, 'r') as f:
-            version = f.read().strip()
-        
-        # 构建下载链接
-        tool_name = f"mihomo-linux-amd64-{version}"
-        tool_url = f"https://github.com/MetaCubeX/mihomo/releases/latest/download/{tool_name}.gz"
-        tool_gz_path = tool_dir / f"{tool_name}.gz"
-        
-        # 下载并解压
-        log(f"下载mihomo工具 v{version}: {tool_url}")
-        urllib.request.urlretrieve(tool_url, tool_gz_path)
-        
-        tool_path = tool_dir / tool_name
-        with gzip.open(tool_gz_path, 'rb') as f_in:
-            with open(tool_path, 'wb') as f_out:
-                shutil.copyfileobj(f_in, f_out)
-        
-        # 设置执行权限并清理临时文件
-        tool_path.chmod(0o755)
-        version_file.unlink(missing_ok=True)
-        tool_gz_path.unlink(missing_ok=True)
-        
-        log(f"mihomo工具已准备就绪: {tool_path.name}")
-        return tool_path
-    except Exception as e:
-        error(f"下载mihomo工具失败: {str(e)}")
-        return None
+        keys, count = load_domain_rules(temp_path)
+        if not count:
+            error("没有可写入MRS的有效域名")
+            return False
+
+        log(f"开始构建MRS域名集合: {count} 条规则")
+        domain_set = succinct.build(keys)
+        with open_output(output_path, 'wb') as f, \
+             zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(f) as writer:
+            writer.write(MRS_MAGIC)
+            writer.write(struct.pack(">BqQ", BEHAVIOR_DOMAIN, count, 0))  # 行为、规则数、扩展数据长度
+            writer.write(struct.pack(">B", DOMAIN_SET_VERSION))
+            for words in (domain_set.leaves, domain_set.label_bitmap):
+                writer.write(struct.pack(">q", len(words)))
+                writer.write(succinct.pack_words(words))
+            writer.write(struct.pack(">q", len(domain_set.labels)))
+            writer.write(domain_set.labels)
 
-def convert_to_mrs(temp_path: Path, output_path: Path, tool_path: Path) -> bool:
-    """使用mihomo工具将文本规则转换为MRS格式"""
-    try:
-        cmd = [
-            str(tool_path),
-            "convert-ruleset",
-            "domain",
-            "text",
-            str(temp_path),
-            str(output_path)
-        ]
-        
-        log(f"开始转换为MRS格式: {output_path.name}")
-        result = subprocess.run(
-            cmd,
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        
-        # 验证输出文件
         if output_path.exists() and output_path.stat().st_size > 0:
-            log(f"MRS转换成功，文件大小: {output_path.stat().st_size} bytes")
+            log(f"MRS生成成功，文件大小: {output_path.stat().st_size} bytes")
             return True
-        else:
-            error("转换后文件为空或不存在")
-            return False
-            
-    except subprocess.CalledProcessError as e:
-        error(f"转换命令执行失败: {e.stderr}")
+        error("生成后文件为空或不存在")
         return False
     except Exception as e:
-        error(f"MRS转换失败: {str(e)}")
+        error(f"MRS生成失败: {str(e)}")
         return False
 
 def main():
@@ -136,8 +126,7 @@ def main():
         config = {
             "input": project_root / "adblock-filtered.txt",  # 输入文件路径（根目录）
             "temp": Path(tempfile.gettempdir()) / "mihomo_temp.txt",  # 临时文件
-            "output": project_root / "adb.mrs",  # 输出文件路径（根目录）
-            "tool_dir": Path(tempfile.gettempdir()) / "mihomo_tools"  # 工具目录
+            "output": project_root / "adb.mrs"  # 输出文件路径（根目录）
         }
 
         # 路径验证日志
@@ -160,14 +149,8 @@ def main():
             error("规则预处理失败，终止流程")
             sys.exit(1)
 
-        # 下载工具
-        tool_path = download_mihomo_tool(config["tool_dir"])
-        if not tool_path or not tool_path.exists():
-            error("工具准备失败，终止流程")
-            sys.exit(1)
-
-        # 转换格式
-        if not convert_to_mrs(config["temp"], config["output"], tool_path):
+        # 生成MRS
+        if not write_mrs(config["temp"], config["output"]):
             error("MRS格式转换失败，终止流程")
             sys.exit(1)
 
@@ -176,9 +159,6 @@ def main():
             if config["temp"].exists():
                 config["temp"].unlink()
                 log(f"已清理临时文件: {config['temp']}")
-            if config["tool_dir"].exists():
-                shutil.rmtree(config["tool_dir"], ignore_errors=True)
-                log(f"已清理工具目录: {config['tool_dir']}")
         except Exception as e:
             error(f"临时文件清理警告: {str(e)}")  # 非致命错误
 
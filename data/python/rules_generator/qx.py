@@ -1,6 +1,36 @@
 import os
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "utils"))
+import rule_ir
+from domain_trie import PRUNE_SUBDOMAINS
+from common import REVERSE_ORDER, open_output, sort_domains
+
+# merge.py生成的二进制中间格式（包含dns.txt中已裁剪的子域名）
+IR_PATH = Path("./tmp/adblock.ir")
+ADBLOCK_PATH = Path("./adblock.txt")
+
+def iter_dns_rules(input_path: Path):
+    """
+    DOMAIN是精确匹配，需要完整的域名集合：从IR读取
+
+    IR不可用且未关闭子域名裁剪时报错（dns.txt中的子域名已被裁剪，无法还原）
+    """
+    ruleset = rule_ir.load_fresh(IR_PATH, ADBLOCK_PATH)
+    if ruleset is not None:
+        with ruleset:
+            domains = ruleset.domains(plain=True)
+            if REVERSE_ORDER:
+                domains = sort_domains(domains)
+            for domain in domains:
+                yield f"||{domain}^"
+        return
+    if PRUNE_SUBDOMAINS:
+        raise RuntimeError(f"{IR_PATH} 不存在或与 {ADBLOCK_PATH} 不一致，请先运行 merge.py")
+    with input_path.open('r', encoding='utf-8') as infile:
+        yield from infile
+
 def replace_content_in_file(input_file: str, output_file: str) -> int:
     """Convert DNS rules to Quantumult X format"""
     input_path = Path(input_file)
@@ -12,10 +42,9 @@ def replace_content_in_file(input_file: str, output_file: str) -> int:
     processed_count = 0
     
     try:
-        with input_path.open('r', encoding='utf-8') as infile, \
-             output_path.open('w', encoding='utf-8') as outfile:
+        with open_output(output_path) as outfile:
             
-            for line in infile:
+            for line in iter_dns_rules(input_path):
                 line = line.strip()
                 if not line or line.startswith('#'):
                     continue
@@ -66,7 +95,7 @@ def remove_whitelist_domains(input_file: str, whitelist_file: str) -> int:
         print(f"Error processing files: {e}")
         return 0
 
-if __name__ == "__main__":
+def main():
     # 路径改为根目录
     input_file = Path("./dns.txt")               # 根目录的dns.txt
     output_file = Path("./qx.list")              # 输出到根目录
@@ -78,4 +107,7 @@ if __name__ == "__main__":
     processed = replace_content_in_file(input_file, output_file)
     removed = remove_whitelist_domains(output_file, whitelist_file)
     
-    print(f"Processed {processed} rules, removed {removed} whitelisted domains")
\ No newline at end of file
+    print(f"Processed {processed} rules, removed {removed} whitelisted domains")
+
+if __name__ == "__main__":
+    main()
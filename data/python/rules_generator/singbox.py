@@ -1,31 +1,12 @@
-import re
-from pathlib import Path
-from datetime import datetime
+import sys
 
-def generate_singbox_rules():
-    """生成Singbox规则（domain: 域名, policy: reject）"""
-    input_path = Path("./adblock.txt")
-    output_path = Path("./Singbox.srs")  # 修改输出文件名为Singbox.srs
-    
-    if not input_path.exists():
-        raise FileNotFoundError(f"源文件不存在: {input_path}")
-    
-    domain_pattern = re.compile(r'^\|\|([a-zA-Z0-9.-]+)\^.*$', re.MULTILINE)
-    
-    with input_path.open('r', encoding='utf-8', errors='ignore') as f:
-        content = f.read()
-    
-    domains = set(domain_pattern.findall(content))
-    total = len(domains)
-    
-    with output_path.open('w', encoding='utf-8') as f:
-        f.write(f"# Singbox规则 - 自动生成\n")
-        f.write(f"# 更新时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"# 规则总数: {total}\n\n")
-        for domain in sorted(domains):
-            f.write(f"domain: {domain}, policy: reject\n")  # 保持Singbox标准格式
-    
-    print(f"Singbox规则生成完成，输出到 {output_path}，共 {total} 条")
+from domain_emitter import emit_rules
+
+def generate_singbox_rules(with_source: bool = False):
+    """生成Singbox二进制规则集（.srs），可选同时输出JSON源规则集"""
+    # 解析、排序与写入统一由domain_emitter完成，这里只输出单一格式
+    formats = ["singbox", "singbox_json"] if with_source else ["singbox"]
+    return emit_rules(formats=formats)
 
 if __name__ == "__main__":
-    generate_singbox_rules()
\ No newline at end of file
+    generate_singbox_rules(with_source="--json" in sys.argv[1:])
@@ -0,0 +1,292 @@
+# EasyAds/data/python/utils/benchmark.py
+"""规则处理性能基准：用确定性的合成规则语料分别测量各阶段
+
+用法：
+    python data/python/utils/benchmark.py                          默认规模 100k,1m
+    python data/python/utils/benchmark.py --sizes 10m --stages clean_rules,validate_file
+    python data/python/utils/benchmark.py --baseline old.json      与基线对比，超出容差时退出码为1
+
+语料按 (规模, 种子) 生成并缓存在 .cache/bench/，内容混合hosts、ABP、白名单、元素隐藏和无效行。
+每个阶段在独立子进程中运行，记录耗时、CPU时间和峰值RSS，结果写入JSON。
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import platform
+import resource
+import subprocess
+import contextlib
+from pathlib import Path
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+SCRIPT_DIR = Path(__file__).resolve().parent  # data/python/utils
+ROOT_DIR = SCRIPT_DIR.parent.parent.parent    # 项目根目录
+BENCH_DIR = ROOT_DIR / ".cache" / "bench"
+DEFAULT_OUTPUT = BENCH_DIR / "results.json"
+DEFAULT_SEED = 20240101
+DEFAULT_SIZES = ["100k", "1m"]
+TOLERANCE = 0.2  # 与基线对比时允许的耗时增幅
+
+SIZES = {"100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+TLDS = ["com", "net", "org", "cn", "io", "xyz", "top", "app", "cc", "com.cn"]
+WORDS = ["ad", "ads", "track", "log", "stat", "cdn", "img", "api", "push", "sdk",
+         "union", "analytics", "pixel", "beacon", "report", "m", "www", "static"]
+COSMETIC = ["##.ad-banner", "##.sponsor", "###ad_top", "##div[id^=\"ad\"]", "#@#.ad-slot"]
+JUNK = ["! Title: synthetic", "# comment", "", "   ", "[Adblock Plus 2.0]",
+        "<html>", "||^", "0.0.0.0", "@@", "||bad_domain^^", "127.0.0.1 localhost"]
+
+def log(message: str):
+    """带时间戳的日志输出"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] [BENCH] {message}", flush=True)
+
+# ---------------------------------------------------------------- 语料生成
+
+def _domain(rng: random.Random) -> str:
+    labels = [rng.choice(WORDS) + str(rng.randrange(1000)) for _ in range(rng.randint(1, 3))]
+    return ".".join(labels) + "." + rng.choice(TLDS)
+
+def generate_corpus(path: Path, lines: int, seed: int = DEFAULT_SEED) -> None:
+    """
+    生成确定性的合成语料
+
+    约 25% hosts、35% ABP拦截、10% 白名单、10% 元素隐藏、20% 注释和无效行；
+    域名从大小为行数1/4的域名池中按偏斜分布抽取，保证存在一定比例的重复
+    """
+    rng = random.Random(f"{seed}-{lines}")
+    pool = [_domain(rng) for _ in range(max(lines // 4, 1))]
+    pick = lambda: pool[int(len(pool) * rng.random() ** 2)]  # noqa: E731
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix(".tmp")
+    with open(temp_path, "w", encoding="utf-8", newline="\n") as f:
+        for _ in range(lines):
+            r = rng.random()
+            if r < 0.25:
+                ip = rng.choice(("0.0.0.0", "0.0.0.0", "127.0.0.1", "::"))
+                line = f"{ip} {pick()}"
+            elif r < 0.60:
+                domain = pick()
+                line = rng.choice((f"||{domain}^", f"||{domain}^", f"||{domain}^$important",
+                                   f"||{domain}^$third-party", f"|https://{domain}/ad.js",
+                                   f"/banner/{rng.randrange(100)}/*"))
+            elif r < 0.70:
+                domain = pick()
+                line = rng.choice((f"@@||{domain}^", f"@@||{domain}^$important", f"@@|https://{domain}/"))
+            elif r < 0.80:
+                selector = rng.choice(COSMETIC)
+                line = selector if rng.random() < 0.5 else pick() + selector
+            else:
+                line = rng.choice(JUNK)
+            f.write(line + "\n")
+    temp_path.replace(path)
+
+def corpus_path(size: str, seed: int) -> Path:
+    """返回（必要时生成）指定规模的语料文件"""
+    path = BENCH_DIR / f"corpus-{size}-{seed}.txt"
+    if not path.exists():
+        log(f"生成语料 {path.name}（{SIZES[size]} 行）")
+        generate_corpus(path, SIZES[size], seed)
+    return path
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def count_lines(path: Path) -> int:
+    with open(path, "rb") as f:
+        return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+
+def link_or_copy(src: Path, dst: Path) -> None:
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+# ---------------------------------------------------------------- 各阶段
+# 每个阶段接收 (语料路径, 工作目录)，返回输出行数；工作目录为当前目录
+
+def stage_process_rules(corpus: Path, workdir: Path) -> int:
+    import dl
+    dl.TMP_DIR = workdir / "tmp"
+    dl.SOURCE_SHARDS.dir = workdir / "shards"  # 每次都从头解析，不读写项目的分片缓存
+    link_or_copy(corpus, dl.TMP_DIR / "rules01.txt")
+    dl.process_rules()
+    return count_lines(dl.TMP_DIR / "tmp-rules.txt")
+
+def stage_clean_rules(corpus: Path, workdir: Path) -> int:
+    import merge
+    return sum(1 for _ in merge.clean_rules(merge.iter_lines([corpus]), merge.BLOCK_PATTERN))
+
+def stage_validate_file(corpus: Path, workdir: Path) -> int:
+    from validate_rules import RuleValidator
+    link_or_copy(corpus, workdir / "adblock.txt")
+    result = RuleValidator(root_dir=workdir).validate_file("adblock.txt")
+    return result["counts"].get("valid", 0)
+
+def stage_compile_ir(corpus: Path, workdir: Path) -> int:
+    import rule_ir
+    return rule_ir.compile_rules(corpus, workdir / "adblock.ir")
+
+def stage_emit_rules(corpus: Path, workdir: Path) -> int:
+    sys.path.insert(0, str(SCRIPT_DIR.parent / "rules_generator"))
+    import domain_emitter
+    return domain_emitter.emit_rules(input_path=corpus, root_dir=workdir)
+
+def stage_filter_dns(corpus: Path, workdir: Path) -> int:
+    from pipeline import load_script
+    output = workdir / "dns.txt"
+    load_script("rules_generator/filter-dns.py").filter_adblock_rules(corpus, output)
+    return count_lines(output)
+
+def stage_mihomo(corpus: Path, workdir: Path) -> int:
+    from pipeline import load_script
+    mihomo = load_script("rules_generator/mihomo.py")
+    temp, output = workdir / "mihomo_temp.txt", workdir / "adb.mrs"
+    if not mihomo.process_adguard_rules(corpus, temp) or not mihomo.write_mrs(temp, output):
+        raise RuntimeError("MRS生成失败")
+    return count_lines(temp)
+
+STAGES: Dict[str, Callable[[Path, Path], int]] = {
+    "process_rules": stage_process_rules,
+    "clean_rules": stage_clean_rules,
+    "validate_file": stage_validate_file,
+    "compile_ir": stage_compile_ir,
+    "emit_rules": stage_emit_rules,
+    "filter_dns": stage_filter_dns,
+    "mihomo": stage_mihomo,
+}
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux单位为KB，macOS为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_worker(stage: str, corpus: Path, workdir: Path) -> Dict:
+    """子进程入口：运行单个阶段，阶段自身的输出重定向到stderr"""
+    sys.path.insert(0, str(SCRIPT_DIR))
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.chdir(workdir)
+    import common
+    # 阶段输出写在工作目录中，不记入项目根目录的 manifest.json
+    common.MANIFEST_PATH = workdir / "manifest.json"
+    common.MANIFEST_LOCK = workdir / "manifest.lock"
+    baseline_rss = peak_rss_mb()
+    wall, cpu = time.perf_counter(), time.process_time()
+    with contextlib.redirect_stdout(sys.stderr):
+        lines_out = STAGES[stage](corpus, workdir)
+    return {
+        "wall": round(time.perf_counter() - wall, 4),
+        "cpu": round(time.process_time() - cpu, 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "baseline_rss_mb": round(baseline_rss, 1),
+        "lines_out": lines_out,
+    }
+
+# ---------------------------------------------------------------- 调度与报告
+
+def run_stage(stage: str, corpus: Path) -> Dict:
+    workdir = BENCH_DIR / f"work-{stage}"
+    shutil.rmtree(workdir, ignore_errors=True)
+    try:
+        proc = subprocess.run(
+            [sys.executable, str(Path(__file__).resolve()), "--worker", stage, str(corpus), str(workdir)],
+            capture_output=True, text=True
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if proc.returncode != 0:
+        tail = proc.stderr.strip().splitlines()[-5:]
+        return {"error": " | ".join(tail) or f"退出码 {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def compare(results: List[Dict], baseline_path: Path, tolerance: float) -> List[str]:
+    """返回耗时超出基线容差的阶段说明"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["size"], r["stage"]): r for r in json.load(f)["results"] if "wall" in r}
+    regressions = []
+    for result in results:
+        old = baseline.get((result["size"], result["stage"]))
+        if old is None or "wall" not in result:
+            continue
+        if result["wall"] > old["wall"] * (1 + tolerance):
+            regressions.append(f"{result['size']}/{result['stage']}: "
+                               f"{old['wall']:.2f}s -> {result['wall']:.2f}s")
+    return regressions
+
+def run_benchmarks(sizes: List[str], stages: List[str], seed: int = DEFAULT_SEED) -> Dict:
+    results = []
+    for size in sizes:
+        corpus = corpus_path(size, seed)
+        digest = file_sha256(corpus)
+        for stage in stages:
+            result = {"size": size, "lines_in": SIZES[size], "stage": stage}
+            result.update(run_stage(stage, corpus))
+            results.append(result)
+            if "error" in result:
+                log(f"{size:>5} {stage:<14} 失败: {result['error']}")
+            else:
+                log(f"{size:>5} {stage:<14} {result['wall']:>8.2f}s  CPU {result['cpu']:>8.2f}s  "
+                    f"峰值RSS {result['peak_rss_mb']:>8.1f}MB  输出 {result['lines_out']} 行")
+        log(f"语料 {corpus.name} sha256={digest[:16]}")
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "results": results,
+    }
+
+def parse_list(value: str, choices) -> List[str]:
+    items = [item.strip().lower() for item in value.split(",") if item.strip()]
+    unknown = [item for item in items if item not in choices]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"未知的取值: {', '.join(unknown)}")
+    return items
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["--worker"]:
+        stage, corpus, workdir = argv[1], Path(argv[2]), Path(argv[3])
+        print(json.dumps(run_worker(stage, corpus, workdir)))
+        return
+
+    parser = argparse.ArgumentParser(description="EasyAds规则处理性能基准")
+    parser.add_argument("--sizes", type=lambda v: parse_list(v, SIZES), default=DEFAULT_SIZES,
+                        help=f"语料规模，逗号分隔（{','.join(SIZES)}）")
+    parser.add_argument("--stages", type=lambda v: parse_list(v, STAGES), default=list(STAGES),
+                        help=f"待测阶段，逗号分隔（{','.join(STAGES)}）")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="语料随机种子")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT, help="结果JSON路径")
+    parser.add_argument("--baseline", type=Path, help="用于对比的历史结果JSON")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="允许的耗时增幅（默认0.2）")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sizes, args.stages, args.seed)
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    log(f"结果已写入 {args.output}")
+
+    failed = [r for r in report["results"] if "error" in r]
+    regressions = compare(report["results"], args.baseline, args.tolerance) if args.baseline else []
+    for item in regressions:
+        print(f"::warning::性能回退 {item}")
+    if failed or regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
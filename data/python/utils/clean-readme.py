@@ -1,9 +1,24 @@
-import subprocess
+import sys
 import re
 from pathlib import Path
 import datetime
 import pytz
 
+# title.py写入的头部计数（兼容旧的 "! Total count:" 头部）
+COUNT_PATTERN = re.compile(r'^! (?:有效规则数量|Total count): *(\d+)')
+
+def read_rule_count(path: Path) -> int:
+    """读取规则文件头部的计数；没有计数头部时（如dns.txt）统计非注释非空行"""
+    count = 0
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            match = COUNT_PATTERN.match(line)
+            if match:
+                return int(match.group(1))
+            if line.strip() and not line.lstrip().startswith(('!', '#', '[')):
+                count += 1
+    return count
+
 def update_readme():
     try:
         # 规则文件路径改为根目录
@@ -19,15 +34,7 @@ def update_readme():
                 raise FileNotFoundError(f"{path} not found")
         
         # 提取规则计数
-        counts = {}
-        for name, path in rule_files.items():
-            result = subprocess.run(
-                ["sed", "-n", f"s/^! Total count: //p", str(path)],
-                capture_output=True, text=True, check=True
-            )
-            counts[name] = result.stdout.strip()
-            if not counts[name].isdigit():
-                raise ValueError(f"Invalid count in {path}")
+        counts = {name: read_rule_count(path) for name, path in rule_files.items()}
         
         # 获取北京时间
         beijing_time = (datetime.datetime.now(pytz.timezone('UTC'))
@@ -42,20 +49,24 @@ def update_readme():
         with open(readme_path, 'r+') as f:
             content = f.read()
             
-            # 替换内容
+            # 替换计数；计数未变化时不改写README，也不刷新更新时间
             replacements = {
-                '更新时间:.*': f'更新时间: {beijing_time} （北京时间）',
                 '拦截规则数量.*': f'拦截规则数量: {counts["adblock"]}',
                 'DNS拦截规则数量.*': f'DNS拦截规则数量: {counts["dns"]}',
                 '白名单规则数量.*': f'白名单规则数量: {counts["allow"]}'
             }
             
+            new_content = content
             for pattern, repl in replacements.items():
-                content = re.sub(pattern, repl, content)
+                new_content = re.sub(pattern, repl, new_content)
+            if new_content == content:
+                print("规则计数未变化，README.md无需更新")
+                return True
+            new_content = re.sub('更新时间:.*', f'更新时间: {beijing_time} （北京时间）', new_content)
             
             # 写回文件
             f.seek(0)
-            f.write(content)
+            f.write(new_content)
             f.truncate()
             
         print("已成功更新README.md中的规则计数和时间")
@@ -63,4 +74,11 @@ def update_readme():
         
     except Exception as e:
         print(f"更新失败: {str(e)}")
-        return False
\ No newline at end of file
+        return False
+
+def main():
+    if not update_readme():
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
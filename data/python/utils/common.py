@@ -1,7 +1,14 @@
 # EasyAds/data/python/utils/common.py
+import os
+import re
+import json
+import fcntl
+import hashlib
 import logging
 from pathlib import Path
-from typing import List, Union
+from datetime import datetime, timedelta, timezone
+from contextlib import contextmanager
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 logger = logging.getLogger(__name__)
@@ -48,4 +55,152 @@ def get_unique_lines(lines: List[str], keep_order: bool = True) -> List[str]:
         if line not in seen:
             seen.add(line)
             unique.append(line)
-    return unique
\ No newline at end of file
+    return unique
+
+# ---- 域名排序 ----
+# 默认按字典序；EASYADS_DOMAIN_ORDER=reverse 时按逆序标签排序（com.example.a），
+# 同一域名下的子域名相邻，压缩率、git差异和前缀查找都更友好。
+DOMAIN_ORDER = os.environ.get("EASYADS_DOMAIN_ORDER", "lex")
+REVERSE_ORDER = DOMAIN_ORDER == "reverse"
+ORDER_SEPARATOR = "\t"  # 小于域名中所有合法字符，逐标签比较
+
+def order_key(domain: str) -> str:
+    """域名的排序键（可用 from_order_key 还原），字符串比较即为当前排序方式"""
+    if not REVERSE_ORDER or domain.rpartition(".")[2].isdigit():
+        return domain  # IP地址保持原样，排在所有域名之前
+    return ORDER_SEPARATOR.join(reversed(domain.split(".")))
+
+def from_order_key(key: str) -> str:
+    if not REVERSE_ORDER:
+        return key
+    return ".".join(reversed(key.split(ORDER_SEPARATOR)))
+
+def sort_domains(items: Iterable, domain_of: Optional[Callable[[object], str]] = None) -> List:
+    """按当前排序方式排序；字典序模式下与 sorted(items) 完全一致"""
+    if not REVERSE_ORDER:
+        return sorted(items)
+    return sorted(items, key=lambda item: order_key(domain_of(item) if domain_of else item))
+
+# ---- 输出文件：内容未变化时不改写 ----
+# 比较时忽略随每次运行变化的头部行（生成/更新时间），只比较规则内容。
+# 根目录的 manifest.json 记录每个输出的内容哈希、内容变化时间和已发布的时间戳行：
+# 中间阶段覆盖过的文件（如merge之后由title.py加头部的adblock.txt）内容未变时会恢复原时间戳，
+# 最终文件与上次提交逐字节一致。
+# EASYADS_STAMP_MODE=manifest 时输出文件不再写入时间戳行，更新时间只记录在 manifest.json 中。
+ROOT_DIR = Path(__file__).resolve().parent.parent.parent.parent
+MANIFEST_PATH = ROOT_DIR / "manifest.json"
+MANIFEST_LOCK = ROOT_DIR / "tmp" / "manifest.lock"
+STAMP_MODE = os.environ.get("EASYADS_STAMP_MODE", "inline")
+VOLATILE_LINE = re.compile(r"^[!#][^\n]*(?:更新时间|生成时间|Generated on)".encode("utf-8"))
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+def stamp_line(line: str) -> str:
+    """时间戳头部行：manifest模式下返回空字符串，不写入输出文件"""
+    return "" if STAMP_MODE == "manifest" else line
+
+def payload_digest(file_path: Union[Path, str], text: bool = True) -> Tuple[str, List[bytes]]:
+    """
+    计算文件内容哈希（文本文件忽略时间戳行）
+
+    :return: (sha256, 被忽略的时间戳行)
+    """
+    digest = hashlib.sha256()
+    volatile = []
+    with open(file_path, "rb") as f:
+        if not text:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+            return digest.hexdigest(), volatile
+        for line in f:
+            if VOLATILE_LINE.match(line):
+                volatile.append(line)
+            else:
+                digest.update(line)
+    return digest.hexdigest(), volatile
+
+@contextmanager
+def _locked_manifest() -> Iterator[Dict]:
+    """读取并在退出时写回 manifest.json（文件锁保护，流水线中的并行阶段可同时更新）"""
+    MANIFEST_LOCK.parent.mkdir(parents=True, exist_ok=True)
+    with open(MANIFEST_LOCK, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            manifest = json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            manifest = {"files": {}}
+        before = json.dumps(manifest, sort_keys=True)
+        yield manifest
+        if json.dumps(manifest, sort_keys=True) != before:
+            manifest["updated_at"] = max(
+                (entry["updated_at"] for entry in manifest["files"].values()), default="")
+            write_file_safely(json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True) + "\n",
+                              MANIFEST_PATH)
+
+def _manifest_key(file_path: Path) -> str:
+    try:
+        return file_path.resolve().relative_to(ROOT_DIR).as_posix()
+    except ValueError:
+        return file_path.resolve().as_posix()
+
+def _restore_stamps(temp_path: Path, stamps: List[str]) -> None:
+    """按顺序把新文件中的时间戳行替换为已发布版本的时间戳行"""
+    pending = [stamp.encode("utf-8") for stamp in stamps]
+    restored_path = temp_path.with_name(temp_path.name + ".stamp")
+    with open(temp_path, "rb") as src, open(restored_path, "wb") as dst:
+        for line in src:
+            dst.write(pending.pop(0) if pending and VOLATILE_LINE.match(line) else line)
+    restored_path.replace(temp_path)
+
+def commit_output(temp_path: Path, file_path: Path, text: bool = True) -> bool:
+    """
+    用新生成的临时文件替换输出文件；规则内容未变化时保留原文件
+
+    :return: 规则内容是否发生变化
+    """
+    digest, volatile = payload_digest(temp_path, text)
+    with _locked_manifest() as manifest:
+        key = _manifest_key(file_path)
+        entry = manifest["files"].get(key)
+        existing = payload_digest(file_path, text) if file_path.exists() else None
+        if existing is not None and existing[0] == digest and len(existing[1]) == len(volatile):
+            temp_path.unlink()
+            published, changed = existing[1], False
+        elif entry and entry["sha256"] == digest and len(entry["stamps"]) == len(volatile):
+            # 文件已被中间阶段覆盖，但规则内容与上次发布时相同
+            _restore_stamps(temp_path, entry["stamps"])
+            temp_path.replace(file_path)
+            changed = False
+        else:
+            temp_path.replace(file_path)
+            published, changed = volatile, True
+
+        if changed or entry is None or entry["sha256"] != digest:
+            manifest["files"][key] = {
+                "sha256": digest,
+                "updated_at": datetime.now(BEIJING_TZ).strftime("%Y-%m-%d %H:%M:%S"),
+                "stamps": [line.decode("utf-8", "replace") for line in published],
+            }
+    if not changed:
+        logger.info(f"规则内容未变化，保留原文件: {file_path}")
+    return changed
+
+@contextmanager
+def open_output(file_path: Union[Path, str], mode: str = "w", encoding: str = "utf-8") -> Iterator[IO]:
+    """
+    打开输出文件：写入临时文件，关闭时仅在规则内容变化时替换目标文件
+
+    用法与 open() 相同：with open_output(path) as f: f.write(...)
+    """
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = file_path.with_name(file_path.name + ".new")
+    binary = "b" in mode
+    f = open(temp_path, mode) if binary else open(temp_path, mode, encoding=encoding)
+    try:
+        yield f
+    except BaseException:
+        f.close()
+        temp_path.unlink(missing_ok=True)
+        raise
+    f.close()
+    commit_output(temp_path, file_path, text=not binary)
@@ -0,0 +1,174 @@
+# EasyAds/data/python/utils/compress.py
+"""预压缩输出：为每个发布的规则文件生成 .gz/.br/.zst 版本，镜像可直接返回压缩后的静态文件
+
+输出文件列表取自 manifest.json（所有经 open_output 写出的文件），压缩结果写入 dist/：
+    dist/<文件>.gz / .br / .zst     最高压缩等级，gzip 头部不含时间戳，相同输入得到相同字节
+    dist/compressed.json            各文件的源哈希、大小及各压缩版本的大小
+每个 (文件, 算法) 在独立进程中压缩；源文件哈希与上次相同且压缩文件仍在时直接复用。
+压缩后不小于原文件的版本（如已是zstd压缩的 adb.mrs）不保留，镜像返回原文件即可。
+dist/ 不提交到仓库，随 actions/cache 保留并作为构建产物上传。
+
+通过环境变量调整：
+    EASYADS_COMPRESS_WORKERS=4       并行进程数（默认CPU核数）
+"""
+import os
+import sys
+import gzip
+import json
+import shutil
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List
+from concurrent.futures import ProcessPoolExecutor
+
+import brotli
+import zstandard
+
+import metrics
+from shards import file_sha256
+from common import MANIFEST_PATH, write_file_safely
+
+SCRIPT_DIR = Path(__file__).resolve().parent  # data/python/utils
+ROOT_DIR = SCRIPT_DIR.parent.parent.parent    # 项目根目录
+DIST_DIR = ROOT_DIR / "dist"
+INDEX_PATH = DIST_DIR / "compressed.json"
+COMPRESS_WORKERS = int(os.environ.get("EASYADS_COMPRESS_WORKERS", "0")) or os.cpu_count() or 1
+READ_BUFFER = 1 << 20
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+ZSTD_LEVEL = 19
+
+def log(message: str):
+    """带时间戳的日志输出"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] [COMPRESS] {message}", flush=True)
+
+def _write_gzip(src, dst) -> None:
+    with gzip.GzipFile(filename="", fileobj=dst, mode="wb", compresslevel=GZIP_LEVEL, mtime=0) as writer:
+        shutil.copyfileobj(src, writer, READ_BUFFER)
+
+def _write_brotli(src, dst) -> None:
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for block in iter(lambda: src.read(READ_BUFFER), b""):
+        dst.write(compressor.process(block))
+    dst.write(compressor.finish())
+
+def _write_zstd(src, dst) -> None:
+    # 写入内容大小，解压端可一次分配缓冲区
+    size = os.fstat(src.fileno()).st_size
+    zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(src, dst, size=size,
+                                                            read_size=READ_BUFFER, write_size=READ_BUFFER)
+
+# 压缩算法：扩展名 -> 写出函数
+CODECS = {
+    "gz": _write_gzip,
+    "br": _write_brotli,
+    "zst": _write_zstd,
+}
+
+def compress_file(source: Path, target: Path, codec: str) -> int:
+    """在工作进程中压缩单个文件，返回压缩后的大小"""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = target.with_name(target.name + ".tmp")
+    try:
+        with open(source, "rb") as src, open(temp_path, "wb") as dst:
+            CODECS[codec](src, dst)
+        temp_path.replace(target)
+    finally:
+        temp_path.unlink(missing_ok=True)
+    return target.stat().st_size
+
+def output_files() -> List[str]:
+    """manifest.json 中记录的、当前仍存在的输出文件（相对项目根目录）"""
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            files = json.load(f)["files"]
+    except (OSError, ValueError, KeyError):
+        return []
+    return sorted(name for name in files if not Path(name).is_absolute() and (ROOT_DIR / name).is_file())
+
+def load_index() -> Dict:
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"files": {}}
+
+def reusable(entry: Dict, sha256: str) -> bool:
+    return (entry is not None and entry["sha256"] == sha256
+            and all((DIST_DIR / variant["path"]).exists() for variant in entry["variants"].values()))
+
+def prune_dist(index: Dict) -> int:
+    """删除 dist/ 中不再被索引引用的文件，返回删除数量"""
+    keep = {INDEX_PATH}
+    for entry in index["files"].values():
+        keep.update(DIST_DIR / variant["path"] for variant in entry["variants"].values())
+    removed = 0
+    for path in DIST_DIR.rglob("*"):
+        if path.is_file() and path not in keep:
+            path.unlink()
+            removed += 1
+    return removed
+
+def compress_outputs(stats: metrics.StageMetrics, max_workers: int = COMPRESS_WORKERS) -> Dict:
+    """压缩所有输出文件并更新 dist/compressed.json"""
+    previous = load_index()["files"]
+    files, tasks = {}, []
+    for name in output_files():
+        source = ROOT_DIR / name
+        sha256 = file_sha256(source)
+        if reusable(previous.get(name), sha256):
+            files[name] = previous[name]
+            continue
+        files[name] = {"sha256": sha256, "size": source.stat().st_size, "variants": {}}
+        tasks.extend((name, codec) for codec in CODECS)
+    changed = len(tasks) // len(CODECS)
+    log(f"输出文件 {len(files)} 个，需压缩 {changed} 个，复用 {len(files) - changed} 个")
+
+    if tasks:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(tasks))) as pool:
+            futures = [
+                (name, codec, pool.submit(compress_file, ROOT_DIR / name, DIST_DIR / f"{name}.{codec}", codec))
+                for name, codec in tasks]
+            for name, codec, future in futures:
+                size = future.result()
+                entry = files[name]
+                target = DIST_DIR / f"{name}.{codec}"
+                if size >= entry["size"]:
+                    target.unlink()  # 压缩无收益，镜像直接返回原文件
+                    continue
+                entry["variants"][codec] = {"path": f"{name}.{codec}", "size": size}
+
+    for name, entry in files.items():
+        for codec, variant in sorted(entry["variants"].items()):
+            ratio = variant["size"] / entry["size"] if entry["size"] else 0
+            log(f"{name}.{codec}：{entry['size']} -> {variant['size']} 字节（{ratio:.1%}）")
+    stats.set("files", len(files))
+    stats.set("compressed", changed)
+    stats.set("reused", len(files) - changed)
+    stats.set("bytes_in", sum(entry["size"] for entry in files.values()))
+    for codec in CODECS:
+        stats.set(f"bytes_{codec}", sum(entry["variants"].get(codec, {"size": entry["size"]})["size"]
+                                         for entry in files.values()))
+
+    index = {"files": files}
+    if files != previous or not INDEX_PATH.exists():
+        write_file_safely(json.dumps(index, ensure_ascii=False, indent=2, sort_keys=True) + "\n", INDEX_PATH)
+        log(f"已更新压缩索引：{INDEX_PATH}")
+    removed = prune_dist(index)
+    if removed:
+        log(f"已删除 {removed} 个过期的压缩文件")
+    return index
+
+def main():
+    with metrics.stage("compress") as stats:
+        try:
+            compress_outputs(stats)
+        except Exception as e:
+            log(f"压缩失败：{str(e)}")
+            stats.set("error", str(e))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# EasyAds/data/python/utils/dedup.py
+"""多进程去重：按哈希分片并行去除重复行，保持首次出现的顺序
+
+流程（文件大于阈值且可用多个进程时）：
+    1. 按换行边界把文件切成N段，各进程读取自己的段，把每行的键按 crc32 分到N个分片，
+       分片内容（段内行号 + 键）写入临时文件
+    2. 各进程负责一个分片，按段顺序读入该分片的全部键，记录重复行的全局行号
+    3. 主进程按行号跳过重复行，顺序写回
+相同的键必然落在同一分片，分片内按行号顺序处理，因此保留的是首次出现的行，
+结果与单进程的 set 去重逐字节一致。小文件直接单进程处理。
+
+通过环境变量调整：
+    EASYADS_DEDUP_WORKERS=4          并行进程数（默认CPU核数，1为单进程）
+    EASYADS_DEDUP_PARALLEL_MB=16     启用并行的最小文件大小（MB）
+"""
+import io
+import os
+import zlib
+import pickle
+import tempfile
+from array import array
+from pathlib import Path
+from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+
+DEDUP_WORKERS = int(os.environ.get("EASYADS_DEDUP_WORKERS", "0")) or os.cpu_count() or 1
+PARALLEL_MIN_BYTES = int(float(os.environ.get("EASYADS_DEDUP_PARALLEL_MB", "16")) * 1024 * 1024)
+READ_BUFFER = 1 << 20
+
+def _key(line: str, ignore_case: bool) -> str:
+    return line.lower() if ignore_case else line
+
+def _dedup_serial(path: Path, output_path: Path, ignore_case: bool, skip_blank: bool,
+                  encoding: str, errors: str) -> Tuple[int, int, int]:
+    seen = set()
+    kept = duplicates = blank = 0
+    with open(path, 'r', encoding=encoding, errors=errors, buffering=READ_BUFFER) as in_f, \
+            open(output_path, 'w', encoding='utf-8') as out_f:
+        for line in in_f:
+            if skip_blank and not line.strip():
+                blank += 1
+                continue
+            key = _key(line, ignore_case)
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            out_f.write(line)
+            kept += 1
+    return kept, duplicates, blank
+
+def _chunk_bounds(path: Path, parts: int) -> List[Tuple[int, int]]:
+    """按换行边界切分文件，返回 [(起始偏移, 结束偏移)]"""
+    size = path.stat().st_size
+    bounds, start = [], 0
+    with open(path, 'rb') as f:
+        for i in range(1, parts):
+            if start >= size:
+                break
+            f.seek(max(start, size * i // parts))
+            f.readline()  # 移到下一个换行之后
+            end = f.tell()
+            if end > start:
+                bounds.append((start, end))
+                start = end
+    if start < size:
+        bounds.append((start, size))
+    return bounds
+
+def _iter_chunk(path: Path, start: int, end: int, encoding: str, errors: str):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    # 与直接以文本模式打开文件相同的换行和解码处理
+    return io.TextIOWrapper(io.BytesIO(data), encoding=encoding, errors=errors)
+
+def _partition_chunk(path: Path, start: int, end: int, shard_paths: List[Path], ignore_case: bool,
+                     skip_blank: bool, encoding: str, errors: str) -> Tuple[int, array]:
+    """阶段1：把一段内每行的键分到各分片，返回 (段内行数, 空行行号)"""
+    shards = len(shard_paths)
+    indices = [array('I') for _ in range(shards)]
+    keys: List[List[str]] = [[] for _ in range(shards)]
+    blanks = array('I')
+    count = 0
+    for count, line in enumerate(_iter_chunk(path, start, end, encoding, errors), 1):
+        if skip_blank and not line.strip():
+            blanks.append(count - 1)
+            continue
+        key = _key(line, ignore_case)
+        shard = zlib.crc32(key.encode('utf-8', 'surrogatepass')) % shards
+        indices[shard].append(count - 1)
+        keys[shard].append(key)
+    for shard_path, shard_indices, shard_keys in zip(shard_paths, indices, keys):
+        with open(shard_path, 'wb') as f:
+            pickle.dump((shard_indices, shard_keys), f, protocol=pickle.HIGHEST_PROTOCOL)
+    return count, blanks
+
+def _dedup_shard(parts: List[Tuple[Path, int]]) -> array:
+    """阶段2：按段顺序处理同一分片的键，返回重复行的全局行号"""
+    seen = set()
+    duplicates = array('I')
+    for shard_path, base in parts:
+        with open(shard_path, 'rb') as f:
+            indices, keys = pickle.load(f)
+        for index, key in zip(indices, keys):
+            if key in seen:
+                duplicates.append(base + index)
+            else:
+                seen.add(key)
+    return duplicates
+
+def _dedup_parallel(path: Path, output_path: Path, ignore_case: bool, skip_blank: bool,
+                    encoding: str, errors: str, workers: int) -> Tuple[int, int, int]:
+    bounds = _chunk_bounds(path, workers)
+    with tempfile.TemporaryDirectory(prefix="dedup-", dir=output_path.parent) as spill_dir, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        spill = Path(spill_dir)
+        shard_paths = [[spill / f"c{c}_s{s}" for s in range(workers)] for c in range(len(bounds))]
+        futures = [pool.submit(_partition_chunk, path, start, end, shard_paths[c],
+                               ignore_case, skip_blank, encoding, errors)
+                   for c, (start, end) in enumerate(bounds)]
+        partitioned = [future.result() for future in futures]
+
+        bases, total = [], 0
+        for count, _ in partitioned:
+            bases.append(total)
+            total += count
+
+        removed = bytearray(total)
+        blank = 0
+        for base, (_, blanks) in zip(bases, partitioned):
+            blank += len(blanks)
+            for index in blanks:
+                removed[base + index] = 1
+        duplicates = 0
+        shard_tasks = [[(shard_paths[c][s], bases[c]) for c in range(len(bounds))] for s in range(workers)]
+        for shard_duplicates in pool.map(_dedup_shard, shard_tasks):
+            duplicates += len(shard_duplicates)
+            for index in shard_duplicates:
+                removed[index] = 1
+
+    kept = 0
+    with open(path, 'r', encoding=encoding, errors=errors, buffering=READ_BUFFER) as in_f, \
+            open(output_path, 'w', encoding='utf-8') as out_f:
+        for index, line in enumerate(in_f):
+            if not removed[index]:
+                out_f.write(line)
+                kept += 1
+    return kept, duplicates, blank
+
+def dedup_file(
+    path: Path,
+    ignore_case: bool = True,
+    skip_blank: bool = True,
+    encoding: str = 'utf-8',
+    errors: str = 'strict',
+    max_workers: int = 0,
+) -> Tuple[int, int]:
+    """
+    原地去重文件（保留首次出现的行及其顺序），内容有变化时才改写文件
+
+    :param ignore_case: 是否忽略大小写比较
+    :param skip_blank: 是否同时移除空白行（不计入重复数）
+    :param max_workers: 并行进程数，0 表示使用 EASYADS_DEDUP_WORKERS
+    :return: (保留行数, 重复行数)
+    :raises UnicodeDecodeError: 按 encoding 无法解码时抛出，调用方可换用备用编码重试
+    """
+    path = Path(path)
+    workers = max_workers or DEDUP_WORKERS
+    output_path = path.with_name(path.name + ".dedup")
+    try:
+        if workers > 1 and path.stat().st_size >= PARALLEL_MIN_BYTES:
+            kept, duplicates, blank = _dedup_parallel(
+                path, output_path, ignore_case, skip_blank, encoding, errors, workers)
+        else:
+            kept, duplicates, blank = _dedup_serial(
+                path, output_path, ignore_case, skip_blank, encoding, errors)
+        if duplicates or blank:
+            output_path.replace(path)
+    finally:
+        output_path.unlink(missing_ok=True)
+    return kept, duplicates
@@ -0,0 +1,203 @@
+# EasyAds/data/python/utils/delta.py
+"""增量补丁：对比上一次构建的规则集，为 adblock.txt、hosts.txt、Clash.yaml 输出新增/删除条目
+
+每种格式的规则条目（去除头部和注释后的行）排序去重后保存在 .cache/delta/<格式>.txt，
+下次构建时与新的有序条目做流式归并连接（merge-join），两边各顺序读取一次即可得到差异：
+    delta/<格式>.added.txt     新增的条目（原格式的整行，按字符串排序）
+    delta/<格式>.removed.txt   删除的条目
+    delta/index.json           各格式补丁的起止版本与条目数
+版本号为有序条目（每行以换行结尾）的 sha256，与头部时间戳和条目顺序无关。
+客户端本地版本等于 from 时应用补丁即可得到 to 版本；不一致（跳过了某次构建、缓存丢失等）时下载完整文件。
+规则集未变化时保留上一份补丁；没有上一次的条目快照时移除该格式的补丁，客户端回退到完整下载。
+"""
+import sys
+import json
+import hashlib
+from pathlib import Path
+from datetime import datetime
+from typing import Callable, Dict, IO, Iterator, Optional, Tuple
+
+import metrics
+from extsort import make_sorter
+from common import BEIJING_TZ, open_output, write_file_safely
+
+SCRIPT_DIR = Path(__file__).resolve().parent  # data/python/utils
+ROOT_DIR = SCRIPT_DIR.parent.parent.parent    # 项目根目录
+SNAPSHOT_DIR = ROOT_DIR / ".cache" / "delta"  # 上一次构建的有序条目，随 actions/cache 保留
+DELTA_DIR = ROOT_DIR / "delta"                # 发布的补丁文件
+INDEX_PATH = DELTA_DIR / "index.json"
+SORT_DIR = ROOT_DIR / "tmp" / "sort"
+READ_BUFFER = 1 << 20
+
+# 参与增量更新的格式
+# 键: 格式名, 值: 输出文件及判断一行是否为规则条目的函数（头部、注释、空行不参与对比）
+FORMATS: Dict[str, Dict] = {
+    "adblock": {
+        "path": "adblock.txt",
+        "entry": lambda line: bool(line) and not line.startswith(("!", "[")),
+    },
+    "hosts": {
+        "path": "hosts.txt",
+        "entry": lambda line: bool(line) and not line.startswith("#"),
+    },
+    "clash": {
+        "path": "Clash.yaml",
+        "entry": lambda line: line.startswith("  - "),
+    },
+}
+
+def log(message: str):
+    """带时间戳的日志输出"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] [DELTA] {message}")
+
+def iter_entries(path: Path) -> Iterator[str]:
+    """逐行读取有序条目文件（不含换行符）"""
+    with open(path, "r", encoding="utf-8", buffering=READ_BUFFER) as f:
+        for line in f:
+            yield line[:-1]
+
+def write_snapshot(source: Path, is_entry: Callable[[str], bool], snapshot_path: Path) -> Tuple[str, int]:
+    """
+    提取规则条目并排序去重，写入快照文件
+
+    :return: (版本号, 条目数)
+    """
+    digest = hashlib.sha256()
+    count = 0
+    with make_sorter(SORT_DIR) as sorter, open(source, "r", encoding="utf-8", buffering=READ_BUFFER) as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if is_entry(line):
+                sorter.add(line)
+        with open(snapshot_path, "w", encoding="utf-8") as out_f:
+            for entry in sorter:
+                data = entry + "\n"
+                out_f.write(data)
+                digest.update(data.encode("utf-8"))
+                count += 1
+    return digest.hexdigest(), count
+
+def snapshot_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_BUFFER), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def merge_join(old: Iterator[str], new: Iterator[str], removed_f: IO, added_f: IO) -> Tuple[int, int]:
+    """
+    流式对比两个有序去重序列，删除的条目写入 removed_f，新增的写入 added_f
+
+    :return: (新增数, 删除数)
+    """
+    added = removed = 0
+    old_item = next(old, None)
+    new_item = next(new, None)
+    while old_item is not None and new_item is not None:
+        if old_item == new_item:
+            old_item = next(old, None)
+            new_item = next(new, None)
+        elif old_item < new_item:
+            removed_f.write(old_item + "\n")
+            removed += 1
+            old_item = next(old, None)
+        else:
+            added_f.write(new_item + "\n")
+            added += 1
+            new_item = next(new, None)
+    while old_item is not None:
+        removed_f.write(old_item + "\n")
+        removed += 1
+        old_item = next(old, None)
+    while new_item is not None:
+        added_f.write(new_item + "\n")
+        added += 1
+        new_item = next(new, None)
+    return added, removed
+
+def delta_paths(name: str) -> Tuple[Path, Path]:
+    return DELTA_DIR / f"{name}.added.txt", DELTA_DIR / f"{name}.removed.txt"
+
+def build_delta(name: str, config: Dict, previous: Optional[Dict]) -> Optional[Dict]:
+    """
+    生成单个格式的补丁，返回 index.json 中的记录
+
+    规则集未变化时返回原记录；没有可用的上一版快照时返回None
+    """
+    source = ROOT_DIR / config["path"]
+    snapshot_path = SNAPSHOT_DIR / f"{name}.txt"
+    new_path = snapshot_path.with_name(snapshot_path.name + ".new")
+    version, count = write_snapshot(source, config["entry"], new_path)
+
+    if not snapshot_path.exists():
+        new_path.replace(snapshot_path)
+        log(f"{config['path']}：无上一次构建的条目快照，已保存 {count} 条，本次不生成补丁")
+        return previous if previous and previous["to"] == version else None
+
+    base = snapshot_digest(snapshot_path)
+    if base == version:
+        new_path.unlink()
+        log(f"{config['path']}：规则集未变化（{count} 条）")
+        return previous if previous and previous["to"] == version else None
+
+    added_path, removed_path = delta_paths(name)
+    with open_output(added_path) as added_f, open_output(removed_path) as removed_f:
+        added, removed = merge_join(iter_entries(snapshot_path), iter_entries(new_path), removed_f, added_f)
+    new_path.replace(snapshot_path)
+    log(f"{config['path']}：新增 {added} 条，删除 {removed} 条（共 {count} 条）")
+    return {
+        "path": config["path"],
+        "from": base,
+        "to": version,
+        "entries": count,
+        "added": added,
+        "removed": removed,
+        "added_path": added_path.relative_to(ROOT_DIR).as_posix(),
+        "removed_path": removed_path.relative_to(ROOT_DIR).as_posix(),
+        "updated_at": datetime.now(BEIJING_TZ).strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+def load_index() -> Dict:
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"formats": {}}
+
+def build_deltas(stats: metrics.StageMetrics) -> Dict:
+    """生成所有格式的补丁并更新 index.json"""
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    index = load_index()
+    formats = {}
+    for name, config in FORMATS.items():
+        if not (ROOT_DIR / config["path"]).exists():
+            log(f"跳过 {config['path']}：文件不存在")
+            continue
+        entry = build_delta(name, config, index["formats"].get(name))
+        if entry is None:
+            for path in delta_paths(name):
+                path.unlink(missing_ok=True)
+            continue
+        formats[name] = entry
+        stats.add_in(entry["entries"])
+        stats.set(f"{name}_added", entry["added"])
+        stats.set(f"{name}_removed", entry["removed"])
+
+    if formats != index["formats"] or not INDEX_PATH.exists():
+        index = {"formats": formats}
+        write_file_safely(json.dumps(index, ensure_ascii=False, indent=2, sort_keys=True) + "\n", INDEX_PATH)
+        log(f"已更新补丁索引：{INDEX_PATH}")
+    return index
+
+def main():
+    with metrics.stage("delta") as stats:
+        try:
+            build_deltas(stats)
+        except Exception as e:
+            log(f"生成补丁失败：{str(e)}")
+            stats.set("error", str(e))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
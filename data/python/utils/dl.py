@@ -1,18 +1,60 @@
 import os
 import re
-import subprocess
+import json
+import codecs
+import hashlib
+import threading
 import time
+import heapq
+import queue
 import shutil
 from pathlib import Path
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed, Future
+from collections import Counter
+from urllib.parse import urlsplit
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+from extsort import make_sorter
+from shards import ShardCache
 
 # 配置常量
-MAX_WORKERS = 5  # 并发下载数量
+MAX_WORKERS = 32  # 下载线程上限（实际并发由每个主机的并发上限控制）
+HOST_CONCURRENCY = int(os.environ.get("EASYADS_HOST_CONCURRENCY", "4"))  # 同一主机的并发请求上限
+HOST_POOLS = 16   # 会话中保留连接池的主机数量
 TIMEOUT = 60      # 超时时间(秒)
 RETRY = 5         # 重试次数
 RETRY_DELAY = 2   # 重试间隔(秒)
+RETRY_STATUS = (429, 500, 502, 503, 504)  # 需要重试的HTTP状态码
 ENCODING = "utf-8"  # 目标编码
+CHUNK_SIZE = 64 * 1024  # 流式读写块大小
+SNIFF_SIZE = 64 * 1024  # 编码探测使用的前缀长度
+MAX_SOURCE_SIZE = 64 * 1024 * 1024  # 单个规则源的默认大小上限
+SOURCE_SIZE_LIMITS = {}  # 个别规则源的大小上限（按URL覆盖默认值）
+# 对冲请求：源站超过该秒数仍未完成（或请求失败）时向下一个镜像发起请求，采用最先完整返回的结果
+HEDGE_DELAY = float(os.environ.get("EASYADS_HEDGE_DELAY", "5"))
+# ghproxy类加速前缀（如 https://ghfast.top/），第三方代理可篡改内容，默认不使用，需显式开启
+GHPROXY = os.environ.get("EASYADS_GHPROXY", "")
+# 个别规则源的镜像列表（按URL覆盖自动推导的GitHub镜像，空列表表示不使用镜像）
+# gitee.com 的规则源没有公共镜像（jsDelivr、ghproxy只支持GitHub），只请求源站（带重试）
+SOURCE_MIRRORS = {
+    "https://raw.hellogithub.com/hosts": [  # GitHub520 的发布地址
+        "https://raw.githubusercontent.com/521xueweihan/GitHub520/main/hosts",
+        "https://cdn.jsdelivr.net/gh/521xueweihan/GitHub520@main/hosts",
+    ],
+}
+FALLBACK_ENCODINGS = ["utf-8", "gbk", "latin-1"]  # latin-1永不失败，必须放在最后
+BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
 
 # 路径计算（基于脚本绝对路径）
 SCRIPT_DIR = Path(__file__).resolve().parent
@@ -20,6 +62,17 @@ ROOT_DIR = SCRIPT_DIR.parent.parent.parent  # 项目根目录
 TMP_DIR = ROOT_DIR / "tmp"                  # 临时目录
 ADBLOCK_SUPPLEMENT = ROOT_DIR / "data/mod/adblock.txt"  # 补充规则
 WHITELIST_SUPPLEMENT = ROOT_DIR / "data/mod/whitelist.txt"  # 补充白名单
+CACHE_DIR = ROOT_DIR / ".cache/sources"     # 上游缓存（跨运行保留，不随tmp清理）
+USER_AGENT = "EasyAds-Rules-Updater"
+
+# 与curl -k 保持一致：不校验证书，同时关闭对应警告
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+_session = None
+_hedge_session = None
+_session_lock = threading.Lock()
+_host_slots: Dict[str, threading.Semaphore] = {}
+_host_slots_lock = threading.Lock()
 
 # 日志函数
 def log(msg: str):
@@ -55,218 +108,614 @@ def init_env():
         log(f"警告: 补充白名单规则不存在 {WHITELIST_SUPPLEMENT}")
 
 # 2. 下载函数（支持并发）
-def download_url(url: str, save_path: Path) -> bool:
-    """下载单个URL并转码"""
+def cache_paths(url: str):
+    """按URL计算缓存文件路径（转码后的正文 + 元数据）"""
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:24]
+    return CACHE_DIR / f"{key}.txt", CACHE_DIR / f"{key}.json"
+
+def load_cache_meta(url: str) -> dict:
+    """读取缓存元数据（ETag / Last-Modified / 内容哈希），正文缺失时视为无缓存"""
+    body_path, meta_path = cache_paths(url)
+    if not body_path.exists() or not meta_path.exists():
+        return {}
+    try:
+        with open(meta_path, "r", encoding=ENCODING) as f:
+            meta = json.load(f)
+        return meta if meta.get("url") == url else {}
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(url: str, body_path: Path, headers: dict, sha256: str):
+    """保存转码后的正文与校验信息"""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    cached_body, meta_path = cache_paths(url)
+    if Path(body_path) != cached_body:
+        shutil.copyfile(body_path, cached_body)
+    meta = {
+        "url": url,
+        "etag": headers.get("etag", ""),
+        "last_modified": headers.get("last-modified", ""),
+        "sha256": sha256,
+        "fetched_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    with open(meta_path, "w", encoding=ENCODING) as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+def sniff_encoding(prefix: bytes, declared: str = "") -> str:
+    """根据BOM或前缀内容探测编码（declared为Content-Type中声明的charset）"""
+    for bom, encoding in BOMS:
+        if prefix.startswith(bom):
+            return encoding
+    candidates = ([declared] if declared else []) + FALLBACK_ENCODINGS
+    for encoding in candidates:
+        try:
+            # 前缀末尾可能截断多字节字符，因此不传final
+            codecs.getincrementaldecoder(encoding)().decode(prefix)
+            return encoding
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return "latin-1"
+
+def decode_to_file(raw_path: Path, save_path: Path, encoding: str):
+    """按块增量转码为UTF-8，并去除末尾空白、补齐换行（与一次性rstrip等价）"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ""  # 暂存块末尾的空白，直到确认其后还有内容
+    with open(raw_path, "rb") as src, open(save_path, "w", encoding=ENCODING) as dst:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            text = pending + decoder.decode(chunk, final=not chunk)
+            stripped = text.rstrip()
+            pending = text[len(stripped):]
+            dst.write(stripped)
+            if not chunk:
+                break
+        dst.write("\n")
+
+def host_slot(url: str) -> threading.Semaphore:
+    """URL所在主机的并发信号量（同一主机最多 HOST_CONCURRENCY 个请求同时进行）"""
+    host = urlsplit(url).netloc
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.Semaphore(HOST_CONCURRENCY)
+        return _host_slots[host]
+
+class DownloadCancelled(Exception):
+    """对冲请求中落败的一方被取消"""
+
+def fetch_to_file(url: str, raw_path: Path, session: requests.Session, headers: dict,
+                  attempt: Optional["Attempt"] = None, limit_url: str = "", verify: Optional[bool] = None):
+    """
+    流式下载到磁盘，同时计算SHA-256并检查大小上限
+
+    :param attempt: 对冲请求中的一次尝试，被取消时立即归还主机并发名额，停止读取并抛出 DownloadCancelled
+    :param limit_url: 按该URL查找大小上限（镜像请求使用源站URL）
+    :param verify: 是否校验证书，None表示沿用会话设置
+    :return: (HTTP状态码, 小写响应头, sha256, 字节数)；304或失败时sha256为空
+    """
+    limit = SOURCE_SIZE_LIMITS.get(limit_url or url, MAX_SOURCE_SIZE)
+    slot = host_slot(url)
+    slot.acquire()
+    release = slot.release if attempt is None else attempt.hold(slot)
+    try:
+        # 等待主机并发名额期间可能已被取消
+        if attempt is not None and attempt.cancelled.is_set():
+            raise DownloadCancelled(url)
+        with session.get(url, headers=headers, timeout=(TIMEOUT, TIMEOUT), stream=True,
+                         verify=verify) as response:
+            status = response.status_code
+            resp_headers = {k.lower(): v for k, v in response.headers.items()}
+            if not 200 <= status < 300:
+                return status, resp_headers, "", 0
+
+            declared = int(resp_headers.get("content-length") or 0)
+            if "content-encoding" not in resp_headers and declared > limit:
+                raise ValueError(f"超过大小上限 {declared} > {limit} 字节")
+
+            digest = hashlib.sha256()
+            size = 0
+            with open(raw_path, "wb") as f:
+                # iter_content已按Content-Encoding解压，上限按解压后的大小计算
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if attempt is not None and attempt.cancelled.is_set():
+                        raise DownloadCancelled(url)
+                    size += len(chunk)
+                    if size > limit:
+                        raise ValueError(f"超过大小上限 {limit} 字节")
+                    digest.update(chunk)
+                    f.write(chunk)
+    finally:
+        release()
+    return status, resp_headers, digest.hexdigest(), size
+
+def mirror_urls(url: str) -> List[str]:
+    """规则源的镜像地址：优先使用 SOURCE_MIRRORS，GitHub原始文件自动推导jsDelivr和ghproxy镜像"""
+    if url in SOURCE_MIRRORS:
+        return list(SOURCE_MIRRORS[url])
+    parsed = urlsplit(url)
+    parts = parsed.path.strip("/").split("/")
+    if parsed.netloc == "raw.githubusercontent.com" and len(parts) >= 4:
+        owner, repo, rest = parts[0], parts[1], parts[2:]
+    elif parsed.netloc == "github.com" and len(parts) >= 5 and parts[2] == "raw":
+        owner, repo, rest = parts[0], parts[1], parts[3:]
+    else:
+        return []
+    if rest[:2] == ["refs", "heads"]:
+        rest = rest[2:]
+    if len(rest) < 2:
+        return []
+    ref, path = rest[0], "/".join(rest[1:])
+    mirrors = [f"https://cdn.jsdelivr.net/gh/{owner}/{repo}@{ref}/{path}"]
+    if GHPROXY:
+        mirrors.append(f"{GHPROXY}https://raw.githubusercontent.com/{owner}/{repo}/{ref}/{path}")
+    return mirrors
+
+class Attempt:
+    """对冲请求中的一次下载（源站或某个镜像），在独立线程中运行，可从其他线程取消"""
+
+    def __init__(self, url: str, raw_path: Path, headers: dict, limit_url: str, verify: Optional[bool] = None):
+        self.url = url
+        self.raw_path = raw_path
+        self.headers = headers
+        self.limit_url = limit_url
+        self.verify = verify
+        self.cancelled = threading.Event()
+        self.result = None
+        self.error: Optional[Exception] = None
+        self._slot: Optional[threading.Semaphore] = None
+        self._slot_lock = threading.Lock()
+
+    @property
+    def ok(self) -> bool:
+        return self.result is not None and (200 <= self.result[0] < 300 or self.result[0] == 304)
+
+    def run(self, session: requests.Session, done: queue.Queue) -> None:
+        try:
+            self.result = fetch_to_file(self.url, self.raw_path, session, self.headers, self,
+                                        self.limit_url, self.verify)
+        except Exception as e:
+            self.error = e
+        finally:
+            if self.cancelled.is_set():
+                self.raw_path.unlink(missing_ok=True)
+            done.put(self)
+
+    def start(self, session: requests.Session, done: queue.Queue) -> None:
+        # 守护线程：落败的请求可能仍阻塞在连接或首字节上，不等待其结束
+        threading.Thread(target=self.run, args=(session, done), daemon=True).start()
+
+    def hold(self, slot: threading.Semaphore):
+        """记录本次下载占用的主机并发名额，返回归还名额的函数（已取消时立即归还）"""
+        with self._slot_lock:
+            self._slot = slot
+        if self.cancelled.is_set():
+            self.release()
+        return self.release
+
+    def release(self) -> None:
+        """归还主机并发名额（只归还一次，下载线程与取消方都可调用）"""
+        with self._slot_lock:
+            slot, self._slot = self._slot, None
+        if slot is not None:
+            slot.release()
+
+    def cancel(self) -> None:
+        """
+        取消下载：立即归还主机并发名额并删除临时文件
+
+        不从其他线程关闭连接（会阻塞在读取锁上）：下载线程读到下一块数据时停止并关闭连接；
+        仍在建立连接或等待首字节时，对冲会话不重试，最多等待一次 TIMEOUT 后结束
+        """
+        self.cancelled.set()
+        self.release()
+        self.raw_path.unlink(missing_ok=True)
+
+def hedge_round(url: str, raw_path: Path, session: requests.Session, headers: dict,
+                candidates: List[str]) -> Tuple[Optional[Attempt], Optional[Attempt], Attempt]:
+    """
+    一轮对冲：先请求源站，超过 HEDGE_DELAY 秒未完成或请求失败时依次向镜像发起请求，
+    采用最先完整返回的成功响应（2xx，或源站的304），取消其余请求
+
+    :return: (胜出的请求, 最后一个失败的请求, 源站请求)；全部失败时胜出者为None
+    """
+    done: queue.Queue = queue.Queue()
+    attempts: List[Attempt] = []
+    winner = last = None
+
+    def launch():
+        index = len(attempts)
+        attempt = Attempt(candidates[index], raw_path.with_name(f"{raw_path.name}.{index}"),
+                          headers if index == 0 else {}, url, None if index == 0 else True)
+        attempts.append(attempt)
+        attempt.start(session, done)
+
+    launch()
+    pending = 1
+    try:
+        while pending:
+            hedge = len(attempts) < len(candidates)
+            try:
+                attempt = done.get(timeout=HEDGE_DELAY if hedge else None)
+            except queue.Empty:
+                log(f"[INFO] {url.split('/')[-1]} 超过 {HEDGE_DELAY:g}s 未完成，对冲请求 {candidates[len(attempts)]}")
+                launch()
+                pending += 1
+                continue
+            pending -= 1
+            if attempt.ok:
+                winner = attempt
+                break
+            last = attempt
+            reason = attempt.error or f"HTTP {attempt.result[0]}"
+            log(f"[WARNING] 请求失败 {attempt.url}: {reason}")
+            if len(attempts) < len(candidates):
+                launch()
+                pending += 1
+    finally:
+        for attempt in attempts:
+            if attempt is not winner:
+                attempt.cancel()
+    return winner, last, attempts[0]
+
+def retryable(attempt: Attempt) -> bool:
+    """源站的失败是否值得重试（与会话重试条件一致：连接/读取错误或 RETRY_STATUS）"""
+    if attempt.error is not None:
+        return isinstance(attempt.error, requests.RequestException)
+    return attempt.result is not None and attempt.result[0] in RETRY_STATUS
+
+def hedged_fetch(url: str, raw_path: Path, session: requests.Session, headers: dict,
+                 mirrors: List[str], hedge_session: Optional[requests.Session] = None):
+    """
+    对冲下载：源站与镜像之间对冲（见 hedge_round），源站临时失败时整轮重试
+
+    没有镜像时用 session（带重试）请求源站；对冲时所有请求使用 hedge_session（单次请求，便于及时取消），
+    源站因连接错误或 RETRY_STATUS 失败且没有镜像成功时，按会话相同的退避最多再重试 RETRY 轮。
+    镜像请求校验证书；条件请求头只发给源站（ETag等校验信息属于源站）
+    :return: (实际使用的URL, fetch_to_file的返回值)；全部失败时返回最后一个失败的响应或抛出其异常
+    """
+    if not mirrors:
+        return url, fetch_to_file(url, raw_path, session, headers)
+    hedge_session = hedge_session or get_hedge_session()
+
+    candidates = [url] + mirrors
+    for round_index in range(RETRY + 1):
+        if round_index:
+            delay = RETRY_DELAY / 2 * 2 ** (round_index - 1)  # 1s, 2s, 4s ... 与会话重试的退避一致
+            log(f"[INFO] {url.split('/')[-1]} 第 {round_index} 次重试（{delay:g}s 后）")
+            time.sleep(delay)
+        winner, last, origin = hedge_round(url, raw_path, hedge_session, headers, candidates)
+        if winner is not None:
+            if winner.raw_path.exists():
+                winner.raw_path.replace(raw_path)
+            return winner.url, winner.result
+        if not retryable(origin):
+            break
+
+    if last.error is not None:
+        raise last.error
+    return last.url, last.result
+
+def create_session(pool_size: int = HOST_CONCURRENCY, retries: int = RETRY) -> requests.Session:
+    """创建带连接池与重试的会话（同一主机复用keep-alive连接）"""
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        backoff_factor=RETRY_DELAY / 2,  # 1s, 2s, 4s ... 与curl重试节奏接近
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=frozenset(["GET"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=HOST_POOLS, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # requests默认的Accept-Encoding已包含gzip/deflate，安装brotli后自动追加br
+    session.headers["User-Agent"] = USER_AGENT
+    session.verify = False
+    return session
+
+def get_session() -> requests.Session:
+    """获取全局共享会话（线程安全的惰性初始化）"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+def get_hedge_session() -> requests.Session:
+    """获取对冲请求共享的会话：不重试，落败的请求不会在重试中继续占用连接"""
+    global _hedge_session
+    with _session_lock:
+        if _hedge_session is None:
+            _hedge_session = create_session(retries=0)
+        return _hedge_session
+
+def download_url(url: str, save_path: Path, session: requests.Session = None) -> bool:
+    """下载单个URL并转码（流式写盘，条件请求命中时复用缓存）"""
+    raw_path = save_path.with_suffix(".raw")
     try:
-        # 构造curl命令
-        cmd = [
-            "curl",
-            "-m", str(TIMEOUT),
-            "--retry", str(RETRY),
-            "--retry-delay", str(RETRY_DELAY),
-            "-k", "-L", "-C", "-",  # 忽略证书、跟随重定向、断点续传
-            "--connect-timeout", str(TIMEOUT),
-            "-s", url
-        ]
-
-        # 执行命令并处理输出
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=False  # 先按字节流处理
-        )
-
-        if result.returncode != 0:
-            log(f"[ERROR] 下载失败 {url} (返回码: {result.returncode})")
+        session = session or get_session()
+        meta = load_cache_meta(url)
+        cached_body, _ = cache_paths(url)
+
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        source, (status, resp_headers, sha256, size) = hedged_fetch(url, raw_path, session, headers,
+                                                                   mirror_urls(url))
+        if source != url:
+            log(f"[INFO] 使用镜像 {source}")
+            resp_headers = {k: v for k, v in resp_headers.items() if k not in ("etag", "last-modified")}
+
+        # 304: 上游未变化，直接复用缓存（无需重新传输与转码）
+        if status == 304 and meta:
+            shutil.copyfile(cached_body, save_path)
+            log(f"[INFO] 未变化(304) {url.split('/')[-1]} -> {save_path.name}")
+            return True
+
+        if not 200 <= status < 300:
+            log(f"[ERROR] 下载失败 {url} (HTTP {status})")
             return False
 
-        # 转码处理（兼容多种编码）
-        content = None
-        for encoding in ["utf-8", "latin-1", "gbk"]:
+        # 内容哈希一致时同样复用缓存，只刷新校验头
+        if meta and meta.get("sha256") == sha256:
+            shutil.copyfile(cached_body, save_path)
+            save_cache(url, cached_body, resp_headers, sha256)
+            log(f"[INFO] 内容未变化 {url.split('/')[-1]} -> {save_path.name}")
+            return True
+
+        # 转码处理：先按BOM/前缀探测，整段解码失败时依次回退
+        with open(raw_path, "rb") as f:
+            prefix = f.read(SNIFF_SIZE)
+        declared = requests.utils.get_encoding_from_headers(resp_headers) or ""
+        sniffed = sniff_encoding(prefix, declared if declared.lower() != "iso-8859-1" else "")
+        for encoding in [sniffed] + [e for e in FALLBACK_ENCODINGS if e != sniffed]:
             try:
-                content = result.stdout.decode(encoding)
+                decode_to_file(raw_path, save_path, encoding)
                 break
             except UnicodeDecodeError:
-                continue
-        if content is None:
+                log(f"[WARNING] {encoding} 转码失败，尝试下一种编码 {url}")
+        else:
             log(f"[ERROR] 转码失败 {url}")
             return False
 
-        # 写入文件（确保末尾有换行）
-        with open(save_path, "w", encoding=ENCODING) as f:
-            f.write(content.rstrip() + "\n")  # 统一处理换行
-
-        log(f"[INFO] 下载成功 {url.split('/')[-1]} -> {save_path.name}")
+        save_cache(url, save_path, resp_headers, sha256)
+        log(f"[INFO] 下载成功 {url.split('/')[-1]} -> {save_path.name}（{size} 字节, {encoding}）")
         return True
 
     except Exception as e:
         log(f"[ERROR] 下载异常 {url}: {str(e)}")
         return False
+    finally:
+        raw_path.unlink(missing_ok=True)
+
+# 拦截规则URL列表（按顺序保存为 tmp/rules02.txt 起，rules01.txt 是补充规则）
+RULES_URLS = [
+    "https://raw.githubusercontent.com/qq5460168/dangchu/main/black.txt", #5460
+    "https://raw.githubusercontent.com/damengzhu/banad/main/jiekouAD.txt", #大萌主
+    "https://raw.githubusercontent.com/afwfv/DD-AD/main/rule/DD-AD.txt",  #DD
+    "https://raw.githubusercontent.com/Cats-Team/dns-filter/main/abp.txt", #AdRules DNS Filter
+    "https://raw.hellogithub.com/hosts", #GitHub加速
+    "https://raw.githubusercontent.com/qq5460168/dangchu/main/adhosts.txt", #测试hosts
+    "https://raw.githubusercontent.com/qq5460168/dangchu/main/white.txt", #白名单
+    "https://raw.githubusercontent.com/qq5460168/Who520/refs/heads/main/Other%20rules/Replenish.txt",#补充
+    "https://raw.githubusercontent.com/mphin/AdGuardHomeRules/main/Blacklist.txt", #mphin
+    "https://gitee.com/zjqz/ad-guard-home-dns/raw/master/black-list", #周木木
+    "https://raw.githubusercontent.com/liwenjie119/adg-rules/master/black.txt", #liwenjie119
+    "https://github.com/entr0pia/fcm-hosts/raw/fcm/fcm-hosts", #FCM Hosts
+    "https://raw.githubusercontent.com/790953214/qy-Ads-Rule/refs/heads/main/black.txt", #晴雅
+    "https://raw.githubusercontent.com/TG-Twilight/AWAvenue-Ads-Rule/main/AWAvenue-Ads-Rule.txt", #秋风规则
+    "https://raw.githubusercontent.com/2Gardon/SM-Ad-FuckU-hosts/refs/heads/master/SMAdHosts", #下一个ID见
+    "https://raw.githubusercontent.com/tongxin0520/AdFilterForAdGuard/refs/heads/main/KR_DNS_Filter.txt", #tongxin0520
+    "https://raw.githubusercontent.com/Zisbusy/AdGuardHome-Rules/refs/heads/main/Rules/blacklist.txt", #Zisbusy
+    "", # 空行（跳过下载）
+    "https://raw.githubusercontent.com/Kuroba-Sayuki/FuLing-AdRules/refs/heads/main/FuLingRules/FuLingBlockList.txt", #茯苓
+    "https://raw.githubusercontent.com/Kuroba-Sayuki/FuLing-AdRules/refs/heads/main/FuLingRules/FuLingAllowList.txt", #茯苓白名单
+    "", # 空行（跳过下载）
+]
+
+# 白名单URL列表（按顺序保存为 tmp/allow02.txt 起，allow01.txt 是补充白名单）
+ALLOW_URLS = [
+    "https://raw.githubusercontent.com/qq5460168/dangchu/main/white.txt",
+    "https://raw.githubusercontent.com/mphin/AdGuardHomeRules/main/Allowlist.txt",
+   # "https://file-git.trli.club/file-hosts/allow/Domains", #冷漠
+    "https://raw.githubusercontent.com/user001235/112/main/white.txt", #浅笑
+    "https://raw.githubusercontent.com/jhsvip/ADRuls/main/white.txt", #jhsvip
+    "https://raw.githubusercontent.com/liwenjie119/adg-rules/master/white.txt", #liwenjie119
+    "https://raw.githubusercontent.com/miaoermua/AdguardFilter/main/whitelist.txt", #喵二白名单
+    "https://raw.githubusercontent.com/Zisbusy/AdGuardHome-Rules/refs/heads/main/Rules/whitelist.txt", #Zisbusy
+    "https://raw.githubusercontent.com/Kuroba-Sayuki/FuLing-AdRules/refs/heads/main/FuLingRules/FuLingAllowList.txt", #茯苓
+    "https://raw.githubusercontent.com/urkbio/adguardhomefilter/main/whitelist.txt", #酷安cocieto
+    "",# 空行（跳过下载）
+    "" # 空行（跳过下载）
+]
 
 # 3. 并发下载规则
-def download_rules(concurrent: int = MAX_WORKERS):
-    # 规则URL列表
-    rules_urls = [
-        "https://raw.githubusercontent.com/qq5460168/dangchu/main/black.txt", #5460
-        "https://raw.githubusercontent.com/damengzhu/banad/main/jiekouAD.txt", #大萌主
-        "https://raw.githubusercontent.com/afwfv/DD-AD/main/rule/DD-AD.txt",  #DD
-        "https://raw.githubusercontent.com/Cats-Team/dns-filter/main/abp.txt", #AdRules DNS Filter
-        "https://raw.hellogithub.com/hosts", #GitHub加速
-        "https://raw.githubusercontent.com/qq5460168/dangchu/main/adhosts.txt", #测试hosts
-        "https://raw.githubusercontent.com/qq5460168/dangchu/main/white.txt", #白名单
-        "https://raw.githubusercontent.com/qq5460168/Who520/refs/heads/main/Other%20rules/Replenish.txt",#补充
-        "https://raw.githubusercontent.com/mphin/AdGuardHomeRules/main/Blacklist.txt", #mphin
-        "https://gitee.com/zjqz/ad-guard-home-dns/raw/master/black-list", #周木木
-        "https://raw.githubusercontent.com/liwenjie119/adg-rules/master/black.txt", #liwenjie119
-        "https://github.com/entr0pia/fcm-hosts/raw/fcm/fcm-hosts", #FCM Hosts
-        "https://raw.githubusercontent.com/790953214/qy-Ads-Rule/refs/heads/main/black.txt", #晴雅
-        "https://raw.githubusercontent.com/TG-Twilight/AWAvenue-Ads-Rule/main/AWAvenue-Ads-Rule.txt", #秋风规则
-        "https://raw.githubusercontent.com/2Gardon/SM-Ad-FuckU-hosts/refs/heads/master/SMAdHosts", #下一个ID见
-        "https://raw.githubusercontent.com/tongxin0520/AdFilterForAdGuard/refs/heads/main/KR_DNS_Filter.txt", #tongxin0520
-        "https://raw.githubusercontent.com/Zisbusy/AdGuardHome-Rules/refs/heads/main/Rules/blacklist.txt", #Zisbusy
-        "", # 空行（跳过下载）
-        "https://raw.githubusercontent.com/Kuroba-Sayuki/FuLing-AdRules/refs/heads/main/FuLingRules/FuLingBlockList.txt", #茯苓
-        "https://raw.githubusercontent.com/Kuroba-Sayuki/FuLing-AdRules/refs/heads/main/FuLingRules/FuLingAllowList.txt", #茯苓白名单
-        "", # 空行（跳过下载）
-    ]
-
-    # 白名单URL列表
-    allow_urls = [
-        "https://raw.githubusercontent.com/qq5460168/dangchu/main/white.txt",
-        "https://raw.githubusercontent.com/mphin/AdGuardHomeRules/main/Allowlist.txt",
-       # "https://file-git.trli.club/file-hosts/allow/Domains", #冷漠
-        "https://raw.githubusercontent.com/user001235/112/main/white.txt", #浅笑
-        "https://raw.githubusercontent.com/jhsvip/ADRuls/main/white.txt", #jhsvip
-        "https://raw.githubusercontent.com/liwenjie119/adg-rules/master/white.txt", #liwenjie119
-        "https://raw.githubusercontent.com/miaoermua/AdguardFilter/main/whitelist.txt", #喵二白名单
-        "https://raw.githubusercontent.com/Zisbusy/AdGuardHome-Rules/refs/heads/main/Rules/whitelist.txt", #Zisbusy
-        "https://raw.githubusercontent.com/Kuroba-Sayuki/FuLing-AdRules/refs/heads/main/FuLingRules/FuLingAllowList.txt", #茯苓
-        "https://raw.githubusercontent.com/urkbio/adguardhomefilter/main/whitelist.txt", #酷安cocieto
-        "",# 空行（跳过下载）
-        "" # 空行（跳过下载）
-    ]
-
-    # 并发下载规则（跳过空字符串URL）
-    log("\n开始下载拦截规则...")
-    with ThreadPoolExecutor(max_workers=concurrent) as executor:
-        futures = []
-        for i, url in enumerate(rules_urls, start=2):  # 从2开始编号（1是补充规则）
-            if not url.strip():  # 跳过空URL
-                continue
-            save_path = TMP_DIR / f"rules{i:02d}.txt"
-            try:
-                # 提交任务并验证返回类型
-                future = executor.submit(download_url, url, save_path)
-                if not isinstance(future, Future):
-                    log(f"[WARNING] 任务返回非Future对象，类型={type(future)}，URL={url}")
-                    continue
-                futures.append(future)
-            except Exception as e:
-                log(f"[ERROR] 提交任务失败（{url}）：{str(e)}")
-        
-        # 等待所有任务完成并处理异常
-        for future in as_completed(futures):
-            try:
-                future.result()  # 获取结果以捕获可能的异常
-            except Exception as e:
-                log(f"[ERROR] 任务执行异常：{str(e)}")
-
-    # 并发下载白名单（跳过空字符串URL）
-    log("\n开始下载白名单规则...")
-    with ThreadPoolExecutor(max_workers=concurrent) as executor:
-        futures = []
-        for i, url in enumerate(allow_urls, start=2):
-            if not url.strip():  # 跳过空URL
-                continue
-            save_path = TMP_DIR / f"allow{i:02d}.txt"
-            try:
-                future = executor.submit(download_url, url, save_path)
-                if not isinstance(future, Future):
-                    log(f"[WARNING] 任务返回非Future对象，类型={type(future)}，URL={url}")
-                    continue
-                futures.append(future)
-            except Exception as e:
-                log(f"[ERROR] 提交任务失败（{url}）：{str(e)}")
-        
-        # 等待所有任务完成并处理异常
+def download_rules(concurrent: int = MAX_WORKERS, rules_urls: Optional[List[str]] = None,
+                   allow_urls: Optional[List[str]] = None, session: Optional[requests.Session] = None):
+    """
+    下载全部规则源到 TMP_DIR：第i个URL（从2开始编号，空字符串跳过但占用编号）保存为 rulesNN.txt / allowNN.txt
+
+    :param session: 使用的会话，默认为全局共享会话
+    :return: (成功文件数, 失败文件数)
+    """
+    rules_urls = RULES_URLS if rules_urls is None else rules_urls
+    allow_urls = ALLOW_URLS if allow_urls is None else allow_urls
+
+    # 拦截规则与白名单共用一个下载队列（编号从2开始，1是补充规则；跳过空字符串URL）
+    jobs = [(url, TMP_DIR / f"{prefix}{i:02d}.txt")
+            for prefix, urls in (("rules", rules_urls), ("allow", allow_urls))
+            for i, url in enumerate(urls, start=2) if url.strip()]
+    return schedule_downloads(jobs, concurrent, session)
+
+def download_to_targets(url: str, paths: List[Path], session: Optional[requests.Session] = None) -> bool:
+    """下载一次，复制到所有目标文件"""
+    if not download_url(url, paths[0], session):
+        return False
+    for path in paths[1:]:
+        shutil.copyfile(paths[0], path)
+        log(f"[INFO] 复用下载结果 {paths[0].name} -> {path.name}")
+    return True
+
+def schedule_downloads(jobs: List[Tuple[str, Path]], concurrent: int = MAX_WORKERS,
+                       session: Optional[requests.Session] = None):
+    """
+    统一调度下载任务：相同URL只下载一次，所有任务提交到同一个线程池
+
+    实际并发由每个主机的并发上限（HOST_CONCURRENCY）控制，不同主机互不阻塞
+    :param jobs: [(URL, 保存路径)]
+    :return: (成功文件数, 失败文件数)
+    """
+    targets: Dict[str, List[Path]] = {}
+    for url, path in jobs:
+        targets.setdefault(url, []).append(path)
+    log(f"\n开始下载规则：{len(targets)} 个URL（去重前 {len(jobs)} 个）")
+
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrent, len(targets)))) as executor:
+        futures = {executor.submit(download_to_targets, url, paths, session): url
+                   for url, paths in targets.items()}
         for future in as_completed(futures):
+            url = futures[future]
             try:
-                future.result()  # 获取结果以捕获可能的异常
+                ok = future.result()
             except Exception as e:
-                log(f"[ERROR] 任务执行异常：{str(e)}")
+                ok = False
+                log(f"[ERROR] 任务执行异常（{url}）：{str(e)}")
+            results.extend([ok] * len(targets[url]))
+
+    failed = results.count(False)
+    log(f"下载完成：成功 {len(results) - failed} 个，失败 {failed} 个")
+    return len(results) - failed, failed
 
 # 4. 规则预处理
-def process_rules():
+INVALID_HOSTS_PATTERN = re.compile(r"^[0-9f\.:]+\s+(ip6\-|localhost|local|loopback)$")
+ALLOW_RULE_PATTERN = re.compile(r"^@@\|\|.*\^(\$important)?$")
+
+def classify_line(line: str, hosts, block, allow) -> Optional[str]:
+    """单次判断一行规则，分别送入hosts、拦截、白名单三个输出；被丢弃时返回原因"""
+    line = line.strip()
+    # 过滤注释行和空行
+    if not line:
+        return "blank"
+    if line.startswith(("#", "!", "[")):
+        return "comment"
+
+    # AdGuard规则：所有有效行
+    block.add(line)
+
+    # 白名单规则（先做前缀判断，命中后再用正则确认）
+    if line.startswith("@@||") and ALLOW_RULE_PATTERN.match(line):
+        allow.add(line)
+
+    # hosts规则：过滤本地回环等无效IP规则
+    if INVALID_HOSTS_PATTERN.match(line):
+        return None
+    if line.startswith("local") and line.find(".local", 5) != -1:
+        return None
+    # 转换IP格式
+    line = line.replace("127.0.0.1", "0.0.0.0").replace("::", "0.0.0.0")
+    # 保留有效的hosts规则
+    if "0.0.0.0" in line and ".0.0.0.0 " not in line:
+        hosts.add(line)
+    return None
+
+def write_sorted(lines, path: Path, label: str):
+    """按排序器顺序流式写入文件并记录数量"""
+    count = 0
+    with open(path, "w", encoding=ENCODING) as f:
+        for line in lines:
+            f.write(line + "\n")
+            count += 1
+        if not count:
+            f.write("\n")
+    log(f"生成{label} {path.name}（{count} 条）")
+    return count
+
+SOURCE_SHARDS = ShardCache("dl", version=1, streams=("hosts", "block", "allow"))
+
+def build_source_shard(path: Path, outputs: dict) -> dict:
+    """
+    解析单个规则源：三个输出流各自排序去重，返回总行数与丢弃原因统计
+
+    排序器由 make_sorter 创建，开启外部排序（EASYADS_EXTERNAL_SORT=1）时单个大规则源同样不会整体驻留内存
+    """
+    sort_dir = TMP_DIR / "sort"
+    hosts, block, allow = make_sorter(sort_dir), make_sorter(sort_dir), make_sorter(sort_dir)
+    total, dropped = 0, Counter()
+    try:
+        with open(path, "r", encoding=ENCODING) as f:
+            for line in f:
+                total += 1
+                reason = classify_line(line, hosts, block, allow)
+                if reason:
+                    dropped[reason] += 1
+        for stream, sorter in (("hosts", hosts), ("block", block), ("allow", allow)):
+            outputs[stream].writelines(line + "\n" for line in sorter)
+    finally:
+        for sorter in (hosts, block, allow):
+            sorter.close()
+    return {"total": total, **dropped}
+
+def merge_sorted(streams):
+    """多路归并已排序去重的分片，跳过相邻重复（结果等价于 sorted(set(...))）"""
+    previous = None
+    for line in heapq.merge(*streams):
+        if line != previous:
+            yield line
+            previous = line
+
+def process_rules(stats: Optional[metrics.StageMetrics] = None):
     log("\n开始预处理规则...")
 
-    # 合并所有规则文件
-    all_rules = []
+    # 每个规则源按内容哈希缓存解析结果，未变化的规则源直接复用分片
+    shards = []
+    SOURCE_SHARDS.start_run()
     for file in TMP_DIR.glob("*.txt"):
         try:
-            with open(file, "r", encoding=ENCODING) as f:
-                all_rules.extend(f.readlines())
+            shards.append(SOURCE_SHARDS.get(file, build_source_shard))
         except Exception as e:
             log(f"[ERROR] 读取文件失败 {file}: {str(e)}")
+    log(f"规则源分片：复用 {SOURCE_SHARDS.hits} 个，重新解析 {SOURCE_SHARDS.misses} 个")
 
-    # 过滤与转换
-    filtered = []
-    for line in all_rules:
-        line = line.strip()
-        # 过滤注释行和空行
-        if not line or line.startswith(("#", "!", "[")):
-            continue
-        # 过滤无效IP规则
-        if re.match(r"^[0-9f\.:]+\s+(ip6\-|localhost|local|loopback)$", line):
-            continue
-        if re.match(r"local.*\.local.*$", line):
-            continue
-        # 转换IP格式
-        line = line.replace("127.0.0.1", "0.0.0.0").replace("::", "0.0.0.0")
-        # 保留有效的hosts规则
-        if "0.0.0.0" in line and ".0.0.0.0 " not in line:
-            filtered.append(line)
-
-    # 去重并保存基础规则
-    unique_rules = sorted(list(set(filtered)))
-    base_hosts = TMP_DIR / "base-src-hosts.txt"
-    with open(base_hosts, "w", encoding=ENCODING) as f:
-        f.write("\n".join(unique_rules) + "\n")
-    log(f"生成基础规则 {base_hosts.name}（{len(unique_rules)} 条）")
-
-    # 提取AdGuard规则
-    adblock_rules = []
-    for line in all_rules:
-        line = line.strip()
-        if line and not line.startswith(("#", "!", "[")):
-            adblock_rules.append(line)
-    adblock_unique = sorted(list(set(adblock_rules)))
-    tmp_rules = TMP_DIR / "tmp-rules.txt"
-    with open(tmp_rules, "w", encoding=ENCODING) as f:
-        f.write("\n".join(adblock_unique) + "\n")
-    log(f"生成拦截规则 {tmp_rules.name}（{len(adblock_unique)} 条）")
-
-    # 提取白名单规则
-    allow_rules = []
-    for line in all_rules:
-        line = line.strip()
-        if re.match(r"^@@\|\|.*\^(\$important)?$", line):
-            allow_rules.append(line)
-    
-    # 保存白名单规则
-    allow_unique = sorted(list(set(allow_rules)))
-    tmp_allow = TMP_DIR / "tmp-allow.txt"
-    with open(tmp_allow, "w", encoding=ENCODING) as f:
-        f.write("\n".join(allow_unique) + "\n")
-    log(f"生成白名单规则 {tmp_allow.name}（{len(allow_unique)} 条）")
+    # 分片已各自排序，多路归并即可得到全局排序去重结果，无需再次解析文本
+    counts = {}
+    for stream, name, label in (("hosts", "base-src-hosts.txt", "基础规则"),
+                                ("block", "tmp-rules.txt", "拦截规则"),
+                                ("allow", "tmp-allow.txt", "白名单规则")):
+        lines = merge_sorted([shard.lines(stream) for shard in shards])
+        counts[stream] = write_sorted(lines, TMP_DIR / name, label)
+    SOURCE_SHARDS.prune()
+
+    if stats is not None:
+        total = sum(shard.counts["total"] for shard in shards)
+        dropped = Counter()
+        for shard in shards:
+            dropped.update({k: v for k, v in shard.counts.items() if k != "total"})
+        stats.add_in(total)
+        stats.keep(counts["block"])
+        for reason, count in dropped.items():
+            stats.drop(reason, count)
+        stats.drop("duplicate", total - sum(dropped.values()) - counts["block"])
+        stats.set("hosts_rules", counts["hosts"])
+        stats.set("allow_rules", counts["allow"])
+        stats.set("shards_reused", SOURCE_SHARDS.hits)
+        stats.set("shards_parsed", SOURCE_SHARDS.misses)
 
 # 主函数
 def main():
     try:
-        log("===== 开始规则下载与处理流程 =====")
-        init_env()
-        download_rules()
-        process_rules()
-        log("===== 规则下载与处理流程完成 =====")
+        with metrics.stage("dl") as stats:
+            log("===== 开始规则下载与处理流程 =====")
+            init_env()
+            sources_ok, sources_failed = download_rules()
+            stats.set("sources_ok", sources_ok)
+            stats.set("sources_failed", sources_failed)
+            process_rules(stats)
+            log("===== 规则下载与处理流程完成 =====")
     except Exception as e:
         log(f"[ERROR] 主流程失败: {str(e)}")
         exit(1)
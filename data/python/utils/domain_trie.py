@@ -0,0 +1,96 @@
+# EasyAds/data/python/utils/domain_trie.py
+"""按域名标签逆序组织的前缀树（com -> example -> ads），用于子域名冗余裁剪和白名单匹配"""
+import os
+from typing import Iterable, Optional, Set
+
+PRUNE_SUBDOMAINS = os.environ.get("EASYADS_PRUNE_SUBDOMAINS", "1") != "0"
+
+class TrieNode:
+    __slots__ = ("children", "block", "allow", "important", "allow_below")
+
+    def __init__(self):
+        self.children = {}
+        self.block = False        # 本节点有拦截规则
+        self.allow = False        # 本节点有白名单规则
+        self.important = False    # 白名单规则带 $important
+        self.allow_below = False  # 本节点或其子孙存在白名单规则
+
+class DomainTrie:
+    """域名后缀树：查询复杂度与标签数成正比"""
+
+    def __init__(self):
+        self.root = TrieNode()
+
+    @staticmethod
+    def labels(domain: str):
+        return reversed(domain.lower().strip('.').split('.'))
+
+    def _node(self, domain: str) -> TrieNode:
+        node = self.root
+        for label in self.labels(domain):
+            child = node.children.get(label)
+            if child is None:
+                child = node.children[label] = TrieNode()
+            node = child
+        return node
+
+    def add_block(self, domain: str) -> None:
+        self._node(domain).block = True
+
+    def add_allow(self, domain: str, important: bool = False) -> None:
+        node = self.root
+        node.allow_below = True
+        for label in self.labels(domain):
+            child = node.children.get(label)
+            if child is None:
+                child = node.children[label] = TrieNode()
+            node = child
+            node.allow_below = True
+        node.allow = True
+        node.important = node.important or important
+
+    def covering_block(self, domain: str) -> Optional[str]:
+        """
+        返回覆盖该域名的上级拦截域名（不含自身）
+
+        上级节点之下存在白名单规则时视为不完整，不能作为覆盖依据
+        """
+        node = self.root
+        path = []
+        labels = list(self.labels(domain))
+        for label in labels[:-1]:
+            node = node.children.get(label)
+            if node is None:
+                return None
+            path.append(label)
+            if node.block and not node.allow_below:
+                return '.'.join(reversed(path))
+        return None
+
+    def find_allow(self, domain: str, important: bool = False) -> Optional[str]:
+        """
+        查找命中该域名（自身或任一上级）的白名单规则
+
+        :param important: 被检查的拦截规则带 $important 时，只有 $important 白名单才生效
+        :return: 命中的白名单域名，未命中返回None
+        """
+        node = self.root
+        path = []
+        for label in self.labels(domain):
+            node = node.children.get(label)
+            if node is None or not node.allow_below:
+                return None
+            path.append(label)
+            if node.allow and (node.important or not important):
+                return '.'.join(reversed(path))
+        return None
+
+def find_redundant(block_domains: Iterable[str], allow_domains: Iterable[str] = ()) -> Set[str]:
+    """找出已被更宽泛的上级拦截规则覆盖的子域名"""
+    block_domains = list(block_domains)
+    trie = DomainTrie()
+    for domain in block_domains:
+        trie.add_block(domain)
+    for domain in allow_domains:
+        trie.add_allow(domain)
+    return {domain for domain in block_domains if trie.covering_block(domain) is not None}
@@ -0,0 +1,158 @@
+# EasyAds/data/python/utils/extsort.py
+"""排序去重工具：默认在内存中完成，可选外部排序模式（分段写盘 + 多路归并）
+
+通过环境变量开启外部排序：
+    EASYADS_EXTERNAL_SORT=1       启用外部排序
+    EASYADS_SORT_MEMORY_MB=256    单个排序器的内存上限（MB）
+两种模式输出逐字节一致。
+"""
+import os
+import sys
+import heapq
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Union
+
+EXTERNAL_SORT = os.environ.get("EASYADS_EXTERNAL_SORT", "0") == "1"
+SORT_MEMORY_MB = int(os.environ.get("EASYADS_SORT_MEMORY_MB", "256"))
+SET_ENTRY_OVERHEAD = 40  # set中每个条目的额外开销估算（字节）
+MAX_FAN_IN = 64          # 同时打开的分段文件上限，超过后先合并成一段
+
+def _escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("\n", "\\n")
+
+def _unescape(line: str) -> str:
+    if "\\" not in line:
+        return line
+    out, i = [], 0
+    while i < len(line):
+        c = line[i]
+        if c == "\\" and i + 1 < len(line):
+            out.append("\n" if line[i + 1] == "n" else line[i + 1])
+            i += 2
+        else:
+            out.append(c)
+            i += 1
+    return "".join(out)
+
+class MemorySorter:
+    """内存排序去重（等价于 sorted(set(...))）"""
+
+    def __init__(self):
+        self._items = set()
+
+    def add(self, item: str) -> None:
+        self._items.add(item)
+
+    def update(self, items: Iterable[str]) -> None:
+        self._items.update(items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(sorted(self._items))
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def close(self) -> None:
+        self.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+class ExternalSorter(MemorySorter):
+    """外部排序去重：内存超过上限时把已排序的分段写入临时目录，读取时k路归并"""
+
+    def __init__(self, tmp_dir: Union[Path, str], memory_mb: int = SORT_MEMORY_MB):
+        super().__init__()
+        self.limit = memory_mb * 1024 * 1024
+        Path(tmp_dir).mkdir(parents=True, exist_ok=True)
+        self.run_dir = Path(tempfile.mkdtemp(prefix="sort-runs-", dir=tmp_dir))
+        self.runs: List[Path] = []
+        self._seq = 0
+        self._used = 0
+        self._count: Optional[int] = None
+
+    def add(self, item: str) -> None:
+        if item in self._items:
+            return
+        self._items.add(item)
+        self._used += sys.getsizeof(item) + SET_ENTRY_OVERHEAD
+        self._count = None
+        if self._used >= self.limit:
+            self._spill()
+
+    def update(self, items: Iterable[str]) -> None:
+        for item in items:
+            self.add(item)
+
+    def _write_run(self, items: Iterable[str]) -> Path:
+        self._seq += 1
+        path = self.run_dir / f"run{self._seq:06d}.txt"
+        with open(path, "w", encoding="utf-8", newline="\n") as f:
+            f.writelines(_escape(item) + "\n" for item in items)
+        return path
+
+    def _spill(self) -> None:
+        """把当前内存中的数据排序后写成一个分段文件"""
+        if not self._items:
+            return
+        if len(self.runs) >= MAX_FAN_IN:
+            # 分段过多时先归并成一段，避免打开过多文件
+            merged = self._write_run(self._merge_runs())
+            for path in self.runs:
+                path.unlink(missing_ok=True)
+            self.runs = [merged]
+        self.runs.append(self._write_run(sorted(self._items)))
+        self._items.clear()
+        self._used = 0
+
+    def _merge_runs(self) -> Iterator[str]:
+        last = None
+        for item in heapq.merge(*(self._read_run(path) for path in self.runs)):
+            if item != last:
+                last = item
+                yield item
+
+    def _read_run(self, path: Path) -> Iterator[str]:
+        with open(path, "r", encoding="utf-8", newline="\n") as f:
+            for line in f:
+                yield _unescape(line[:-1])
+
+    def __iter__(self) -> Iterator[str]:
+        if not self.runs:
+            yield from sorted(self._items)
+            return
+        self._spill()
+        yield from self._merge_runs()
+
+    def __len__(self) -> int:
+        if not self.runs:
+            return len(self._items)
+        if self._count is None:
+            self._count = sum(1 for _ in self)
+        return self._count
+
+    def clear(self) -> None:
+        super().clear()
+        for path in self.runs:
+            path.unlink(missing_ok=True)
+        self.runs.clear()
+        self._used = 0
+        self._count = None
+
+    def close(self) -> None:
+        self.clear()
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+
+def make_sorter(tmp_dir: Union[Path, str]) -> MemorySorter:
+    """根据配置返回内存或外部排序器"""
+    if EXTERNAL_SORT:
+        return ExternalSorter(tmp_dir)
+    return MemorySorter()
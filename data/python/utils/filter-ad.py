@@ -1,6 +1,10 @@
 import sys
 from pathlib import Path
 
+import metrics
+from common import open_output
+from domain_trie import DomainTrie
+
 class AdGuardProcessor:
     def __init__(self):
         # 初始化计数器用于生成报告
@@ -9,14 +13,13 @@ class AdGuardProcessor:
         self.filtered_count = 0
 
     def process_blacklist(self, black_path, white_path, output_path):
-        """处理黑名单并应用白名单过滤"""
-        # 读取白名单规则
-        white_domains = self._load_white_domains(white_path)
-        self.total_white = len(white_domains)
+        """处理黑名单并应用白名单过滤（单次流式遍历dns.txt）"""
+        # 读取白名单规则，建立域名后缀索引
+        white_index = self._load_white_domains(white_path)
         
         # 处理黑名单并过滤
         with open(black_path, 'r', encoding='utf-8') as black_file, \
-             open(output_path, 'w', encoding='utf-8') as out_file:
+             open_output(output_path) as out_file:
             
             for line in black_file:
                 line = line.strip()
@@ -25,28 +28,51 @@ class AdGuardProcessor:
                 self.total_black += 1
                 
                 # 检查是否在白名单中
-                if not self._is_whitelisted(line, white_domains):
+                if not self._is_whitelisted(line, white_index):
                     out_file.write(line + '\n')
                     self.filtered_count += 1
 
+    @staticmethod
+    def _split_rule(rule):
+        """拆分 ||domain^$modifiers，返回 (域名, 是否$important)，非域名规则返回 (None, False)"""
+        if not rule.startswith('||'):
+            return None, False
+        end = rule.find('^', 2)
+        if end <= 2:
+            return None, False
+        tail = rule[end + 1:]
+        if tail and not tail.startswith('$'):
+            return None, False
+        return rule[2:end], 'important' in tail[1:].split(',')
+
     def _load_white_domains(self, white_path):
-        """加载白名单域名"""
-        domains = set()
+        """加载白名单域名（@@||domain.com^ 与 @@||domain.com^$important）"""
+        index = DomainTrie()
         with open(white_path, 'r', encoding='utf-8') as f:
             for line in f:
                 line = line.strip()
-                if line.startswith('@@||') and line.endswith('^'):
-                    # 提取 @@||domain.com^ 中的 domain.com
-                    domain = line[2:-1]
-                    domains.add(domain)
-        return domains
+                if not line.startswith('@@'):
+                    continue
+                domain, important = self._split_rule(line[2:])
+                if domain:
+                    index.add_allow(domain, important)
+                    self.total_white += 1
+        return index
 
-    def _is_whitelisted(self, line, white_domains):
-        """检查规则是否命中白名单"""
-        if line.startswith('||') and line.endswith('^'):
-            domain = line[2:-1]
-            return domain in white_domains
-        return False
+    def _is_whitelisted(self, line, white_index):
+        """检查规则是否命中白名单（域名本身或任一上级域名被放行）"""
+        domain, important = self._split_rule(line)
+        if domain is None:
+            return False
+        # $important拦截规则只能被$important白名单放行
+        return white_index.find_allow(domain, important) is not None
+
+    def record_metrics(self, stats):
+        """写入构建指标：被白名单放行的规则计为丢弃"""
+        stats.add_in(self.total_black)
+        stats.keep(self.filtered_count)
+        stats.drop("whitelisted", self.total_black - self.filtered_count)
+        stats.set("white_rules", self.total_white)
 
     def generate_report(self):
         """生成处理报告（新增此方法）"""
@@ -58,6 +84,10 @@ class AdGuardProcessor:
         )
 
 def main():
+    with metrics.stage("filter-ad") as stats:
+        filter_rules(stats)
+
+def filter_rules(stats):
     try:
         processor = AdGuardProcessor()
         
@@ -77,6 +107,7 @@ def main():
         
         # 调用生成报告的方法
         print(processor.generate_report())
+        processor.record_metrics(stats)
         sys.exit(0)
     except Exception as e:
         print(f"::error::🚨 处理失败: {str(e)}")
@@ -0,0 +1,73 @@
+# EasyAds/data/python/utils/fingerprint.py
+"""64位指纹开放寻址表：只保存每行的哈希指纹和一个整数值，用于低内存的重复行统计
+
+与 set[str] 相比不保存字符串本身，每个槽位固定12字节（8字节指纹 + 4字节无符号值），装载因子不超过1/2。
+指纹取自Python内置的字符串哈希（SipHash，进程内稳定），不同字符串指纹相同的概率约为 n²/2⁶⁵，
+15万行时约为 6e-10；需要精确结果的场合（如输出重复行示例）应回读原文确认。
+"""
+from array import array
+
+EMPTY = 0
+MIN_CAPACITY = 1 << 16
+
+def fingerprint(line: str) -> int:
+    """返回非零的64位有符号指纹（0保留为空槽标记）"""
+    return hash(line) or 1
+
+class FingerprintTable:
+    """线性探测的指纹 -> 值 映射"""
+
+    def __init__(self, capacity: int = MIN_CAPACITY):
+        size = MIN_CAPACITY
+        while size < capacity * 2:
+            size <<= 1
+        self._alloc(size)
+        self._len = 0
+
+    def _alloc(self, size: int) -> None:
+        self._mask = size - 1
+        self._fps = array('q', [EMPTY]) * size
+        self._values = array('I', [0]) * size
+
+    def __len__(self) -> int:
+        return self._len
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._fps) * 8 + len(self._values) * self._values.itemsize
+
+    def add(self, fp: int, value: int) -> int:
+        """
+        插入指纹；已存在时不覆盖
+
+        :param value: 0 ~ 2³²-1 的整数（如行号）
+        :return: 新插入返回 -1，已存在返回首次插入时的值
+        """
+        fps, mask = self._fps, self._mask
+        i = fp & mask
+        while True:
+            slot = fps[i]
+            if slot == EMPTY:
+                break
+            if slot == fp:
+                return self._values[i]
+            i = (i + 1) & mask
+        fps[i] = fp
+        self._values[i] = value
+        self._len += 1
+        if self._len * 2 > mask:
+            self._grow()
+        return -1
+
+    def _grow(self) -> None:
+        old_fps, old_values = self._fps, self._values
+        self._alloc(len(old_fps) * 2)
+        fps, values, mask = self._fps, self._values, self._mask
+        for fp, value in zip(old_fps, old_values):
+            if fp == EMPTY:
+                continue
+            i = fp & mask
+            while fps[i] != EMPTY:
+                i = (i + 1) & mask
+            fps[i] = fp
+            values[i] = value
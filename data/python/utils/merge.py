@@ -3,12 +3,21 @@ import os
 import shutil
 from pathlib import Path
 from datetime import datetime
+from collections import Counter
+from typing import Iterable, Iterator, Optional, Tuple
+
+import metrics
+from dedup import dedup_file
+from shards import ShardCache
+from rule_ir import FLAG_ALLOW, FLAG_REDUNDANT, KIND_DOMAIN, parse_rule, write_ir
+from domain_trie import PRUNE_SUBDOMAINS, find_redundant
 
 # 路径计算（与dl.py保持一致，确保文件能被找到）
 SCRIPT_DIR = Path(__file__).resolve().parent  # 脚本所在目录：data/python/utils
 ROOT_DIR = SCRIPT_DIR.parent.parent.parent    # 项目根目录：EasyAds/
 TMP_DIR = ROOT_DIR / "tmp"                    # 临时目录（与dl.py的输出目录一致）
 TARGET_DIR = ROOT_DIR                         # 目标目录：根目录（满足验证步骤）
+IR_PATH = TMP_DIR / "adblock.ir"              # 二进制中间格式，供后续阶段mmap读取
 
 # 规则匹配模式（保持不变）
 ALLOW_PATTERN = re.compile(
@@ -30,45 +39,139 @@ def log(message: str):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     print(f"[{timestamp}] [MERGE] {message}")
 
-def clean_rules(content: str, pattern: re.Pattern) -> str:
-    """清理规则内容，保留有效规则"""
-    content = re.sub(r'^[!#].*$\n?', '', content, flags=re.MULTILINE)  # 移除注释
-    valid_lines = [
-        line for line in content.splitlines()
-        if line.strip() and pattern.search(line.strip())
-    ]
-    return '\n'.join(valid_lines)
-
-def extract_allow_rules_from_block(content: str) -> str:
-    """从黑名单中提取白名单规则"""
-    allow_lines = [
-        line.strip() for line in content.splitlines()
-        if line.strip().startswith('@@') and ALLOW_PATTERN.search(line.strip())
-    ]
-    return '\n'.join(allow_lines)
-
-def deduplicate_file(filepath: Path):
-    """去重文件内容（保留顺序，忽略大小写）"""
-    if not filepath.exists():
-        log(f"去重失败：文件不存在 {filepath}")
-        return
-    
-    with open(filepath, 'r+', encoding='utf-8') as f:
-        seen = set()
-        unique_lines = []
+COMMENT_PREFIXES = ('!', '#')
+READ_BUFFER = 1 << 20  # 逐行读取的缓冲区大小
+
+def iter_lines(paths: Iterable[Path]) -> Iterator[str]:
+    """逐个文件按行读取（不含换行符），不把整个文件读入内存"""
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', errors='ignore', buffering=READ_BUFFER) as f:
+            for line in f:
+                yield line.rstrip('\n')
+
+def classify_lines(
+    lines: Iterable[str],
+    pattern: re.Pattern,
+    dropped: Optional[Counter] = None,
+    extract_allow: bool = False,
+) -> Iterator[Tuple[bool, str]]:
+    """
+    逐行分类规则，每行只处理一次，产出 (是否为白名单, 规则)
+
+    :param pattern: 有效规则的匹配模式，匹配的行原样产出
+    :param dropped: 传入时按原因累计被丢弃的行数（comment/blank/invalid）
+    :param extract_allow: 为True时把 @@ 开头的白名单规则去除首尾空白后单独产出
+    """
+    if dropped is None:
+        dropped = Counter()
+    for raw in lines:
+        is_comment = raw.startswith(COMMENT_PREFIXES)
+        if is_comment:
+            dropped["comment"] += 1
+        # 行内可能含有 \x85、\u2028 等换行符，与 str.splitlines 的拆分保持一致
+        for line in raw.splitlines() or ('',):
+            stripped = line.strip()
+            if extract_allow and stripped.startswith('@@') and ALLOW_PATTERN.search(stripped):
+                yield True, stripped
+            elif is_comment:
+                continue
+            elif not stripped:
+                dropped["blank"] += 1
+            elif pattern.search(stripped):
+                yield False, line
+            else:
+                dropped["invalid"] += 1
+
+def clean_rules(lines: Iterable[str], pattern: re.Pattern, dropped: Optional[Counter] = None) -> Iterator[str]:
+    """流式清理规则，只产出匹配 pattern 的有效行（保留原样）"""
+    return (line for _, line in classify_lines(lines, pattern, dropped))
+
+# 每个规则源的分类结果按内容哈希缓存（源内已按忽略大小写去重），未变化的规则源不再重新解析
+BLOCK_SHARDS = ShardCache("merge-block", version=1, streams=("block", "allow"))
+ALLOW_SHARDS = ShardCache("merge-allow", version=1, streams=("allow",))
+
+def _write_shard(rules: Iterable[Tuple[bool, str]], outputs: dict, dropped: Counter) -> None:
+    """按白名单/拦截分流写入分片，各流内去重（忽略大小写，保留首次出现）"""
+    seen = {stream: set() for stream in outputs}
+    for is_allow, line in rules:
+        stream = "allow" if is_allow else "block"
+        key = line.lower()
+        if key in seen[stream]:
+            dropped["duplicate"] += 1
+            continue
+        seen[stream].add(key)
+        outputs[stream].write(line + '\n')
+
+def build_block_shard(path: Path, outputs: dict) -> dict:
+    """解析单个拦截规则源：拦截规则与其中的 @@ 白名单规则分别写入分片"""
+    dropped = Counter()
+    _write_shard(classify_lines(iter_lines([path]), BLOCK_PATTERN, dropped, extract_allow=True),
+                 outputs, dropped)
+    return dict(dropped)
+
+def build_allow_shard(path: Path, outputs: dict) -> dict:
+    """解析单个白名单规则源"""
+    dropped = Counter()
+    _write_shard(((True, line) for line in clean_rules(iter_lines([path]), ALLOW_PATTERN, dropped)),
+                 outputs, dropped)
+    return dict(dropped)
+
+def prune_redundant_rules(filepath: Path) -> list:
+    """
+    裁剪已被上级域名覆盖的 ||子域名^ 规则，并返回完整规则的IR记录
+
+    上级规则之下存在白名单时不裁剪；被裁剪的规则在IR中保留并标记，
+    供hosts等精确匹配格式继续使用。文件流式读取两遍，不整体载入内存
+    """
+    records = []
+    with open(filepath, 'r', encoding='utf-8', buffering=READ_BUFFER) as f:
         for line in f:
-            if not line.strip():
+            rec = parse_rule(line)
+            if rec is not None:
+                records.append(rec)
+
+    redundant = set()
+    if PRUNE_SUBDOMAINS:
+        blocks = {rec[0] for rec in records
+                  if rec[1] == KIND_DOMAIN and not rec[2] & FLAG_ALLOW and rec[3] in ("", "$important")}
+        allows = {rec[0] for rec in records
+                  if rec[1] == KIND_DOMAIN and rec[2] & FLAG_ALLOW}
+        redundant = find_redundant(blocks, allows)
+    if not redundant:
+        log("子域名冗余裁剪：移除 0 条已被上级域名覆盖的规则")
+        return records
+
+    # 只裁剪不带修饰符的拦截规则（||域名^），带修饰符的规则语义不同
+    records = [(domain, kind, flags | FLAG_REDUNDANT, tail)
+               if domain in redundant and kind == KIND_DOMAIN and not flags & FLAG_ALLOW and tail == ""
+               else (domain, kind, flags, tail)
+               for domain, kind, flags, tail in records]
+
+    removed = 0
+    temp_path = filepath.with_name(filepath.name + ".tmp")
+    with open(filepath, 'r', encoding='utf-8', buffering=READ_BUFFER) as in_f, \
+         open(temp_path, 'w', encoding='utf-8', buffering=READ_BUFFER) as out_f:
+        for line in in_f:
+            rule = line.strip()
+            if rule.startswith('||') and rule.endswith('^') and rule[2:-1] in redundant:
+                removed += 1
                 continue
-            lower_line = line.lower()
-            if lower_line not in seen:
-                seen.add(lower_line)
-                unique_lines.append(line)
-        f.seek(0)
-        f.writelines(unique_lines)
-        f.truncate()
-    log(f"已去重：{filepath}（{len(unique_lines)} 条规则）")
+            out_f.write(line)
+    temp_path.replace(filepath)
+    log(f"子域名冗余裁剪：移除 {removed} 条已被上级域名覆盖的规则")
+    return records
 
-def main():
+def deduplicate_file(filepath: Path) -> int:
+    """去重文件内容（保留顺序，忽略大小写），返回移除的重复行数"""
+    if not filepath.exists():
+        log(f"去重失败：文件不存在 {filepath}")
+        return 0
+
+    kept, duplicates = dedup_file(filepath, ignore_case=True, skip_blank=True)
+    log(f"已去重：{filepath}（{kept} 条规则）")
+    return duplicates
+
+def merge_rules(stats: metrics.StageMetrics):
     try:
         # 打印路径调试信息（关键）
         log(f"项目根目录：{ROOT_DIR}")
@@ -87,74 +190,81 @@ def main():
             return  # 不再直接终止，让后续验证步骤处理
         log(f"找到 {len(adblock_files)} 个拦截规则文件")
 
-        # 2. 合并adblock规则
-        combined_adblock = TMP_DIR / "combined_adblock.txt"
-        with open(combined_adblock, 'w', encoding='utf-8', errors='ignore') as out_f:
-            for file in adblock_files:
-                with open(file, 'r', encoding='utf-8', errors='ignore') as in_f:
-                    out_f.write(in_f.read() + '\n')
-        log(f"已合并拦截规则到 {combined_adblock.name}")
-
-        # 3. 处理黑名单
-        with open(combined_adblock, 'r', encoding='utf-8', errors='ignore') as f:
-            block_content = f.read()
-        extracted_allow = extract_allow_rules_from_block(block_content)
-        cleaned_block = clean_rules(block_content, BLOCK_PATTERN)
-        
-        cleaned_block_path = TMP_DIR / "cleaned_adblock.txt"
-        with open(cleaned_block_path, 'w', encoding='utf-8') as f:
-            f.write(cleaned_block)
-        log(f"清理后黑名单：{len(cleaned_block.splitlines())} 条规则")
-
-        # 4. 查找白名单规则文件（兼容dl.py的命名：allow*.txt）
+        adblock_target = TARGET_DIR / "adblock.txt"
+        allow_target = TARGET_DIR / "allow.txt"
+        cleaned_allow_path = TMP_DIR / "cleaned_allow.txt"
         allow_files = list(TMP_DIR.glob("allow*.txt"))
-        combined_allow_content = extracted_allow  # 先加入从黑名单提取的规则
         if allow_files:
             log(f"找到 {len(allow_files)} 个白名单规则文件")
-            combined_allow = TMP_DIR / "combined_allow.txt"
-            with open(combined_allow, 'w', encoding='utf-8', errors='ignore') as out_f:
-                for file in allow_files:
-                    with open(file, 'r', encoding='utf-8', errors='ignore') as in_f:
-                        out_f.write(in_f.read() + '\n')
-            with open(combined_allow, 'r', encoding='utf-8', errors='ignore') as f:
-                combined_allow_content += '\n' + f.read()
         else:
             log("警告：未找到allow*.txt，仅使用从黑名单提取的白名单规则")
 
-        # 5. 清理白名单
-        cleaned_allow = clean_rules(combined_allow_content, ALLOW_PATTERN)
-        cleaned_allow_path = TMP_DIR / "cleaned_allow.txt"
-        with open(cleaned_allow_path, 'w', encoding='utf-8') as f:
-            f.write(cleaned_allow)
-        log(f"清理后白名单：{len(cleaned_allow.splitlines())} 条规则")
+        # 2. 逐个规则源取得分片（内容未变化时复用缓存，否则流式解析并写入缓存）
+        BLOCK_SHARDS.start_run()
+        ALLOW_SHARDS.start_run()
+        block_shards = [BLOCK_SHARDS.get(file, build_block_shard) for file in adblock_files]
+        allow_shards = [ALLOW_SHARDS.get(file, build_allow_shard) for file in allow_files]
+        reused = BLOCK_SHARDS.hits + ALLOW_SHARDS.hits
+        parsed = BLOCK_SHARDS.misses + ALLOW_SHARDS.misses
+        log(f"规则源分片：复用 {reused} 个，重新解析 {parsed} 个")
+        dropped = Counter()
+        for shard in block_shards + allow_shards:
+            dropped.update(shard.counts)
 
-        # 6. 生成最终文件到根目录（满足验证步骤）
-        adblock_target = TARGET_DIR / "adblock.txt"
-        allow_target = TARGET_DIR / "allow.txt"
+        # 3. 按规则源顺序拼接分片：拦截规则写入adblock.txt，白名单（先黑名单中提取的，再白名单文件）写入临时白名单
+        with open(adblock_target, 'wb') as block_f, open(cleaned_allow_path, 'wb') as allow_f:
+            for shard in block_shards:
+                with open(shard.stream_path("block"), 'rb') as in_f:
+                    shutil.copyfileobj(in_f, block_f, READ_BUFFER)
+            for shard in block_shards + allow_shards:
+                with open(shard.stream_path("allow"), 'rb') as in_f:
+                    shutil.copyfileobj(in_f, allow_f, READ_BUFFER)
+        block_count = sum(shard.count("block") for shard in block_shards)
+        allow_count = sum(shard.count("allow") for shard in block_shards + allow_shards)
+        log(f"清理后黑名单：{block_count} 条规则")
+        log(f"清理后白名单：{allow_count} 条规则")
+        stats.add_in(block_count + allow_count + sum(dropped.values()))
+        stats.set("shards_reused", reused)
+        stats.set("shards_parsed", parsed)
+        BLOCK_SHARDS.prune()
+        ALLOW_SHARDS.prune()
 
-        # 写入最终文件（即使内容为空，也生成文件避免验证失败）
-        with open(cleaned_block_path, 'a', encoding='utf-8') as f:
-            f.write('\n' + cleaned_allow)  # 黑名单追加白名单
-        shutil.copy2(cleaned_block_path, adblock_target)
+        # 4. 生成最终文件到根目录：黑名单之后追加白名单（即使内容为空，也生成文件避免验证失败）
+        with open(adblock_target, 'ab') as out_f, open(cleaned_allow_path, 'rb') as in_f:
+            shutil.copyfileobj(in_f, out_f, READ_BUFFER)
+        log(f"adblock.txt：黑名单 {block_count} 条 + 白名单 {allow_count} 条 = {block_count + allow_count} 条（去重前）")
+        shutil.copyfile(cleaned_allow_path, allow_target)
+        log(f"已生成根目录文件：{adblock_target} 和 {allow_target}")
 
-        with open(cleaned_allow_path, 'r', encoding='utf-8') as f:
-            allow_content = f.read()
-        with open(allow_target, 'w', encoding='utf-8') as f:
-            f.write(allow_content)
+        # 5. 去重
+        dropped["duplicate"] += deduplicate_file(adblock_target)
+        allow_duplicates = deduplicate_file(allow_target)
 
-        log(f"已生成根目录文件：{adblock_target} 和 {allow_target}")
+        # 6. 裁剪子域名冗余规则，并生成二进制中间格式（排序去重后的完整规则表）
+        records = prune_redundant_rules(adblock_target)
+        dropped["redundant"] += sum(1 for rec in records if rec[2] & FLAG_REDUNDANT)
+        ir_count = write_ir(records, IR_PATH, source_path=adblock_target)
+        log(f"已生成规则IR：{IR_PATH.name}（{ir_count} 条记录）")
 
-        # 7. 去重
-        deduplicate_file(adblock_target)
-        deduplicate_file(allow_target)
+        with open(adblock_target, 'r', encoding='utf-8') as f:
+            stats.keep(sum(1 for line in f if line.strip()))
+        for reason, count in dropped.items():
+            stats.drop(reason, count)
+        stats.set("allow_rules", allow_count - allow_duplicates)
+        stats.set("ir_records", ir_count)
 
         log("所有处理完成！")
 
     except Exception as e:
         log(f"处理失败：{str(e)}")
+        stats.set("error", str(e))
         # 即使出错，也生成空文件避免验证步骤报错
         (TARGET_DIR / "adblock.txt").touch()
         (TARGET_DIR / "allow.txt").touch()
 
+def main():
+    with metrics.stage("merge") as stats:
+        merge_rules(stats)
+
 if __name__ == "__main__":
     main()
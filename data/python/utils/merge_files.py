@@ -3,6 +3,9 @@ import logging
 from pathlib import Path
 from typing import List, Optional
 
+from extsort import make_sorter
+from dedup import dedup_file
+
 # 配置日志系统
 logging.basicConfig(
     level=logging.INFO,
@@ -136,24 +139,22 @@ def extract_allow_lines(
             out_f.writelines(allow_lines)
         logger.debug(f"已将 {len(allow_lines)} 行允许规则追加到合并文件")
         
-        # 提取所有@开头的规则
-        lines: List[str] = []
-        try:
-            with adblock_combined_file.open('r', encoding='utf-8') as f:
-                lines = [line for line in f if line.startswith('@')]
-        except UnicodeDecodeError:
-            with adblock_combined_file.open('r', encoding=encoding_fallback) as f:
-                lines = [line for line in f if line.startswith('@')]
-        
-        # 去重并排序
-        unique_lines = sorted(set(lines))
-        
-        # 写入结果
-        allow_output_file.parent.mkdir(parents=True, exist_ok=True)
-        with allow_output_file.open('w', encoding='utf-8') as f:
-            f.writelines(unique_lines)
-        
-        logger.info(f"已提取 {len(unique_lines)} 条允许规则到 {allow_output_file.name}")
+        # 提取所有@开头的规则（边读边送入排序器去重）
+        with make_sorter(adblock_combined_file.parent / 'sort') as unique_lines:
+            try:
+                with adblock_combined_file.open('r', encoding='utf-8') as f:
+                    unique_lines.update(line for line in f if line.startswith('@'))
+            except UnicodeDecodeError:
+                unique_lines.clear()
+                with adblock_combined_file.open('r', encoding=encoding_fallback) as f:
+                    unique_lines.update(line for line in f if line.startswith('@'))
+            
+            # 写入结果（排序器按顺序输出）
+            allow_output_file.parent.mkdir(parents=True, exist_ok=True)
+            with allow_output_file.open('w', encoding='utf-8') as f:
+                f.writelines(unique_lines)
+            
+            logger.info(f"已提取 {len(unique_lines)} 条允许规则到 {allow_output_file.name}")
         
     except IOError as e:
         logger.error(f"文件操作错误: {str(e)}", exc_info=True)
@@ -200,28 +201,14 @@ def deduplicate_txt_files(target_dir: Path, encoding_fallback: str = 'latin-1')
     """
     try:
         for file in target_dir.glob('*.txt'):
-            # 读取文件内容
-            lines: List[str] = []
             try:
-                with file.open('r', encoding='utf-8') as f:
-                    lines = f.readlines()
+                kept, duplicates = dedup_file(file, ignore_case=False, skip_blank=False)
             except UnicodeDecodeError:
-                with file.open('r', encoding=encoding_fallback) as f:
-                    lines = f.readlines()
-            
-            # 去重并保持顺序
-            seen = set()
-            unique_lines = []
-            for line in lines:
-                if line not in seen:
-                    seen.add(line)
-                    unique_lines.append(line)
-            
-            # 只在有变化时写入
-            if len(unique_lines) != len(lines):
-                with file.open('w', encoding='utf-8') as f:
-                    f.writelines(unique_lines)
-                logger.debug(f"已去重 {file.name}: 原{len(lines)}行 -> 现{len(unique_lines)}行")
+                kept, duplicates = dedup_file(file, ignore_case=False, skip_blank=False,
+                                              encoding=encoding_fallback)
+
+            if duplicates:
+                logger.debug(f"已去重 {file.name}: 原{kept + duplicates}行 -> 现{kept}行")
             else:
                 logger.debug(f"{file.name} 无重复行，无需处理")
         
@@ -0,0 +1,170 @@
+# EasyAds/data/python/utils/metrics.py
+"""构建指标：记录每个阶段的耗时、CPU时间、内存峰值以及规则的输入/保留/丢弃数量
+
+用法：
+    with metrics.stage("merge") as m:
+        m.add_in(n)
+        m.keep(n)
+        m.drop("duplicate", n)
+
+每个阶段结束时写入 tmp/metrics/<阶段>.json，collect() 汇总为 tmp/build-metrics.json。
+stage() 可重入：流水线已为某阶段计时时，脚本内部取得的是同一个记录对象。
+设置 EASYADS_TRACEMALLOC=1 时额外记录 tracemalloc 峰值（会明显拖慢执行）。
+"""
+import os
+import sys
+import json
+import time
+import resource
+import tracemalloc
+from pathlib import Path
+from datetime import datetime
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+SCRIPT_DIR = Path(__file__).resolve().parent  # data/python/utils
+ROOT_DIR = SCRIPT_DIR.parent.parent.parent    # 项目根目录
+METRICS_DIR = ROOT_DIR / "tmp" / "metrics"
+BUILD_METRICS_PATH = ROOT_DIR / "tmp" / "build-metrics.json"
+TRACEMALLOC = os.environ.get("EASYADS_TRACEMALLOC", "0") == "1"
+
+class StageMetrics:
+    """单个阶段的指标记录"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lines_in = 0
+        self.kept = 0
+        self.dropped: Counter = Counter()
+        self.extra: Dict = {}
+
+    def add_in(self, n: int = 1) -> None:
+        self.lines_in += n
+
+    def keep(self, n: int = 1) -> None:
+        self.kept += n
+
+    def drop(self, reason: str, n: int = 1) -> None:
+        if n:
+            self.dropped[reason] += n
+
+    def set(self, key: str, value) -> None:
+        """记录阶段特有的附加数值"""
+        self.extra[key] = value
+
+    def to_dict(self) -> Dict:
+        return {
+            "lines_in": self.lines_in,
+            "kept": self.kept,
+            "dropped": dict(self.dropped),
+            **self.extra,
+        }
+
+_active: Dict[str, StageMetrics] = {}
+
+def _reset_peak_rss() -> bool:
+    """重置进程的RSS峰值（Linux），失败时返回False，峰值退化为进程生命周期内的最大值"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux单位为KB，macOS为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+@contextmanager
+def stage(name: str) -> Iterator[StageMetrics]:
+    """记录一个阶段；阶段结束（包括异常退出）时写出指标文件"""
+    if name in _active:
+        yield _active[name]
+        return
+
+    record = _active[name] = StageMetrics(name)
+    started_at = datetime.now().isoformat(timespec="seconds")
+    rss_reset = _reset_peak_rss()
+    tracing = TRACEMALLOC and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    wall, cpu = time.perf_counter(), time.process_time()
+    status = "ok"
+    try:
+        yield record
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            status = "failed"
+        raise
+    except BaseException:
+        status = "failed"
+        raise
+    finally:
+        result = {
+            "stage": name,
+            "status": status,
+            "started_at": started_at,
+            "wall_s": round(time.perf_counter() - wall, 3),
+            "cpu_s": round(time.process_time() - cpu, 3),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "peak_rss_scope": "stage" if rss_reset else "process",
+        }
+        if tracing:
+            result["tracemalloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+            tracemalloc.stop()
+        result.update(record.to_dict())
+        del _active[name]
+        _write_stage(result)
+
+def _write_stage(result: Dict) -> None:
+    try:
+        METRICS_DIR.mkdir(parents=True, exist_ok=True)
+        path = METRICS_DIR / f"{result['stage']}.json"
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        temp_path.replace(path)
+    except OSError as e:
+        print(f"[METRICS] 写入指标失败 {result['stage']}: {str(e)}", file=sys.stderr)
+
+def collect(output_path: Path = BUILD_METRICS_PATH, extra: Optional[Dict] = None) -> Dict:
+    """汇总所有阶段的指标文件，写出 build-metrics.json"""
+    stages = []
+    if METRICS_DIR.exists():
+        for path in METRICS_DIR.glob("*.json"):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    stages.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    stages.sort(key=lambda s: (s.get("started_at", ""), s.get("stage", "")))
+
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "stages": stages,
+        "totals": {
+            "wall_s": round(sum(s.get("wall_s", 0) for s in stages), 3),
+            "cpu_s": round(sum(s.get("cpu_s", 0) for s in stages), 3),
+            "peak_rss_mb": max((s.get("peak_rss_mb", 0) for s in stages), default=0),
+            "failed": [s["stage"] for s in stages if s.get("status") != "ok"],
+        },
+        **(extra or {}),
+    }
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    return report
+
+if __name__ == "__main__":
+    report = collect()
+    print(f"已汇总 {len(report['stages'])} 个阶段的指标: {BUILD_METRICS_PATH}")
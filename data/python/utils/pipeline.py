@@ -0,0 +1,202 @@
+# EasyAds/data/python/utils/pipeline.py
+"""规则更新流水线：按依赖关系调度各脚本，相互独立的生成阶段在进程池中并行执行
+
+用法：
+    python data/python/utils/pipeline.py              运行全部阶段
+    python data/python/utils/pipeline.py qx loon      只运行指定阶段（其依赖需已产出）
+
+环境变量 EASYADS_PIPELINE_WORKERS 控制并行进程数（默认CPU核数）。
+各阶段之间通过merge.py写出的IR文件（tmp/adblock.ir，mmap只读共享）传递规则集，
+不再由每个脚本各自重新解析文本。
+"""
+import os
+import sys
+import time
+import importlib.util
+from pathlib import Path
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Optional
+
+import metrics
+
+SCRIPT_DIR = Path(__file__).resolve().parent  # data/python/utils
+PYTHON_DIR = SCRIPT_DIR.parent                # data/python
+ROOT_DIR = PYTHON_DIR.parent.parent           # 项目根目录
+MAX_WORKERS = int(os.environ.get("EASYADS_PIPELINE_WORKERS", "0")) or os.cpu_count() or 1
+
+# 阶段注册表
+# 键: 阶段名, 值: 脚本路径（相对data/python）、依赖阶段、需要产出的文件，以及失败是否中止流水线
+STAGES: Dict[str, Dict] = {
+    "dl": {"script": "utils/dl.py", "deps": [], "outputs": ["tmp"]},
+    "merge": {"script": "utils/merge.py", "deps": ["dl"], "outputs": ["adblock.txt", "allow.txt"]},
+    "filter-dns": {"script": "rules_generator/filter-dns.py", "deps": ["merge"], "outputs": ["dns.txt"]},
+    # 以下阶段读取filter-dns生成的dns.txt
+    "filter-ad": {"script": "utils/filter-ad.py", "deps": ["filter-dns"], "outputs": ["adblock-filtered.txt"]},
+    "domain_list": {"script": "rules_generator/domain_list.py", "deps": ["filter-dns"], "outputs": ["domain_list.txt"]},
+    "qx": {"script": "rules_generator/qx.py", "deps": ["filter-dns"], "outputs": ["qx.list"]},
+    "loon": {"script": "rules_generator/loon.py", "deps": ["filter-dns"], "outputs": ["loon.list"]},
+    "mihomo": {"script": "rules_generator/mihomo.py", "deps": ["filter-ad"], "outputs": ["adb.mrs"]},
+    # 单次遍历同时输出Clash/Shadowrocket/Singbox/Invizible/Hosts/AdClose
+    "domain_emitter": {"script": "rules_generator/domain_emitter.py", "deps": ["merge"], "outputs": []},
+    # title.py会改写adblock.txt的头部，必须在所有读取它的阶段之后执行
+    "title": {
+        "script": "utils/title.py",
+        "deps": ["filter-dns", "filter-ad", "domain_list", "qx", "loon", "mihomo", "domain_emitter"],
+        "outputs": [],
+    },
+    "clean-readme": {"script": "utils/clean-readme.py", "deps": ["title"], "outputs": []},
+    # 与上一次构建对比，输出 adblock.txt/hosts.txt/Clash.yaml 的增量补丁；失败时仍发布完整文件
+    "delta": {"script": "utils/delta.py", "deps": ["title"], "outputs": ["delta/index.json"], "optional": True},
+    # 为所有输出生成 .gz/.br/.zst 预压缩版本（dist/，不提交），必须在所有输出写完之后执行
+    "compress": {
+        "script": "utils/compress.py",
+        "deps": ["title", "delta"],
+        "outputs": ["dist/compressed.json"],
+        "optional": True,
+    },
+}
+
+def log(message: str):
+    """带时间戳的日志输出"""
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{timestamp}] [PIPELINE] {message}", flush=True)
+
+def load_script(script: str):
+    """加载脚本模块（脚本名含连字符时按文件路径加载）"""
+    path = PYTHON_DIR / script
+    if str(path.parent) not in sys.path:
+        sys.path.insert(0, str(path.parent))
+    if path.stem.isidentifier():
+        # 按模块名导入，脚本中提交到进程池的函数才能在工作进程中按名称找到
+        return importlib.import_module(path.stem)
+    name = "easyads_" + path.stem.replace("-", "_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def run_stage(name: str) -> Dict:
+    """在工作进程中执行单个阶段的main()，返回耗时统计"""
+    os.chdir(ROOT_DIR)
+    wall, cpu = time.perf_counter(), time.process_time()
+    ok, detail = True, ""
+    try:
+        # 脚本内部的 metrics.stage() 会取得同一条记录，未埋点的阶段也有耗时与内存数据
+        with metrics.stage(name):
+            load_script(STAGES[name]["script"]).main()
+    except SystemExit as e:
+        ok = e.code in (None, 0)
+        detail = "" if ok else f"退出码 {e.code}"
+    except Exception as e:
+        ok, detail = False, f"{type(e).__name__}: {str(e)}"
+    finally:
+        sys.stdout.flush()
+    return {
+        "ok": ok,
+        "detail": detail,
+        "wall": time.perf_counter() - wall,
+        "cpu": time.process_time() - cpu,
+    }
+
+def check_outputs(name: str) -> Optional[str]:
+    """检查阶段产出，返回缺失说明"""
+    for output in STAGES[name]["outputs"]:
+        path = ROOT_DIR / output
+        if path.is_dir():
+            if not any(path.iterdir()):
+                return f"{output}/ 为空"
+        elif not path.exists():
+            return f"未生成 {output}"
+    return None
+
+def resolve(selected: Optional[List[str]]) -> List[str]:
+    """校验阶段名，返回按注册顺序排列的待执行阶段"""
+    if not selected:
+        return list(STAGES)
+    unknown = [name for name in selected if name not in STAGES]
+    if unknown:
+        raise ValueError(f"未知的阶段: {', '.join(unknown)}")
+    return [name for name in STAGES if name in selected]
+
+def run_pipeline(selected: Optional[List[str]] = None, max_workers: int = MAX_WORKERS) -> Dict[str, Dict]:
+    """
+    按依赖关系调度阶段：依赖全部完成后立即提交到进程池
+
+    未选中的依赖视为已满足；失败阶段的下游阶段会被跳过
+    :return: 各阶段的执行结果
+    """
+    pending = resolve(selected)
+    done, failed, results = set(), set(), {}
+    running = {}
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            for name in list(pending):
+                active = set(pending) | set(running.values()) | done | failed
+                deps = [dep for dep in STAGES[name]["deps"] if dep in active]
+                if any(dep in failed for dep in deps):
+                    pending.remove(name)
+                    failed.add(name)
+                    results[name] = {"ok": False, "detail": "依赖阶段失败，已跳过", "wall": 0.0, "cpu": 0.0}
+                    log(f"跳过 {name}：依赖阶段失败")
+                elif all(dep in done for dep in deps):
+                    pending.remove(name)
+                    running[pool.submit(run_stage, name)] = name
+                    log(f"开始 {name}")
+
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:  # 工作进程异常退出
+                    result = {"ok": False, "detail": f"{type(e).__name__}: {str(e)}", "wall": 0.0, "cpu": 0.0}
+                if result["ok"]:
+                    missing = check_outputs(name)
+                    if missing:
+                        result.update(ok=False, detail=missing)
+                results[name] = result
+                if result["ok"] or STAGES[name].get("optional"):
+                    done.add(name)
+                    status = "完成" if result["ok"] else f"失败（可选阶段，继续）: {result['detail']}"
+                else:
+                    failed.add(name)
+                    status = f"失败: {result['detail']}"
+                log(f"{name} {status}，耗时 {result['wall']:.2f}s（CPU {result['cpu']:.2f}s）")
+
+    total = time.perf_counter() - started
+    log("=" * 50)
+    log(f"{'阶段':<16}{'状态':<8}{'耗时(s)':>10}{'CPU(s)':>10}")
+    for name, result in results.items():
+        status = "成功" if result["ok"] else "失败"
+        log(f"{name:<16}{status:<8}{result['wall']:>10.2f}{result['cpu']:>10.2f}")
+    serial = sum(result["wall"] for result in results.values())
+    log(f"总耗时 {total:.2f}s（各阶段累计 {serial:.2f}s）")
+    log("=" * 50)
+
+    metrics.collect(extra={"pipeline": {
+        "wall_s": round(total, 3),
+        "workers": max_workers,
+        "stages": list(results),
+    }})
+    log(f"构建指标已写入 {metrics.BUILD_METRICS_PATH}")
+    return results
+
+def main():
+    try:
+        results = run_pipeline(sys.argv[1:] or None)
+    except Exception as e:
+        print(f"::error::流水线执行失败: {str(e)}")
+        sys.exit(1)
+    failed = [name for name, result in results.items()
+              if not result["ok"] and not STAGES[name].get("optional")]
+    if failed:
+        print(f"::error::以下阶段失败: {', '.join(failed)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
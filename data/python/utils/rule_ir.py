@@ -0,0 +1,264 @@
+# EasyAds/data/python/utils/rule_ir.py
+"""规则集二进制中间格式（IR），供merge.py之后的各阶段mmap直接读取
+
+文件布局（本机字节序，同一次构建内部使用）：
+    头部 | 域名偏移表 u32[count+1] | 修饰符偏移表 u32[mods+1] | 修饰符索引 u32[count]
+    | 规则类型 u8[count] | 标记位 u8[count] | 域名数据 | 修饰符数据
+各表按4字节对齐，记录按域名排序并去重。
+头部记录源文件规则行的sha256（不含头部、注释和空行），title.py等只改写头部时IR仍然有效。
+"""
+import mmap
+import hashlib
+import struct
+import logging
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"EAIR"
+VERSION = 2
+# magic, version, reserved, count, modifier_count, source_size, source_mtime_ns, source_digest
+# 与 array('I') 各表一致使用本机字节序（"=" 为本机字节序、标准大小、无对齐填充）
+HEADER = struct.Struct("=4sHHIIQq32s")
+READ_BUFFER = 1 << 20
+
+# 规则类型
+KIND_DOMAIN = 0  # ||domain^ 及其后缀（$修饰符等）
+KIND_HOSTS = 1   # 0.0.0.0 domain
+KIND_OTHER = 2   # 其他规则，原样保存在域名字段
+
+# 标记位
+FLAG_ALLOW = 1       # @@ 白名单规则
+FLAG_IMPORTANT = 2   # 带 $important
+FLAG_REDUNDANT = 4   # 已被上级域名规则覆盖（adblock.txt中已裁剪，仅供精确匹配格式使用）
+
+NO_MODIFIER = 0xFFFFFFFF
+
+Record = Tuple[str, int, int, str]
+
+def parse_rule(line: str) -> Optional[Record]:
+    """把单行Adblock规则拆成 (域名, 类型, 标记位, 修饰符)"""
+    line = line.strip()
+    if not line or line.startswith(('!', '#', '[')):
+        return None
+
+    flags = 0
+    if line.startswith('@@'):
+        flags |= FLAG_ALLOW
+        line = line[2:]
+
+    if line.startswith('||'):
+        end = line.find('^')
+        if end > 2:
+            # 修饰符字段保存 ^ 之后的原始内容（如 $important），可据此还原整条规则
+            tail = line[end + 1:]
+            if tail.startswith('$') and 'important' in tail[1:].split(','):
+                flags |= FLAG_IMPORTANT
+            return line[2:end], KIND_DOMAIN, flags, tail
+
+    parts = line.split()
+    if len(parts) == 2 and parts[0].count('.') == 3 and parts[0].replace('.', '').isdigit():
+        return parts[1], KIND_HOSTS, flags, ""
+
+    return line, KIND_OTHER, flags, ""
+
+def rules_digest(source_path: Path) -> bytes:
+    """源文件中规则行（parse_rule会解析的行，去除首尾空白）的sha256，与头部、注释和空行无关"""
+    digest = hashlib.sha256()
+    with open(source_path, 'r', encoding='utf-8', errors='ignore', buffering=READ_BUFFER) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith(('!', '#', '[')):
+                digest.update(line.encode('utf-8'))
+                digest.update(b"\n")
+    return digest.digest()
+
+def _pad(buf: bytearray) -> None:
+    buf.extend(b"\0" * (-len(buf) % 4))
+
+def write_ir(records: Iterable[Record], output_path: Path, source_path: Optional[Path] = None) -> int:
+    """排序去重后写入IR文件，返回记录数"""
+    records = sorted(set(records))
+    modifiers = sorted({mod for _, _, _, mod in records if mod})
+    if len(modifiers) >= NO_MODIFIER:
+        raise ValueError(f"修饰符种类过多: {len(modifiers)}")
+    mod_ids = {mod: i for i, mod in enumerate(modifiers)}
+
+    offsets, mod_offsets = array('I', [0]), array('I', [0])
+    mod_index, kinds, flags = array('I'), bytearray(), bytearray()
+    domain_blob, mod_blob = bytearray(), bytearray()
+
+    for domain, kind, flag, mod in records:
+        domain_blob += domain.encode('utf-8')
+        offsets.append(len(domain_blob))
+        mod_index.append(mod_ids[mod] if mod else NO_MODIFIER)
+        kinds.append(kind)
+        flags.append(flag)
+    for mod in modifiers:
+        mod_blob += mod.encode('utf-8')
+        mod_offsets.append(len(mod_blob))
+
+    source_size, source_mtime, source_digest = 0, 0, b""
+    if source_path is not None:
+        stat = Path(source_path).stat()
+        source_size, source_mtime = stat.st_size, stat.st_mtime_ns
+        source_digest = rules_digest(source_path)
+
+    buf = bytearray(HEADER.pack(MAGIC, VERSION, 0, len(records), len(modifiers),
+                                source_size, source_mtime, source_digest))
+    for section in (offsets.tobytes(), mod_offsets.tobytes(), mod_index.tobytes(),
+                    bytes(kinds), bytes(flags), bytes(domain_blob), bytes(mod_blob)):
+        _pad(buf)
+        buf += section
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output_path.with_suffix(f"{output_path.suffix}.tmp")
+    with open(temp_path, 'wb') as f:
+        f.write(buf)
+    temp_path.replace(output_path)
+    return len(records)
+
+def compile_rules(input_path: Path, output_path: Path) -> int:
+    """解析规则文本并生成IR文件"""
+    with open(input_path, 'r', encoding='utf-8', errors='ignore') as f:
+        records = [rec for rec in map(parse_rule, f) if rec is not None]
+    return write_ir(records, output_path, source_path=input_path)
+
+class CompiledRuleSet:
+    """mmap方式读取IR文件，所有表均为零拷贝的memoryview"""
+
+    def __init__(self, path: Union[Path, str]):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mm)
+
+        (magic, version, _, count, mod_count,
+         self.source_size, self.source_mtime_ns, self.source_digest) = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"无法识别的IR文件: {self.path}")
+        self.count = count
+
+        pos = HEADER.size
+
+        def take(nbytes: int) -> memoryview:
+            nonlocal pos
+            pos += -pos % 4
+            section = view[pos:pos + nbytes]
+            pos += nbytes
+            return section
+
+        self.offsets = take(4 * (count + 1)).cast('I')
+        self.mod_offsets = take(4 * (mod_count + 1)).cast('I')
+        self.mod_index = take(4 * count).cast('I')
+        self.kinds = take(count)
+        self.flags = take(count)
+        self.domain_blob = take(self.offsets[count])
+        self.mod_blob = take(self.mod_offsets[mod_count])
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self) -> "CompiledRuleSet":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for name in ("offsets", "mod_offsets", "mod_index", "kinds", "flags",
+                     "domain_blob", "mod_blob"):
+            section = self.__dict__.pop(name, None)
+            if section is not None:
+                section.release()
+        if not self._mm.closed:
+            try:
+                self._mm.close()
+            except BufferError:
+                pass  # 仍有外部引用的memoryview，交给GC回收
+
+    def is_fresh(self, source_path: Path) -> bool:
+        """
+        判断IR是否与源文件一致
+
+        大小与修改时间均未变化时直接认为一致；否则比较规则行哈希（仅头部被改写时仍然一致）
+        """
+        try:
+            stat = Path(source_path).stat()
+            if (stat.st_size, stat.st_mtime_ns) == (self.source_size, self.source_mtime_ns):
+                return True
+            return rules_digest(source_path) == self.source_digest
+        except OSError:
+            return False
+
+    def domain_bytes(self, i: int) -> memoryview:
+        return self.domain_blob[self.offsets[i]:self.offsets[i + 1]]
+
+    def domain(self, i: int) -> str:
+        return str(self.domain_bytes(i), 'utf-8')
+
+    def modifier(self, i: int) -> str:
+        mod = self.mod_index[i]
+        if mod == NO_MODIFIER:
+            return ""
+        return str(self.mod_blob[self.mod_offsets[mod]:self.mod_offsets[mod + 1]], 'utf-8')
+
+    def records(self) -> Iterator[Record]:
+        for i in range(self.count):
+            yield self.domain(i), self.kinds[i], self.flags[i], self.modifier(i)
+
+    def domain_flags(self, kind: int = KIND_DOMAIN, allow: bool = False,
+                     plain: bool = False) -> Iterator[Tuple[str, int]]:
+        """
+        按排序顺序返回去重后的 (域名, 合并后的标记位)
+
+        :param kind: 规则类型
+        :param allow: True返回白名单规则，False返回拦截规则
+        :param plain: 仅返回不带修饰符的规则
+        """
+        blob, offsets, kinds, flags, mod_index = (
+            self.domain_blob, self.offsets, self.kinds, self.flags, self.mod_index)
+        want_allow = FLAG_ALLOW if allow else 0
+        last, last_flags = None, 0
+        for i in range(self.count):
+            if kinds[i] != kind or (flags[i] & FLAG_ALLOW) != want_allow:
+                continue
+            if plain and mod_index[i] != NO_MODIFIER:
+                continue
+            domain = str(blob[offsets[i]:offsets[i + 1]], 'utf-8')
+            if domain != last:
+                if last is not None:
+                    yield last, last_flags
+                last, last_flags = domain, 0
+            last_flags |= flags[i]
+        if last is not None:
+            yield last, last_flags
+
+    def domains(self, kind: int = KIND_DOMAIN, allow: bool = False,
+                plain: bool = False, redundant: bool = True) -> Iterator[str]:
+        """
+        按排序顺序返回去重后的域名
+
+        :param redundant: 是否包含已被上级域名覆盖的规则
+        """
+        for domain, flag in self.domain_flags(kind, allow, plain):
+            if redundant or not flag & FLAG_REDUNDANT:
+                yield domain
+
+def load_fresh(ir_path: Path, source_path: Path) -> Optional[CompiledRuleSet]:
+    """IR存在且与源文件一致时返回CompiledRuleSet，否则返回None"""
+    if not Path(ir_path).exists():
+        return None
+    try:
+        ruleset = CompiledRuleSet(ir_path)
+    except (OSError, ValueError, struct.error) as e:
+        logger.warning(f"IR文件不可用，回退到文本解析 {ir_path}: {str(e)}")
+        return None
+    if not ruleset.is_fresh(source_path):
+        ruleset.close()
+        return None
+    return ruleset
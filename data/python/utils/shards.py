@@ -0,0 +1,136 @@
+# EasyAds/data/python/utils/shards.py
+"""按规则源内容哈希缓存的解析结果（分片），规则源未变化时直接复用，不再重新解析文本
+
+每个分片是 .cache/shards/<名称>/<源文件sha256> 目录：
+    meta.json      版本、源文件哈希、各输出流行数及解析时的统计数
+    <流名>.txt     解析结果，每行一条规则
+分片与解析代码版本绑定（version），解析逻辑变化时递增版本号即可让旧分片全部失效。
+.cache 随 actions/cache 跨运行保留；每次运行结束时清理本次未用到的分片。
+设置 EASYADS_INCREMENTAL=0 时忽略已有分片，全部重新解析。
+"""
+import os
+import json
+import shutil
+import hashlib
+from pathlib import Path
+from typing import IO, Callable, Dict, Iterator, Sequence
+
+SCRIPT_DIR = Path(__file__).resolve().parent  # data/python/utils
+ROOT_DIR = SCRIPT_DIR.parent.parent.parent    # 项目根目录
+SHARD_ROOT = ROOT_DIR / ".cache" / "shards"
+INCREMENTAL = os.environ.get("EASYADS_INCREMENTAL", "1") != "0"
+HASH_CHUNK = 1 << 20
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class Shard:
+    """单个规则源的解析结果"""
+
+    def __init__(self, path: Path, meta: Dict):
+        self.path = path
+        self.meta = meta
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        """解析时记录的统计数（如 total/comment/blank）"""
+        return self.meta["counts"]
+
+    def __len__(self) -> int:
+        return sum(self.meta["streams"].values())
+
+    def count(self, stream: str) -> int:
+        return self.meta["streams"][stream]
+
+    def stream_path(self, stream: str) -> Path:
+        return self.path / f"{stream}.txt"
+
+    def lines(self, stream: str) -> Iterator[str]:
+        """按写入顺序逐行读取某个输出流（不含换行符）"""
+        with open(self.stream_path(stream), "r", encoding="utf-8") as f:
+            for line in f:
+                yield line[:-1]
+
+# 解析函数：读取源文件，把结果写入各输出流（每行以换行结尾），返回统计数
+Builder = Callable[[Path, Dict[str, IO]], Dict[str, int]]
+
+class ShardCache:
+    """某一解析方式的分片缓存"""
+
+    def __init__(self, name: str, version: int, streams: Sequence[str]):
+        self.dir = SHARD_ROOT / name
+        self.version = version
+        self.streams = tuple(streams)
+        self.start_run()
+
+    def start_run(self) -> None:
+        """开始一次运行：重置命中统计与本次用到的分片记录"""
+        self.hits = 0
+        self.misses = 0
+        self._used = set()
+
+    def _load(self, path: Path, sha256: str):
+        try:
+            with open(path / "meta.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (meta.get("version") != self.version or meta.get("sha256") != sha256
+                or tuple(meta.get("streams", ())) != self.streams):
+            return None
+        if not all((path / f"{stream}.txt").exists() for stream in self.streams):
+            return None
+        return Shard(path, meta)
+
+    def get(self, source: Path, build: Builder) -> Shard:
+        """返回源文件的分片，缓存缺失或已失效时调用 build 重新解析"""
+        sha256 = file_sha256(source)
+        path = self.dir / sha256
+        self._used.add(sha256)
+        if INCREMENTAL:
+            shard = self._load(path, sha256)
+            if shard is not None:
+                self.hits += 1
+                return shard
+
+        self.misses += 1
+        temp = self.dir / f"{sha256}.{os.getpid()}.tmp"
+        shutil.rmtree(temp, ignore_errors=True)
+        temp.mkdir(parents=True)
+        try:
+            outputs = {stream: open(temp / f"{stream}.txt", "w", encoding="utf-8")
+                       for stream in self.streams}
+            try:
+                counts = build(source, outputs)
+            finally:
+                for f in outputs.values():
+                    f.close()
+            streams = {}
+            for stream in self.streams:
+                with open(temp / f"{stream}.txt", "rb") as f:
+                    streams[stream] = sum(1 for _ in f)
+            meta = {"version": self.version, "sha256": sha256, "source": source.name,
+                    "streams": streams, "counts": counts}
+            with open(temp / "meta.json", "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+            shutil.rmtree(path, ignore_errors=True)
+            temp.rename(path)
+        except BaseException:
+            shutil.rmtree(temp, ignore_errors=True)
+            raise
+        return Shard(path, meta)
+
+    def prune(self) -> int:
+        """删除本次运行未用到的分片，返回删除数量"""
+        removed = 0
+        if not self.dir.exists():
+            return removed
+        for path in self.dir.iterdir():
+            if path.name not in self._used:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        return removed
@@ -0,0 +1,161 @@
+# EasyAds/data/python/utils/srs.py
+"""sing-box 二进制规则集（.srs）与JSON源规则集的读写
+
+二进制布局（规则集版本1，兼容 sing-box 1.8 及以上）：
+    "SRS" | 版本 u8 | zlib( 规则数 uvarint | 规则... )
+单条规则：类型 u8(0) | 规则项... | 0xFF | invert u8
+域名规则项：2 | 匹配器版本 u8(1) | leaves | label_bitmap | labels（domain 与 domain_suffix 共用一个匹配器）
+数组均为 uvarint 长度前缀，uint64 按大端序。
+"""
+import io
+import json
+import zlib
+import struct
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import succinct
+from common import open_output
+
+MAGIC = b"SRS"
+VERSION = 1
+RULE_DEFAULT = 0
+ITEM_DOMAIN = 2
+ITEM_FINAL = 0xFF
+MATCHER_VERSION = 1
+PREFIX_LABEL = "\r"  # 版本1：domain_suffix 额外生成 "\r.example.com" 键匹配子域名
+ROOT_LABEL = "\n"    # 版本2及以上：domain_suffix 生成 "\nexample.com" 键
+
+def _reverse(domain: str) -> bytes:
+    return domain[::-1].encode("utf-8")
+
+def domain_keys(domain: Iterable[str] = (), domain_suffix: Iterable[str] = ()) -> List[bytes]:
+    """按sing-box版本1规则生成匹配器的键"""
+    keys = set()
+    for suffix in domain_suffix:
+        if suffix.startswith("."):
+            keys.add(_reverse(PREFIX_LABEL + suffix))
+        else:
+            keys.add(_reverse(suffix))
+            keys.add(_reverse(PREFIX_LABEL + "." + suffix))
+    keys.update(_reverse(name) for name in domain)
+    return sorted(keys)
+
+def _write_uvarint(buf: bytearray, value: int) -> None:
+    while value >= 0x80:
+        buf.append(value & 0x7F | 0x80)
+        value >>= 7
+    buf.append(value)
+
+def _write_words(buf: bytearray, words: List[int]) -> None:
+    _write_uvarint(buf, len(words))
+    buf += succinct.pack_words(words)
+
+def write_srs(output_path: Path, domain_suffix: Iterable[str] = (), domain: Iterable[str] = ()) -> None:
+    """写出只包含一条域名规则的二进制规则集"""
+    keys = domain_keys(domain, domain_suffix)
+    body = bytearray()
+    _write_uvarint(body, 1 if keys else 0)
+    if keys:
+        domain_set = succinct.build(keys)
+        body.append(RULE_DEFAULT)
+        body.append(ITEM_DOMAIN)
+        body.append(MATCHER_VERSION)
+        _write_words(body, domain_set.leaves)
+        _write_words(body, domain_set.label_bitmap)
+        _write_uvarint(body, len(domain_set.labels))
+        body += domain_set.labels
+        body.append(ITEM_FINAL)
+        body.append(0)  # invert = false
+
+    with open_output(output_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack(">B", VERSION))
+        f.write(zlib.compress(bytes(body), zlib.Z_BEST_COMPRESSION))
+
+def write_source(output_path: Path, domain_suffix: Iterable[str] = (), domain: Iterable[str] = ()) -> None:
+    """写出等价的JSON源规则集"""
+    rule = {}
+    domain, domain_suffix = list(domain), list(domain_suffix)
+    if domain:
+        rule["domain"] = domain
+    if domain_suffix:
+        rule["domain_suffix"] = domain_suffix
+    source = {"version": VERSION, "rules": [rule] if rule else []}
+    with open_output(output_path) as f:
+        json.dump(source, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+
+def _read_uvarint(stream: io.BytesIO) -> int:
+    value, shift = 0, 0
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            raise ValueError("规则集数据不完整")
+        value |= (byte[0] & 0x7F) << shift
+        if byte[0] < 0x80:
+            return value
+        shift += 7
+
+def _read_exact(stream: io.BytesIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("规则集数据不完整")
+    return data
+
+def _read_words(stream: io.BytesIO) -> List[int]:
+    count = _read_uvarint(stream)
+    return list(struct.unpack(f">{count}Q", _read_exact(stream, count * 8)))
+
+def split_keys(keys: Iterable[bytes]) -> Tuple[List[str], List[str]]:
+    """把匹配器的键还原为 (domain, domain_suffix)"""
+    names, suffixes = set(), set()
+    for key in keys:
+        name = key.decode("utf-8")[::-1]
+        if name.startswith(PREFIX_LABEL):
+            suffixes.add(name[1:])
+        elif name.startswith(ROOT_LABEL):
+            suffixes.add(name[1:])
+        else:
+            names.add(name)
+    # 版本1中 example.com 与 \r.example.com 成对出现，合并为 domain_suffix example.com
+    paired = {suffix[1:] for suffix in suffixes if suffix.startswith(".") and suffix[1:] in names}
+    suffixes = (suffixes - {"." + name for name in paired}) | paired
+    return sorted(names - paired), sorted(suffixes)
+
+def read_srs(path: Path) -> List[Dict[str, List[str]]]:
+    """读取二进制规则集，返回与JSON源规则集相同结构的规则列表（仅支持域名规则项）"""
+    with open(path, "rb") as f:
+        if f.read(3) != MAGIC:
+            raise ValueError(f"不是sing-box规则集文件: {path}")
+        version = f.read(1)
+        if not version or version[0] < 1:
+            raise ValueError(f"不支持的规则集版本: {path}")
+        stream = io.BytesIO(zlib.decompress(f.read()))
+
+    rules = []
+    for _ in range(_read_uvarint(stream)):
+        if _read_exact(stream, 1)[0] != RULE_DEFAULT:
+            raise ValueError("不支持的规则类型")
+        rule = {}
+        while True:
+            item = _read_exact(stream, 1)[0]
+            if item == ITEM_FINAL:
+                break
+            if item != ITEM_DOMAIN:
+                raise ValueError(f"不支持的规则项: {item}")
+            if _read_exact(stream, 1)[0] != MATCHER_VERSION:
+                raise ValueError("不支持的域名匹配器版本")
+            leaves = _read_words(stream)
+            label_bitmap = _read_words(stream)
+            labels = _read_exact(stream, _read_uvarint(stream))
+            domain, domain_suffix = split_keys(
+                succinct.keys(succinct.SuccinctSet(leaves, label_bitmap, labels)))
+            if domain:
+                rule["domain"] = domain
+            if domain_suffix:
+                rule["domain_suffix"] = domain_suffix
+        if _read_exact(stream, 1)[0]:
+            rule["invert"] = True
+        rules.append(rule)
+    return rules
@@ -0,0 +1,90 @@
+# EasyAds/data/python/utils/succinct.py
+"""简洁（succinct）域名集合，与mihomo / sing-box 使用的 DomainSet 结构一致
+
+键为逆序域名（moc.elpmaxe），按字节序排序后逐层（BFS）展开成 LOUDS 前缀树：
+    leaves       第i个节点是否为某个键的结尾
+    label_bitmap 每个子节点占一个0位，每个节点结束时追加一个1位
+    labels       所有边上的字符，按BFS顺序排列
+位图按 uint64 分组，组内低位在前。
+"""
+import struct
+from typing import Iterable, List, NamedTuple
+
+class SuccinctSet(NamedTuple):
+    leaves: List[int]
+    label_bitmap: List[int]
+    labels: bytes
+
+def _pack_bits(positions: Iterable[int]) -> List[int]:
+    """把置1的位序号转换成 uint64 数组"""
+    words: List[int] = []
+    for i in positions:
+        word = i >> 6
+        if word >= len(words):
+            words.extend([0] * (word + 1 - len(words)))
+        words[word] |= 1 << (i & 63)
+    return words
+
+def build(keys: Iterable[bytes]) -> SuccinctSet:
+    """由键集合构建简洁前缀树（键会被排序去重）"""
+    keys = sorted(set(keys))
+    if not keys:
+        return SuccinctSet([], [], b"")
+
+    leaves, ends, labels = [], [], bytearray()
+    label_index = 0
+    queue = [(0, len(keys), 0)]
+    for i, (start, end, col) in enumerate(queue):
+        if col == len(keys[start]):
+            start += 1  # 排序后最短的键在最前，它在本节点结束
+            leaves.append(i)
+
+        j = start
+        while j < end:
+            first = j
+            label = keys[first][col]
+            while j < end and keys[j][col] == label:
+                j += 1
+            queue.append((first, j, col + 1))
+            labels.append(label)
+            label_index += 1
+        ends.append(label_index)
+        label_index += 1
+
+    return SuccinctSet(_pack_bits(leaves), _pack_bits(ends), bytes(labels))
+
+def pack_words(words: List[int]) -> bytes:
+    """uint64 数组按大端序打包"""
+    return struct.pack(f">{len(words)}Q", *words)
+
+def _unpack_bits(words: List[int]) -> Iterable[bool]:
+    for word in words:
+        for bit in range(64):
+            yield bool(word >> bit & 1)
+
+def keys(domain_set: SuccinctSet) -> List[bytes]:
+    """还原集合中的全部键（按字节序），用于回读校验"""
+    labels = domain_set.labels
+    parents, edges = [0], [0]  # 节点0为根
+    node, zeros = 0, 0
+    for bit in _unpack_bits(domain_set.label_bitmap):
+        if node >= len(parents):
+            break
+        if bit:
+            node += 1
+        else:
+            parents.append(node)
+            edges.append(labels[zeros])
+            zeros += 1
+
+    result = []
+    for i, leaf in enumerate(_unpack_bits(domain_set.leaves)):
+        if not leaf or i >= len(parents):
+            continue
+        key = bytearray()
+        while i:
+            key.append(edges[i])
+            i = parents[i]
+        key.reverse()
+        result.append(bytes(key))
+    return sorted(result)
@@ -1,13 +1,13 @@
 """规则文件头部处理工具"""
-import shutil
 from pathlib import Path
 from datetime import datetime, timedelta
 
+from common import open_output, stamp_line
+
 # 北京时区偏移（UTC+8）
 BEIJING_TZ = timedelta(hours=8)
 HEADER_TEMPLATE = """[Adblock Plus 2.0]
-! 规则更新时间: {timestamp}
-! 有效规则数量: {line_count} 条
+{stamp}! 有效规则数量: {line_count} 条
 ! 项目地址: https://github.com/qq5460168/EasyAds
 ! 请不要删除此头部，用于规则识别和更新
 \n"""
@@ -59,15 +59,13 @@ def process_rule_files(target_files: set, rules_dir: Path) -> None:
             
             # 生成新内容
             new_content = HEADER_TEMPLATE.format(
-                timestamp=get_beijing_time(),
+                stamp=stamp_line(f"! 规则更新时间: {get_beijing_time()}\n"),
                 line_count=line_count
             ) + content
             
-            # 原子写入（避免文件损坏）
-            temp_path = file_path.with_suffix('.tmp')
-            with temp_path.open('w', encoding='utf-8') as f:
+            # 原子写入（避免文件损坏）；规则内容未变化时保留原文件和原更新时间
+            with open_output(file_path) as f:
                 f.write(new_content)
-            shutil.move(temp_path, file_path)
             
             print(f"已处理 {file_name}，有效规则: {line_count} 条")
             
@@ -76,7 +74,10 @@ def process_rule_files(target_files: set, rules_dir: Path) -> None:
         except Exception as e:
             print(f"意外错误（{file_name}）: {str(e)}")
 
+def main():
+    target_files = {'adblock.txt', 'allow.txt', 'clash.txt', 'shadowrocket.txt'}
+    process_rule_files(target_files, Path('./'))
+
 # 示例调用（在主流程中使用）
 if __name__ == '__main__':
-    target_files = {'adblock.txt', 'allow.txt', 'clash.txt', 'shadowrocket.txt'}
-    process_rule_files(target_files, Path('./'))
\ No newline at end of file
+    main()
@@ -1,10 +1,14 @@
+import os
 import re
 import logging
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List, Tuple, Set, Optional
 from datetime import datetime
 import pytz
 
+from fingerprint import FingerprintTable, fingerprint
+
 # 配置日志系统
 logging.basicConfig(
     level=logging.INFO,
@@ -13,6 +17,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 重复行检测使用64位指纹表（EASYADS_VALIDATE_FINGERPRINT=1），不保存行内容，适合超大文件
+FINGERPRINT_DEDUP = os.environ.get("EASYADS_VALIDATE_FINGERPRINT", "0") == "1"
+MAX_DUPLICATE_EXAMPLES = 5
+
 class RuleValidator:
     """规则验证器，用于检查各类规则文件的格式有效性"""
     
@@ -70,13 +78,17 @@ class RuleValidator:
         ]
     }
 
-    def __init__(self, root_dir: Path = Path(".")):
+    _matchers: Dict[str, re.Pattern] = {}  # 文件名 -> 编译后的交替表达式
+
+    def __init__(self, root_dir: Path = Path("."), fingerprint_dedup: bool = FINGERPRINT_DEDUP):
         """
         初始化规则验证器
         
         :param root_dir: 规则文件所在的根目录
+        :param fingerprint_dedup: 用64位指纹表统计重复行（低内存），否则保存完整行
         """
         self.root_dir = root_dir
+        self.fingerprint_dedup = fingerprint_dedup
         self.results: Dict[str, Dict] = {}  # 存储验证结果
 
     def get_beijing_time(self) -> str:
@@ -91,6 +103,20 @@ class RuleValidator:
                 return patterns
         return []
 
+    @classmethod
+    def _get_matcher(cls, filename: str, patterns: List[Tuple[str, str]]) -> re.Pattern:
+        """
+        把文件的全部验证模式编译成一个带命名分组的交替表达式（按文件缓存）
+
+        各分支按原顺序排列，一次match即可得到命中的第一个规则类型（m.lastgroup）
+        """
+        matcher = cls._matchers.get(filename)
+        if matcher is None:
+            matcher = re.compile('|'.join(
+                f'(?P<r{i}>{pattern})' for i, (_, pattern) in enumerate(patterns)))
+            cls._matchers[filename] = matcher
+        return matcher
+
     def validate_file(self, filename: str) -> Dict:
         """
         验证单个规则文件
@@ -119,6 +145,10 @@ class RuleValidator:
         invalid_lines: List[Tuple[int, str]] = []
         seen_lines: Set[str] = set()
         duplicate_lines: Set[str] = set()
+        seen_fps = FingerprintTable() if self.fingerprint_dedup else None
+        candidates: Dict[str, int] = {}  # 指纹模式下待确认的重复行示例 -> 首次出现的行号
+        matcher = self._get_matcher(filename, patterns)
+        names = {f"r{i}": name for i, (name, _) in enumerate(patterns)}
 
         try:
             with file_path.open('r', encoding='utf-8', errors='ignore') as f:
@@ -128,29 +158,34 @@ class RuleValidator:
                         continue
                         
                     counts["total"] += 1
-                    is_valid = False
                     
                     # 检查是否为重复行
-                    if line in seen_lines:
+                    if seen_fps is not None:
+                        first = seen_fps.add(fingerprint(line), line_num)
+                        if first >= 0:
+                            counts["duplicates"] += 1
+                            if len(candidates) < MAX_DUPLICATE_EXAMPLES * 4 and line not in candidates:
+                                candidates[line] = first
+                    elif line in seen_lines:
                         duplicate_lines.add(line)
                         counts["duplicates"] += 1
                     else:
                         seen_lines.add(line)
                     
-                    # 验证规则类型
-                    for name, pattern in patterns:
-                        if re.match(pattern, line):
-                            counts["valid"] += 1
-                            counts["rule_types"][name] += 1
-                            is_valid = True
-                            break
-                    
-                    if not is_valid:
+                    # 验证规则类型（单次匹配，命中的分支即规则类型）
+                    match = matcher.match(line)
+                    if match:
+                        counts["valid"] += 1
+                        counts["rule_types"][names[match.lastgroup]] += 1
+                    else:
                         counts["invalid"] += 1
-                        invalid_lines.append((line_num, line))
-                        if len(invalid_lines) <= 10:  # 只记录前10条无效行
+                        if len(invalid_lines) < 10:  # 只记录前10条无效行
+                            invalid_lines.append((line_num, line))
                             logger.debug(f"无效行 {filename}:{line_num} - {line}")
 
+            if seen_fps is not None:
+                duplicate_lines = self._confirm_duplicates(file_path, candidates)
+
             # 生成验证结果
             result = {
                 "valid": counts["invalid"] == 0,
@@ -158,11 +193,11 @@ class RuleValidator:
                 "timestamp": self.get_beijing_time(),
                 "counts": counts,
                 "top_invalid": invalid_lines[:10],  # 只保留前10条无效行
-                "duplicate_examples": list(duplicate_lines)[:5]  # 只保留前5条重复行示例
+                "duplicate_examples": list(duplicate_lines)[:MAX_DUPLICATE_EXAMPLES]  # 只保留前5条重复行示例
             }
             
             self.results[filename] = result
-            self._log_validation_result(filename, counts, len(invalid_lines))
+            self._log_validation_result(filename, counts, counts["invalid"])
             return result
             
         except Exception as e:
@@ -170,6 +205,24 @@ class RuleValidator:
             logger.error(error_msg, exc_info=True)
             return {"valid": False, "error": error_msg, "counts": {}}
 
+    @staticmethod
+    def _confirm_duplicates(file_path: Path, candidates: Dict[str, int]) -> List[str]:
+        """回读首次出现的行，排除指纹碰撞，返回确认为重复的示例行"""
+        if not candidates:
+            return []
+        wanted: Dict[int, List[str]] = {}
+        for line, line_num in candidates.items():
+            wanted.setdefault(line_num, []).append(line)
+        last = max(wanted)
+        confirmed = []
+        with file_path.open('r', encoding='utf-8', errors='ignore') as f:
+            for line_num, line in enumerate(f, 1):
+                if line_num in wanted:
+                    confirmed.extend(c for c in wanted[line_num] if c == line.strip())
+                if line_num >= last or len(confirmed) >= MAX_DUPLICATE_EXAMPLES:
+                    break
+        return confirmed
+
     def _log_validation_result(self, filename: str, counts: Dict, invalid_count: int) -> None:
         """记录验证结果日志"""
         if counts["invalid"] == 0 and counts["duplicates"] == 0:
@@ -187,11 +240,27 @@ class RuleValidator:
                 f"重复规则: {counts['duplicates']}"
             )
 
-    def validate_all_files(self) -> Dict[str, Dict]:
-        """验证所有支持的规则文件"""
+    def validate_all_files(self, max_workers: Optional[int] = None) -> Dict[str, Dict]:
+        """
+        验证所有支持的规则文件（多进程并行，结果按文件顺序合并）
+
+        :param max_workers: 进程数，默认取CPU核数与文件数的较小值；为1时在当前进程内顺序执行
+        """
         logger.info("开始批量验证所有规则文件...")
-        for filename in self.RULE_PATTERNS.keys():
-            self.validate_file(filename)
+        filenames = list(self.RULE_PATTERNS.keys())
+        workers = max_workers or min(len(filenames), os.cpu_count() or 1)
+        if workers <= 1:
+            for filename in filenames:
+                self.validate_file(filename)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_validate_one, self.root_dir, filename, self.fingerprint_dedup)
+                           for filename in filenames]
+                for filename, future in zip(filenames, futures):
+                    result = future.result()
+                    # 与顺序执行一致：只有成功完成验证的文件才计入结果
+                    if "error" not in result:
+                        self.results[filename] = result
         
         # 生成汇总报告
         summary = {
@@ -275,6 +344,10 @@ class RuleValidator:
         except Exception as e:
             logger.error(f"导出报告失败: {str(e)}", exc_info=True)
 
+def _validate_one(root_dir: Path, filename: str, fingerprint_dedup: bool) -> Dict:
+    """进程池任务：在子进程中验证单个文件"""
+    return RuleValidator(root_dir=root_dir, fingerprint_dedup=fingerprint_dedup).validate_file(filename)
+
 def main():
     """主函数：执行规则验证流程"""
     try:
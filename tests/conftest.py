@@ -0,0 +1,88 @@
+# EasyAds/tests/conftest.py
+"""测试公共设置：把脚本目录加入 sys.path，并提供本地HTTP服务"""
+import sys
+import threading
+from pathlib import Path
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+for script_dir in ("data/python/utils", "data/python/rules_generator"):
+    sys.path.insert(0, str(ROOT_DIR / script_dir))
+
+def send(request: BaseHTTPRequestHandler, body: bytes, status: int = 200,
+         headers: Optional[Dict[str, str]] = None) -> None:
+    """写出完整响应"""
+    request.send_response(status)
+    for key, value in (headers or {}).items():
+        request.send_header(key, value)
+    request.send_header("Content-Length", str(len(body)))
+    request.end_headers()
+    request.wfile.write(body)
+
+class LocalServer:
+    """
+    本地HTTP服务（独立线程）
+
+    routes 为 路径 -> 处理函数(request) 的映射，处理函数负责写出响应；
+    hits 记录每个路径的请求次数，headers 记录每个路径最后一次请求的请求头
+    """
+
+    def __init__(self, routes: Dict[str, Callable[[BaseHTTPRequestHandler], None]]):
+        self.routes = routes
+        self.hits: Counter = Counter()
+        self.headers: Dict[str, Dict[str, str]] = {}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.hits[self.path] += 1
+                server.headers[self.path] = dict(self.headers)
+                route = server.routes.get(self.path)
+                if route is None:
+                    send(self, b"not found", 404)
+                    return
+                try:
+                    route(self)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # 客户端已取消
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}{path}"
+
+    def close(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture(autouse=True)
+def isolated_manifest(tmp_path, monkeypatch):
+    """open_output 记录的 manifest.json 写入临时目录，不改动仓库根目录"""
+    import common
+    monkeypatch.setattr(common, "MANIFEST_PATH", tmp_path / "manifest.json")
+    monkeypatch.setattr(common, "MANIFEST_LOCK", tmp_path / "manifest.lock")
+
+@pytest.fixture
+def http_server():
+    """启动本地HTTP服务：http_server(routes) -> LocalServer，测试结束时全部关闭"""
+    servers = []
+
+    def start(routes):
+        server = LocalServer(routes)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
@@ -0,0 +1,203 @@
+# EasyAds/tests/test_dl.py
+"""dl.py 下载器：重试、传输压缩与 rulesNN/allowNN 输出约定（本地HTTP服务）"""
+import gzip
+import threading
+
+import brotli
+import pytest
+
+import dl
+from conftest import send
+
+BODY = b"||ads.example.com^\n||track.example.net^\n@@||ok.example.org^\n"
+
+@pytest.fixture
+def downloader(tmp_path, monkeypatch):
+    """隔离的临时目录与缓存，关闭重试退避，返回新建的会话"""
+    monkeypatch.setattr(dl, "TMP_DIR", tmp_path / "tmp")
+    monkeypatch.setattr(dl, "CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(dl, "RETRY_DELAY", 0)
+    dl.TMP_DIR.mkdir()
+    session = dl.create_session()
+    yield session
+    session.close()
+
+def flaky(failures: int, body: bytes = BODY):
+    """前 failures 次请求返回503，之后返回正文"""
+    state = {"count": 0}
+
+    def route(request):
+        state["count"] += 1
+        if state["count"] <= failures:
+            send(request, b"busy", 503)
+        else:
+            send(request, body, headers={"Content-Type": "text/plain"})
+    return route
+
+def test_retries_server_errors(downloader, http_server):
+    server = http_server({"/flaky.txt": flaky(2)})
+    save_path = dl.TMP_DIR / "rules02.txt"
+
+    assert dl.download_url(server.url("/flaky.txt"), save_path, downloader)
+    assert server.hits["/flaky.txt"] == 3
+    assert save_path.read_bytes() == BODY
+
+def test_gives_up_after_retries(downloader, http_server):
+    server = http_server({"/down.txt": flaky(dl.RETRY + 1)})
+    save_path = dl.TMP_DIR / "rules02.txt"
+
+    assert not dl.download_url(server.url("/down.txt"), save_path, downloader)
+    assert server.hits["/down.txt"] == dl.RETRY + 1
+    assert not save_path.exists()
+
+@pytest.mark.parametrize("encoding, compress", [("gzip", gzip.compress), ("br", brotli.compress)])
+def test_transfer_encoding(downloader, http_server, encoding, compress):
+    server = http_server({
+        "/packed.txt": lambda request: send(request, compress(BODY), headers={"Content-Encoding": encoding}),
+    })
+    save_path = dl.TMP_DIR / "rules02.txt"
+
+    assert dl.download_url(server.url("/packed.txt"), save_path, downloader)
+    assert encoding in server.headers["/packed.txt"]["Accept-Encoding"]
+    assert save_path.read_bytes() == BODY
+
+def test_conditional_request_reuses_cache(downloader, http_server):
+    def route(request):
+        if request.headers.get("If-None-Match") == '"v1"':
+            send(request, b"", 304)
+        else:
+            send(request, BODY, headers={"ETag": '"v1"'})
+    server = http_server({"/etag.txt": route})
+    first, second = dl.TMP_DIR / "rules02.txt", dl.TMP_DIR / "rules03.txt"
+
+    assert dl.download_url(server.url("/etag.txt"), first, downloader)
+    assert dl.download_url(server.url("/etag.txt"), second, downloader)
+    assert server.headers["/etag.txt"]["If-None-Match"] == '"v1"'
+    assert second.read_bytes() == BODY
+
+def test_output_file_contract(downloader, http_server):
+    """第i个URL（从2开始，空字符串占位）保存为 rulesNN.txt / allowNN.txt，重复URL只下载一次"""
+    routes = {f"/{name}.txt": (lambda body: lambda request: send(request, body))(f"||{name}.com^\n".encode())
+              for name in ("a", "b", "shared", "c")}
+    server = http_server(routes)
+    url = lambda name: server.url(f"/{name}.txt")  # noqa: E731
+
+    ok, failed = dl.download_rules(
+        rules_urls=[url("a"), "", url("b"), url("shared"), url("missing")],
+        allow_urls=[url("shared"), url("c")],
+        session=downloader,
+    )
+
+    assert (ok, failed) == (5, 1)
+    assert sorted(path.name for path in dl.TMP_DIR.glob("*.txt")) == [
+        "allow02.txt", "allow03.txt", "rules02.txt", "rules04.txt", "rules05.txt"]
+    assert (dl.TMP_DIR / "rules04.txt").read_text() == "||b.com^\n"
+    assert (dl.TMP_DIR / "rules05.txt").read_bytes() == (dl.TMP_DIR / "allow02.txt").read_bytes()
+    assert server.hits["/shared.txt"] == 1
+
+def stalled(sent: bytes, release: threading.Event):
+    """发出响应头和部分正文（sent为空时连响应头都不发）后一直等待 release"""
+    def route(request):
+        if sent:
+            request.send_response(200)
+            request.send_header("Content-Length", str(len(sent) * 2))
+            request.end_headers()
+            request.wfile.write(sent)
+            request.wfile.flush()
+        release.wait(10)
+    return route
+
+# 源站在首字节前卡住 / 传输正文途中卡住；后者对冲延迟更长，确保落败方已写出临时文件
+@pytest.mark.parametrize("sent, delay", [(b"", 0.2), (b"x" * (2 * dl.CHUNK_SIZE), 1.0)],
+                         ids=["first-byte", "mid-body"])
+def test_hedge_fast_mirror_wins(downloader, http_server, monkeypatch, sent, delay):
+    """源站卡住时镜像胜出：落败请求的临时文件被删除，主机并发名额立即归还"""
+    monkeypatch.setattr(dl, "HEDGE_DELAY", delay)
+    monkeypatch.setattr(dl, "_host_slots", {})
+    release = threading.Event()
+    slow = http_server({"/rules.txt": stalled(sent, release)})
+    fast = http_server({"/rules.txt": lambda request: send(request, BODY)})
+    origin, mirror = slow.url("/rules.txt"), fast.url("/rules.txt")
+    raw_path = dl.TMP_DIR / "rules02.raw"
+    hedge_session = dl.create_session(retries=0)
+    try:
+        source, (status, _, _, size) = dl.hedged_fetch(origin, raw_path, downloader, {}, [mirror],
+                                                       hedge_session=hedge_session)
+
+        assert (source, status, size) == (mirror, 200, len(BODY))
+        assert raw_path.read_bytes() == BODY
+        assert list(dl.TMP_DIR.iterdir()) == [raw_path]
+        # 源站请求仍卡在读取中，名额已全部可用
+        slot = dl.host_slot(origin)
+        assert all(slot.acquire(blocking=False) for _ in range(dl.HOST_CONCURRENCY))
+    finally:
+        release.set()
+        hedge_session.close()
+
+def test_hedge_retries_transient_origin_failures(downloader, http_server, monkeypatch):
+    """源站先失败两次、镜像也不可用时按轮重试，第三轮从源站成功"""
+    monkeypatch.setattr(dl, "HEDGE_DELAY", 0.2)
+    origin = http_server({"/rules.txt": flaky(2)})
+    mirror = http_server({"/rules.txt": lambda request: send(request, b"busy", 503)})
+    raw_path = dl.TMP_DIR / "rules02.raw"
+    hedge_session = dl.create_session(retries=0)
+    try:
+        source, (status, _, _, size) = dl.hedged_fetch(origin.url("/rules.txt"), raw_path, downloader, {},
+                                                       [mirror.url("/rules.txt")], hedge_session=hedge_session)
+    finally:
+        hedge_session.close()
+
+    assert (source, status, size) == (origin.url("/rules.txt"), 200, len(BODY))
+    assert raw_path.read_bytes() == BODY
+    assert origin.hits["/rules.txt"] == 3
+    assert mirror.hits["/rules.txt"] == 2
+
+def test_hedge_does_not_retry_client_errors(downloader, http_server, monkeypatch):
+    monkeypatch.setattr(dl, "HEDGE_DELAY", 0.2)
+    origin = http_server({})
+    mirror = http_server({})
+    hedge_session = dl.create_session(retries=0)
+    try:
+        _, (status, _, _, _) = dl.hedged_fetch(origin.url("/gone.txt"), dl.TMP_DIR / "rules02.raw", downloader,
+                                               {}, [mirror.url("/gone.txt")], hedge_session=hedge_session)
+    finally:
+        hedge_session.close()
+
+    assert status == 404
+    assert origin.hits["/gone.txt"] == 1
+
+def test_mirror_urls(monkeypatch):
+    """ghproxy需显式配置，gitee没有镜像"""
+    url = "https://raw.githubusercontent.com/owner/repo/main/rules.txt"
+    monkeypatch.setattr(dl, "GHPROXY", "")
+    assert dl.mirror_urls(url) == ["https://cdn.jsdelivr.net/gh/owner/repo@main/rules.txt"]
+    monkeypatch.setattr(dl, "GHPROXY", "https://proxy.example/")
+    assert dl.mirror_urls(url)[1] == f"https://proxy.example/{url}"
+    assert dl.mirror_urls("https://gitee.com/zjqz/ad-guard-home-dns/raw/master/black-list") == []
+
+def test_source_shard_external_sort(downloader, monkeypatch):
+    """外部排序模式下逐个规则源解析同样分段写盘，输出与内存模式逐字节一致"""
+    import io
+    import extsort
+    source = dl.TMP_DIR / "rules02.txt"
+    rules = [f"||ad{i % 700}.example.com^" for i in range(2000)]
+    rules += [f"@@||ok{i}.example.org^" for i in range(50)] + ["0.0.0.0 hosts.example.net", "! comment"]
+    source.write_text("\n".join(reversed(rules)) + "\n", encoding="utf-8")
+
+    def build():
+        outputs = {stream: io.StringIO() for stream in ("hosts", "block", "allow")}
+        counts = dl.build_source_shard(source, outputs)
+        return counts, {stream: out.getvalue() for stream, out in outputs.items()}
+
+    expected = build()
+    spilled = []
+
+    class SpillingSorter(extsort.ExternalSorter):
+        def close(self):
+            spilled.append(len(self.runs))
+            super().close()
+
+    monkeypatch.setattr(dl, "make_sorter", lambda tmp_dir: SpillingSorter(tmp_dir, memory_mb=0))
+    assert build() == expected
+    assert max(spilled) > 1
+    assert expected[1]["block"].count("||ad") == 700
@@ -0,0 +1,54 @@
+# EasyAds/tests/test_mihomo.py
+"""mihomo.py / succinct.py：MRS输出与 mihomo convert-ruleset domain text 逐字节一致"""
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+import zstandard
+
+import mihomo
+import succinct
+from conftest import FIXTURES_DIR, ROOT_DIR
+
+# 基线提交中由旧版工作流调用 mihomo convert-ruleset 生成的 adb.mrs 及其输入
+BASELINE_MRS = "115641cd43aa3501dd678e63f1ff3e9af3fbd3e9"
+BASELINE_INPUT = "29274a02f63778d26d499cbbd46ba06ffe8d3673"
+
+def payload(path: Path) -> bytes:
+    with open(path, "rb") as f:
+        return zstandard.ZstdDecompressor().stream_reader(f).read()
+
+def test_matches_fixture(tmp_path):
+    output = tmp_path / "adb.mrs"
+    assert mihomo.write_mrs(FIXTURES_DIR / "mihomo-small.txt", output)
+    assert payload(output) == payload(FIXTURES_DIR / "mihomo-small.mrs")
+
+def test_succinct_round_trip():
+    keys, count = mihomo.load_domain_rules(FIXTURES_DIR / "mihomo-small.txt")
+    assert count == 2
+    assert succinct.keys(succinct.build(keys)) == [b"moc.da", b"moc.da.+", b"nc.x"]
+
+@pytest.mark.skipif(shutil.which("mihomo") is None, reason="mihomo 不在 PATH 中")
+def test_matches_mihomo_tool(tmp_path):
+    expected, output = tmp_path / "tool.mrs", tmp_path / "adb.mrs"
+    subprocess.run(["mihomo", "convert-ruleset", "domain", "text",
+                    str(FIXTURES_DIR / "mihomo-small.txt"), str(expected)], check=True)
+    assert mihomo.write_mrs(FIXTURES_DIR / "mihomo-small.txt", output)
+    assert payload(output) == payload(expected)
+
+def git_blob(blob: str, path: Path) -> bool:
+    with open(path, "wb") as f:
+        result = subprocess.run(["git", "-C", str(ROOT_DIR), "cat-file", "blob", blob],
+                                stdout=f, stderr=subprocess.DEVNULL)
+    return result.returncode == 0
+
+def test_matches_baseline_tool_output(tmp_path):
+    """完整规则集：与基线提交中工具生成的 adb.mrs 一致（浅克隆中缺少该对象时跳过）"""
+    source, expected = tmp_path / "adblock-filtered.txt", tmp_path / "baseline.mrs"
+    if shutil.which("git") is None or not (git_blob(BASELINE_INPUT, source) and git_blob(BASELINE_MRS, expected)):
+        pytest.skip("仓库历史中没有基线 adb.mrs")
+    rules, output = tmp_path / "rules.txt", tmp_path / "adb.mrs"
+    assert mihomo.process_adguard_rules(source, rules)
+    assert mihomo.write_mrs(rules, output)
+    assert payload(output) == payload(expected)
@@ -0,0 +1,70 @@
+# EasyAds/tests/test_rule_ir.py
+"""IR新鲜度与精确匹配格式的完整域名集合：输出不应取决于走IR还是文本回退"""
+from pathlib import Path
+
+import pytest
+
+import rule_ir
+import title
+import domain_emitter
+
+# merge.py 裁剪后的 adblock.txt：sub.ads.example.com 已被 ||ads.example.com^ 覆盖
+ADBLOCK = "||ads.example.com^\n||track.example.net^\n"
+RECORDS = [
+    ("ads.example.com", rule_ir.KIND_DOMAIN, 0, ""),
+    ("sub.ads.example.com", rule_ir.KIND_DOMAIN, rule_ir.FLAG_REDUNDANT, ""),
+    ("track.example.net", rule_ir.KIND_DOMAIN, 0, ""),
+]
+
+@pytest.fixture
+def build(tmp_path, monkeypatch):
+    """在临时目录中模拟 merge.py 的输出：adblock.txt 与 tmp/adblock.ir"""
+    monkeypatch.chdir(tmp_path)
+    Path("adblock.txt").write_text(ADBLOCK, encoding="utf-8")
+    rule_ir.write_ir(RECORDS, domain_emitter.IR_PATH, source_path=Path("adblock.txt"))
+    return tmp_path
+
+def hosts_entries() -> list:
+    domain_emitter.emit_rules(formats=["hosts"])
+    lines = Path("hosts.txt").read_text(encoding="utf-8").splitlines()
+    return [line for line in lines if line and not line.startswith("#")]
+
+def test_ir_survives_header_rewrite(build):
+    before = hosts_entries()
+    title.process_rule_files({"adblock.txt"}, Path("."))
+    assert Path("adblock.txt").read_text(encoding="utf-8").startswith("[Adblock Plus 2.0]")
+
+    ruleset = rule_ir.load_fresh(domain_emitter.IR_PATH, Path("adblock.txt"))
+    assert ruleset is not None
+    ruleset.close()
+    assert hosts_entries() == before == [
+        "0.0.0.0 ads.example.com", "0.0.0.0 sub.ads.example.com", "0.0.0.0 track.example.net"]
+
+def test_ir_rejected_when_rules_change(build):
+    with open("adblock.txt", "a", encoding="utf-8") as f:
+        f.write("||new.example.org^\n")
+    assert rule_ir.load_fresh(domain_emitter.IR_PATH, Path("adblock.txt")) is None
+
+def test_exact_formats_fail_without_ir(build, monkeypatch):
+    monkeypatch.setattr(domain_emitter, "PRUNE_SUBDOMAINS", True)
+    domain_emitter.IR_PATH.unlink()
+    with pytest.raises(RuntimeError):
+        domain_emitter.emit_rules(formats=["hosts"])
+    assert not Path("hosts.txt").exists()
+
+    # 后缀匹配格式本就跳过被覆盖的子域名，可以从裁剪后的文本生成
+    domain_emitter.emit_rules(formats=["shadowrocket"])
+    assert "DOMAIN-SUFFIX,track.example.net,Reject" in Path("Shadowrocket.conf").read_text(encoding="utf-8")
+
+def test_domain_list_keeps_covered_subdomains(build, monkeypatch):
+    import domain_list
+    Path("dns.txt").write_text(ADBLOCK, encoding="utf-8")
+    domain_list.extract_domains(Path("dns.txt"), Path("domain_list.txt"))
+    lines = Path("domain_list.txt").read_text(encoding="utf-8").splitlines()
+    assert [line for line in lines if line and not line.startswith("#")] == [
+        "ads.example.com", "sub.ads.example.com", "track.example.net"]
+
+    monkeypatch.setattr(domain_list, "PRUNE_SUBDOMAINS", True)
+    domain_emitter.IR_PATH.unlink()
+    with pytest.raises(RuntimeError):
+        domain_list.extract_domains(Path("dns.txt"), Path("domain_list.txt"))
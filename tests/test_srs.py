@@ -0,0 +1,48 @@
+# EasyAds/tests/test_srs.py
+"""srs.py：二进制规则集与 sing-box rule-set compile 逐字节一致，并可回读"""
+import json
+import shutil
+import subprocess
+import zlib
+from pathlib import Path
+
+import pytest
+
+import srs
+from conftest import FIXTURES_DIR
+
+SOURCE = FIXTURES_DIR / "singbox-small.json"
+
+def split(path: Path):
+    """(文件头, 解压后的规则数据)"""
+    data = path.read_bytes()
+    return data[:4], zlib.decompress(data[4:])
+
+def write_fixture_rules(output: Path) -> None:
+    rule = json.loads(SOURCE.read_text(encoding="utf-8"))["rules"][0]
+    srs.write_srs(output, domain_suffix=rule["domain_suffix"], domain=rule["domain"])
+
+def test_matches_fixture(tmp_path):
+    output = tmp_path / "Singbox.srs"
+    write_fixture_rules(output)
+    assert split(output) == split(FIXTURES_DIR / "singbox-small.srs")
+
+def test_round_trip(tmp_path):
+    assert srs.read_srs(FIXTURES_DIR / "singbox-small.srs") == json.loads(SOURCE.read_text(encoding="utf-8"))["rules"]
+
+    output = tmp_path / "Singbox.json"
+    srs.write_source(output, domain_suffix=["ad.com"], domain=["x.cn"])
+    assert json.loads(output.read_text(encoding="utf-8")) == json.loads(SOURCE.read_text(encoding="utf-8"))
+
+def test_empty_rule_set(tmp_path):
+    output = tmp_path / "Singbox.srs"
+    srs.write_srs(output)
+    assert split(output) == (b"SRS\x01", b"\x00")
+    assert srs.read_srs(output) == []
+
+@pytest.mark.skipif(shutil.which("sing-box") is None, reason="sing-box 不在 PATH 中")
+def test_matches_sing_box_tool(tmp_path):
+    expected, output = tmp_path / "tool.srs", tmp_path / "Singbox.srs"
+    subprocess.run(["sing-box", "rule-set", "compile", "--output", str(expected), str(SOURCE)], check=True)
+    write_fixture_rules(output)
+    assert split(output) == split(expected)